@@ -1,10 +1,10 @@
 from hashlib import sha256
 from uuid import uuid4
 from flask import Flask
-from flask_session import Session
 from flask_cors import CORS
 from prisma import Prisma
 from pusher import Pusher
+import atexit
 import logging
 import os
 
@@ -15,23 +15,82 @@ from blueprints.search import search_tutor
 from blueprints.appointment import appointment
 from blueprints.appointments import appointments
 from blueprints.admin import admin
-from blueprints.document import document
+from blueprints.document import (
+    document,
+    collect_expired_uploads,
+    collect_unreferenced_blobs,
+)
 from blueprints.direct_message import direct_message
 from blueprints.tutorial import tutorial
 from blueprints.notifications import notifications
 from blueprints.utils import utils
+from blueprints.webhooks import webhooks
+from helpers.blob_store import BlobCollector, FileSystemBlobStore, S3BlobStore
+from helpers.maintenance import Maintenance
 from helpers.my_request import MyRequest
+from helpers.tutor_search_index import TutorSearchIndex
+from helpers.profile_cache import ProfileCache, RedisProfileStore
+from helpers.ttl_cache import TTLCache
+from helpers.upload_staging import UploadStaging
+from helpers.session_store import (
+    MemorySessionStore,
+    PostgresSessionStore,
+    RedisSessionStore,
+    ServerSessionInterface,
+)
+from helpers.realtime import InMemoryTransport, PusherTransport, RealtimeOutbox
+from helpers.notification_hub import NotificationHub, PostgresFanout
 
 
 Flask.request_class = MyRequest
 app = Flask(__name__)
 app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", default="secret")
-app.config["SESSION_TYPE"] = "filesystem"
 app.config["SESSION_COOKIE_SAMESITE"] = "None"
 app.config["SESSION_COOKIE_SECURE"] = True
+# Whether session cookies expire after PERMANENT_SESSION_LIFETIME, rather than
+# when the browser closes
+app.config["SESSION_PERMANENT"] = (
+    os.getenv("SESSION_PERMANENT", default="true").lower() == "true"
+)
+# Seconds after which notification streams end (and clients reconnect)
+app.config["NOTIFICATION_STREAM_TIMEOUT"] = float(
+    os.getenv("NOTIFICATION_STREAM_TIMEOUT", default=60)
+)
+# Seconds after which occupancy recorded from webhooks is checked with pusher,
+# bounding how long a missed channel_vacated webhook holds back notifications
+app.config["CHANNEL_OCCUPANCY_MAX_AGE"] = float(
+    os.getenv("CHANNEL_OCCUPANCY_MAX_AGE", default=60)
+)
+# Largest document, in bytes, which can be uploaded as a file
+app.config["DOCUMENT_MAX_SIZE"] = int(
+    os.getenv("DOCUMENT_MAX_SIZE", default=50 * 1024 * 1024)
+)
+# Size, in bytes, of the chunks of resumable uploads (see /document/uploads)
+app.config["UPLOAD_CHUNK_SIZE"] = int(
+    os.getenv("UPLOAD_CHUNK_SIZE", default=5 * 1024 * 1024)
+)
+# Seconds within which a resumable upload has to be committed
+app.config["UPLOAD_SESSION_TTL"] = float(
+    os.getenv("UPLOAD_SESSION_TTL", default=24 * 60 * 60)
+)
+# Seconds between clearing out expired resumable uploads
+app.config["UPLOAD_GC_INTERVAL"] = float(os.getenv("UPLOAD_GC_INTERVAL", default=600))
+# Update a user's pending notification about a conversation with each message
+# sent in it, rather than creating a notification per message
+app.config["NOTIFICATION_COALESCING"] = (
+    os.getenv("NOTIFICATION_COALESCING", default="false").lower() == "true"
+)
+# Cache-Control of responses which are the same whoever requests them e.g.
+# profiles, every one has an ETag so no-cache still saves sending them again
+app.config["PUBLIC_CACHE_CONTROL"] = os.getenv(
+    "PUBLIC_CACHE_CONTROL", default="public, no-cache"
+)
+# Serve /searchtutor from an in memory index instead of querying the db
+app.config["TUTOR_SEARCH_INDEX"] = (
+    os.getenv("TUTOR_SEARCH_INDEX", default="false").lower() == "true"
+)
 
 # Extensions
-server_session = Session(app)
 cors = CORS(app, supports_credentials=True)
 
 # We'll just say these external clients are 'extensions' of flask
@@ -47,6 +106,117 @@ app.extensions["pusher"] = Pusher(
     secret=os.getenv("PUSHER_SECRET"),
     cluster=os.getenv("PUSHER_CLUSTER"),
 )
+# Realtime events are delivered by background workers, see helpers/realtime.py
+# REALTIME_TRANSPORT=memory records them instead, e.g. for benchmarks
+app.extensions["realtime"] = RealtimeOutbox(
+    transport=(
+        InMemoryTransport()
+        if os.getenv("REALTIME_TRANSPORT", default="pusher") == "memory"
+        else PusherTransport(app.extensions["pusher"])
+    ),
+    workers=int(os.getenv("REALTIME_WORKERS", default=2)),
+)
+atexit.register(app.extensions["realtime"].flush, timeout=5)
+# Whether channels are occupied, see helpers/occupancy.py
+app.extensions["channel_occupancy_cache"] = TTLCache(
+    maxsize=int(os.getenv("CHANNEL_OCCUPANCY_CACHE_SIZE", default=4096)),
+    ttl=float(os.getenv("CHANNEL_OCCUPANCY_CACHE_TTL", default=5)),
+)
+# New notifications for /notifications/stream, see helpers/notification_hub.py
+# NOTIFICATION_FANOUT=postgres relays them between workers (requires psycopg),
+# otherwise a stream only hears about notifications created by its own worker
+app.extensions["notification_hub"] = NotificationHub(
+    # streams open per worker, kept below gunicorn's threads (see gunicorn.conf.py)
+    max_streams=int(os.getenv("NOTIFICATION_STREAM_LIMIT", default=4))
+)
+if os.getenv("NOTIFICATION_FANOUT", default="local") == "postgres":
+    app.extensions["notification_hub"].fanout = PostgresFanout(
+        app.extensions["notification_hub"], prisma, os.getenv("DATABASE_URL")
+    )
+# Document content, see helpers/blob_store.py
+# BLOB_STORE=s3 stores it in an S3 (compatible) bucket (requires boto3)
+if os.getenv("BLOB_STORE", default="filesystem") == "s3":
+    app.extensions["blob_store"] = S3BlobStore(
+        bucket=os.getenv("BLOB_STORE_BUCKET"),
+        prefix=os.getenv("BLOB_STORE_PREFIX", default="blobs/"),
+        endpoint_url=os.getenv("BLOB_STORE_ENDPOINT_URL"),
+        # seconds that download urls are valid for
+        url_expiry=int(os.getenv("BLOB_STORE_URL_EXPIRY", default=300)),
+    )
+else:
+    app.extensions["blob_store"] = FileSystemBlobStore(
+        os.getenv("BLOB_STORE_PATH", default="blobs")
+    )
+# Deletes the blobs no document refers to, see helpers/blob_store.py
+app.extensions["blob_collector"] = BlobCollector(
+    # seconds after last being stored before a blob can be deleted
+    grace=float(os.getenv("BLOB_GC_GRACE", default=60 * 60)),
+)
+# Housekeeping jobs, run off the request path by one worker per host, see
+# helpers/maintenance.py. Started once every job has been added.
+app.extensions["maintenance"] = Maintenance(
+    app, os.getenv("MAINTENANCE_LOCK_PATH", default="maintenance.lock")
+)
+app.extensions["maintenance"].add_job(
+    "collect_unreferenced_blobs",
+    # seconds between each collection
+    float(os.getenv("BLOB_GC_INTERVAL", default=60 * 60)),
+    collect_unreferenced_blobs,
+)
+# Sessions, see helpers/session_store.py
+# SESSION_STORE=redis stores them in a redis (protocol) server (requires redis)
+# SESSION_STORE=memory keeps them in each worker, only for a single worker
+match os.getenv("SESSION_STORE", default="postgres"):
+    case "redis":
+        session_store = RedisSessionStore(os.getenv("SESSION_REDIS_URL"))
+    case "memory":
+        session_store = MemorySessionStore(
+            maxsize=int(os.getenv("SESSION_MEMORY_SIZE", default=10000)),
+            lifetime=app.permanent_session_lifetime,
+        )
+    case _:
+        session_store = PostgresSessionStore()
+app.session_interface = ServerSessionInterface(session_store)
+app.extensions["maintenance"].add_job(
+    "sweep_sessions",
+    # seconds between deleting expired sessions
+    float(os.getenv("SESSION_SWEEP_INTERVAL", default=600)),
+    session_store.sweep,
+)
+# Chunks of resumable uploads, until they're committed to the blob store
+app.extensions["upload_staging"] = UploadStaging(
+    os.getenv("UPLOAD_STAGING_PATH", default="uploads")
+)
+app.extensions["maintenance"].add_job(
+    "collect_expired_uploads",
+    app.config["UPLOAD_GC_INTERVAL"],
+    collect_expired_uploads,
+)
+# Tutor search index, only built if TUTOR_SEARCH_INDEX is enabled
+app.extensions["tutor_search_index"] = TutorSearchIndex(
+    max_age=float(os.getenv("TUTOR_SEARCH_INDEX_MAX_AGE", default=60))
+)
+# Account types of users, see helpers/check_user_account_type.py
+app.extensions["account_type_cache"] = TTLCache(
+    maxsize=int(os.getenv("ACCOUNT_TYPE_CACHE_SIZE", default=4096)),
+    ttl=float(os.getenv("ACCOUNT_TYPE_CACHE_TTL", default=300)),
+)
+# Public tutor profiles, see helpers/profile_cache.py
+# PROFILE_CACHE_REDIS_URL also shares them between workers (requires redis)
+app.extensions["profile_cache"] = ProfileCache(
+    TTLCache(
+        maxsize=int(os.getenv("PROFILE_CACHE_SIZE", default=1024)),
+        ttl=float(os.getenv("PROFILE_CACHE_TTL", default=300)),
+    ),
+    (
+        RedisProfileStore(
+            os.getenv("PROFILE_CACHE_REDIS_URL"),
+            ttl=float(os.getenv("PROFILE_CACHE_TTL", default=300)),
+        )
+        if os.getenv("PROFILE_CACHE_REDIS_URL")
+        else None
+    ),
+)
 
 # add a 'super admin' if one isn't already added
 if (
@@ -80,6 +250,11 @@ app.register_blueprint(notifications, url_prefix="/notifications")
 app.register_blueprint(document, url_prefix="/document")
 app.register_blueprint(direct_message, url_prefix="/directmessage")
 app.register_blueprint(tutorial, url_prefix="/tutorial")
+app.register_blueprint(webhooks, url_prefix="/webhooks")
+
+# MAINTENANCE=false leaves housekeeping to other processes e.g. in tests
+if os.getenv("MAINTENANCE", default="true").lower() == "true":
+    app.extensions["maintenance"].start()
 
 
 # default route
@@ -1,11 +1,11 @@
 import re
 from hashlib import sha256
 from uuid import uuid4
-from flask import Blueprint, jsonify, session
+from flask import Blueprint, current_app, jsonify, session
 from prisma.models import User, Tutor, Admin, Student
 from jsonschemas import user_search_schema, admin_create_schema
-from helpers.views import admin_view
-from helpers.check_user_account_type import check_type
+from helpers.check_user_account_type import check_type, session_account_type
+from helpers.profile_cache import ProfileCache
 from helpers.error_handlers import (
     validate_decorator,
     ExpectedError,
@@ -42,8 +42,7 @@ def user_search(args):
     if "user_id" not in session:
         raise ExpectedError("No user is logged in", 401)
 
-    admin = admin_view(id=session["user_id"])
-    if not admin:
+    if session_account_type() != "admin":
         raise ExpectedError("Insufficient permission to search for users", 403)
 
     if "id" in args:
@@ -131,8 +130,7 @@ def admin_create(args):
     if "user_id" not in session:
         raise ExpectedError("No user is logged in", 401)
 
-    admin = admin_view(id=session["user_id"])
-    if not admin:
+    if session_account_type() != "admin":
         raise ExpectedError(
             "Insufficient permission to create a new admin account", 403
         )
@@ -149,3 +147,30 @@ def admin_create(args):
     )
 
     return jsonify({"id": new_admin_id}), 200
+
+
+@admin.route("/cache", methods=["GET"])
+@error_decorator
+def cache_stats():
+    """Gets the statistics of the caches of the worker serving the request
+
+    Returns:
+        profiles (dict): of the tutor profile cache
+            - hits (int): The number of profiles served from the cache
+            - misses (int): The number of profiles which had to be built
+            - size (int): The number of profiles cached by the worker
+
+    Raises:
+        ExpectedError: If the user is not logged in
+        ExpectedError: If the user is not an admin
+
+    """
+    if "user_id" not in session:
+        raise ExpectedError("No user is logged in", 401)
+
+    if session_account_type() != "admin":
+        raise ExpectedError("Insufficient permission to view cache statistics", 403)
+
+    profile_cache: ProfileCache = current_app.extensions["profile_cache"]
+
+    return jsonify({"profiles": profile_cache.stats()}), 200
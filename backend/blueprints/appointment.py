@@ -1,5 +1,6 @@
+from collections import Counter
 from flask import Blueprint, jsonify, session, current_app
-from pusher import Pusher
+from prisma import Prisma
 from prisma.models import Appointment, Rating, Message, Notification
 from prisma.errors import RecordNotFoundError
 from jsonschemas import (
@@ -9,11 +10,27 @@ from jsonschemas import (
     appointment_message_schema,
     appointment_modify_schema,
     appointment_rating_schema,
+    batch_schema,
+    message_history_schema,
 )
 from helpers.process_time_block import process_time_block
+from helpers.parse_ids import parse_ids
+from helpers.create_notification import (
+    count_unread_notifications,
+    create_notification,
+    publish_notification,
+)
+from helpers.pagination import find_page_by_time, parse_page_args
+from helpers.availability import overlaps_any
+from helpers.rating_calc import lock_rating_aggregates, update_rating_aggregates
 from uuid import uuid4
 from datetime import datetime, timezone
 from helpers.views import student_view, tutor_view, user_view
+from helpers.profile_cache import tutor_changed
+from helpers.etag import etag_decorator
+from helpers import identity_map
+from helpers.realtime import RealtimeOutbox
+from helpers import occupancy
 from helpers.error_handlers import (
     validate_decorator,
     ExpectedError,
@@ -23,8 +40,49 @@ from helpers.error_handlers import (
 appointment = Blueprint("appointment", __name__)
 
 
+def appointment_json(appointment: Appointment) -> dict:
+    """Converts an appointment into what the appointment routes return, the
+    student and rating are only visible to those involved in the appointment
+
+    Args:
+        appointment (Appointment): the appointment, with its rating included
+
+    Returns:
+        (dict): the appointment
+
+    """
+    return_val = {
+        "id": appointment.id,
+        "startTime": appointment.startTime.isoformat(),
+        "endTime": appointment.endTime.isoformat(),
+        "tutorId": appointment.tutorId,
+        "tutorAccepted": appointment.tutorAccepted,
+    }
+
+    if "user_id" in session and (
+        appointment.tutorId == session["user_id"]
+        or appointment.studentId == session["user_id"]
+    ):
+        return_val["studentId"] = appointment.studentId
+
+    if "user_id" in session and appointment.studentId == session["user_id"]:
+        return_val["rating"] = appointment.rating.score if appointment.rating else None
+
+    return return_val
+
+
+def appointment_version(appointment_id: str) -> dict | None:
+    appointment = identity_map.find_unique(
+        Appointment, {"id": appointment_id}, {"rating": True}
+    )
+    # small enough that what's returned is its own version, which also differs
+    # by who's logged in
+    return appointment_json(appointment) if appointment is not None else None
+
+
 @appointment.route("/<appointment_id>", methods=["GET"])
 @error_decorator
+@etag_decorator(appointment_version, public=False)
 def get_appointment(appointment_id):
     """Get a pre-existing appointment given the id of the appointment
 
@@ -44,30 +102,45 @@ def get_appointment(appointment_id):
         ExpectedError: if the appointment id does not match an appointment
 
     """
-    appointment = Appointment.prisma().find_unique(
-        where={"id": appointment_id}, include={"rating": True}
+    appointment = identity_map.find_unique(
+        Appointment, {"id": appointment_id}, {"rating": True}
     )
     if appointment is None:
         raise ExpectedError("Given id does not correspond to an appointment", 404)
 
-    return_val = {
-        "id": appointment.id,
-        "startTime": appointment.startTime.isoformat(),
-        "endTime": appointment.endTime.isoformat(),
-        "tutorId": appointment.tutorId,
-        "tutorAccepted": appointment.tutorAccepted,
-    }
+    return jsonify(appointment_json(appointment)), 200
 
-    if "user_id" in session and (
-        appointment.tutorId == session["user_id"]
-        or appointment.studentId == session["user_id"]
-    ):
-        return_val["studentId"] = appointment.studentId
 
-    if "user_id" in session and appointment.studentId == session["user_id"]:
-        return_val["rating"] = appointment.rating.score if appointment.rating else None
+@appointment.route("/batch", methods=["GET"])
+@error_decorator
+@validate_decorator("query_string", batch_schema)
+def get_appointments_batch(args):
+    """Get many pre-existing appointments at once
 
-    return jsonify(return_val), 200
+    Args:
+        ids (list of str): JSON list of the ids of the appointments, at most 100
+
+    Returns:
+        appointments (list of dict): the appointments which exist, in the order of
+            ids, in the same shape as returned by `/appointment/<appointment_id>`
+
+    Raises:
+        ExpectedError: if ids is not a valid JSON list of strings
+        ExpectedError: if too many ids are requested
+
+    """
+    ids = parse_ids(args)
+    appointments = {
+        appointment.id: appointment
+        for appointment in Appointment.prisma().find_many(
+            where={"id": {"in": ids}}, include={"rating": True}
+        )
+    }
+
+    return_val = [
+        appointment_json(appointments[id]) for id in ids if id in appointments
+    ]
+    return jsonify({"appointments": return_val}), 200
 
 
 @appointment.route("/accept", methods=["PUT"])
@@ -109,14 +182,12 @@ def appointment_accept(args):
             "Appointment corresponding to id does not exist or, appointment does not involve tutor",
             400,
         )
+    identity_map.forget()
 
-    Notification.prisma().create(
-        data={
-            "id": str(uuid4()),
-            "forUser": {"connect": {"id": appointment.studentId}},
-            "content": f"{tutor.name} has accepted your appointment",
-            "appointment": {"connect": {"id": appointment.id}},
-        }
+    create_notification(
+        appointment.studentId,
+        f"{tutor.name} has accepted your appointment",
+        appointment_id=appointment.id,
     )
 
     return (
@@ -173,38 +244,42 @@ def appointment_request(args):
     if not tutor:
         raise ExpectedError("Tutor profile does not exist", 400)
 
-    student = student_view(id=session["user_id"])
+    student = student_view(id=session["user_id"], include={"appointments"})
     if not student:
         raise ExpectedError("Profile is not a student", 400)
 
-    if student.appointments is not None:
-        for appointment in student.appointments:
-            if (
-                appointment.startTime <= st < appointment.endTime
-                or appointment.startTime < et <= appointment.endTime
-            ):
-                raise ExpectedError(
-                    "Cannot request an appointment which overlaps with another one",
-                    400,
-                )
-
-    appointment = Appointment.prisma().create(
-        data={
-            "id": str(uuid4()),
-            "startTime": args["startTime"],
-            "endTime": args["endTime"],
-            "tutorAccepted": False,
-            "tutor": {"connect": {"id": args["tutorId"]}},
-            "student": {"connect": {"id": session["user_id"]}},
-            "notification": {
-                "create": {
-                    "id": str(uuid4()),
-                    "forUser": {"connect": {"id": args["tutorId"]}},
-                    "content": f"{student.name} has requested an appointment with you",
-                }
-            },
-        }
-    )
+    booked = ((apt.startTime, apt.endTime) for apt in student.appointments or [])
+    if overlaps_any(booked, st, et):
+        raise ExpectedError(
+            "Cannot request an appointment which overlaps with another one",
+            400,
+        )
+
+    notification_id = str(uuid4())
+    prisma: Prisma = current_app.extensions["prisma"]
+    with prisma.tx() as transaction:
+        appointment = Appointment.prisma(transaction).create(
+            data={
+                "id": str(uuid4()),
+                "startTime": args["startTime"],
+                "endTime": args["endTime"],
+                "tutorAccepted": False,
+                "tutor": {"connect": {"id": args["tutorId"]}},
+                "student": {"connect": {"id": session["user_id"]}},
+                "notification": {
+                    "create": {
+                        "id": notification_id,
+                        "forUser": {"connect": {"id": args["tutorId"]}},
+                        "content": (
+                            f"{student.name} has requested an appointment with you"
+                        ),
+                    }
+                },
+            }
+        )
+        count_unread_notifications(args["tutorId"], 1, transaction)
+    identity_map.forget()
+    publish_notification(args["tutorId"], notification_id)
 
     return (
         jsonify(
@@ -243,7 +318,7 @@ def appointment_delete(args):
     if "user_id" not in session:
         raise ExpectedError("No user is logged in", 401)
 
-    tutor = tutor_view(id=session["user_id"])
+    tutor = tutor_view(id=session["user_id"], include={"appointments"})
     if not tutor:
         raise ExpectedError("Logged in user is not a tutor", 404)
 
@@ -251,20 +326,51 @@ def appointment_delete(args):
     if not appointment:
         raise ExpectedError("Appointment does not exist", 404)
 
-    if tutor.appointments is None or appointment not in tutor.appointments:
+    if tutor.appointments is None or appointment.id not in [
+        apt.id for apt in tutor.appointments
+    ]:
         raise ExpectedError("Logged in user is not the tutor of the appointment", 403)
 
-    Notification.prisma().create(
-        data={
-            "id": str(uuid4()),
-            "forUser": {"connect": {"id": appointment.studentId}},
-            "content": f"Your appointment with {tutor.name} has been deleted",
-        }
+    create_notification(
+        appointment.studentId, f"Your appointment with {tutor.name} has been deleted"
     )
 
-    Notification.prisma().delete_many(where={"appointmentId": appointment.id})
+    prisma: Prisma = current_app.extensions["prisma"]
+    with prisma.tx() as transaction:
+        # the rating is read after the lock, so it can't be (re)rated before
+        # its score is taken off the tutor's aggregates
+        lock_rating_aggregates(appointment.tutorId, transaction)
+        rating = Rating.prisma(transaction).find_unique(
+            where={"appointmentId": appointment.id}
+        )
+        # the notifications about the appointment's messages are cascade
+        # deleted with them, so every notification is counted beforehand
+        cleared = Counter(
+            notification.userId
+            for notification in Notification.prisma(transaction).find_many(
+                where={
+                    "OR": [
+                        {"appointmentId": appointment.id},
+                        {"message": {"is": {"appointmentId": appointment.id}}},
+                    ]
+                }
+            )
+        )
+        Notification.prisma(transaction).delete_many(
+            where={"appointmentId": appointment.id}
+        )
+        # the rating is cascade deleted with the appointment
+        Appointment.prisma(transaction).delete(where={"id": args["id"]})
+        for user_id, count in cleared.items():
+            count_unread_notifications(user_id, -count, transaction)
+        if rating is not None:
+            update_rating_aggregates(
+                appointment.tutorId, -rating.score, -1, transaction
+            )
+    identity_map.forget()
 
-    Appointment.prisma().delete(where={"id": args["id"]})
+    if rating is not None:
+        tutor_changed(appointment.tutorId)
 
     return jsonify({"success": True}), 200
 
@@ -301,7 +407,7 @@ def appointment_modify(args):
     st = data["startTime"]
     et = data["endTime"]
 
-    tutor = tutor_view(id=session["user_id"])
+    tutor = tutor_view(id=session["user_id"], include={"appointments"})
     if not tutor:
         raise ExpectedError("Logged in user is not a tutor", 404)
 
@@ -312,24 +418,22 @@ def appointment_modify(args):
     if appointment not in tutor.appointments:
         raise ExpectedError("Logged in user is not the tutor of the appointment", 403)
 
-    for apt in tutor.appointments:
-        if apt != appointment and (
-            apt.startTime <= st < apt.endTime or apt.startTime < et <= apt.endTime
-        ):
-            raise ExpectedError("Appointment overlaps with another appointment", 400)
+    booked = (
+        (apt.startTime, apt.endTime) for apt in tutor.appointments if apt != appointment
+    )
+    if overlaps_any(booked, st, et):
+        raise ExpectedError("Appointment overlaps with another appointment", 400)
 
     Appointment.prisma().update(
         where={"id": args["id"]},
         data={"startTime": args["startTime"], "endTime": args["endTime"]},
     )
+    identity_map.forget()
 
-    Notification.prisma().create(
-        data={
-            "id": str(uuid4()),
-            "forUser": {"connect": {"id": appointment.studentId}},
-            "content": f"Your appointment with {tutor.name} has been modified",
-            "appointment": {"connect": {"id": appointment.id}},
-        }
+    create_notification(
+        appointment.studentId,
+        f"Your appointment with {tutor.name} has been modified",
+        appointment_id=appointment.id,
     )
 
     return jsonify({"success": True}), 200
@@ -358,9 +462,7 @@ def appointment_rating(args):
     if "user_id" not in session:
         raise ExpectedError("No user is logged in", 401)
 
-    appointment = Appointment.prisma().find_unique(
-        where={"id": args["id"]}, include={"rating": True}
-    )
+    appointment = Appointment.prisma().find_unique(where={"id": args["id"]})
     if not appointment:
         raise ExpectedError("Appointment does not exist", 400)
 
@@ -370,30 +472,55 @@ def appointment_rating(args):
     if appointment.endTime > datetime.now(timezone.utc):
         raise ExpectedError("Appointment isn't complete yet", 400)
 
-    rating_id = appointment.rating.id if appointment.rating else str(uuid4())
-    Rating.prisma().upsert(
-        where={"id": rating_id},
-        data={
-            "create": {
-                "id": rating_id,
-                "score": args["rating"],
-                "appointment": {"connect": {"id": args["id"]}},
-                "createdFor": {"connect": {"id": appointment.tutorId}},
+    prisma: Prisma = current_app.extensions["prisma"]
+    with prisma.tx() as transaction:
+        # the previous score is read after the lock, so concurrent ratings of
+        # the appointment are each applied to the score the other left
+        lock_rating_aggregates(appointment.tutorId, transaction)
+        previous = Rating.prisma(transaction).find_unique(
+            where={"appointmentId": args["id"]}
+        )
+        Rating.prisma(transaction).upsert(
+            where={"appointmentId": args["id"]},
+            data={
+                "create": {
+                    "id": str(uuid4()),
+                    "score": args["rating"],
+                    "appointment": {"connect": {"id": args["id"]}},
+                    "createdFor": {"connect": {"id": appointment.tutorId}},
+                },
+                "update": {"score": args["rating"]},
             },
-            "update": {"score": args["rating"]},
-        },
-    )
+        )
+        # a changed score only changes the sum, a new score changes both
+        if previous:
+            update_rating_aggregates(
+                appointment.tutorId,
+                args["rating"] - previous.score,
+                0,
+                transaction,
+            )
+        else:
+            update_rating_aggregates(
+                appointment.tutorId, args["rating"], 1, transaction
+            )
+    tutor_changed(appointment.tutorId)
 
     return jsonify({"success": True}), 200
 
 
 @appointment.route("/<appointment_id>/messages", methods=["GET"])
 @error_decorator
-def appointment_messages(appointment_id):
-    """Returns all messages of an appointment given its Id, in the order of sentTime descending.
+@validate_decorator("query_string", message_history_schema)
+def appointment_messages(args, appointment_id):
+    """Returns messages of an appointment given its Id, in the order of sentTime
+    descending. Older messages are paged through by passing the nextCursor of
+    a page as `before`.
 
     Args:
         appointment_id (int): the id of the appointment
+        limit (str, optional): maximum number of messages, 20 if omitted
+        before (str, optional): nextCursor of the previous (newer) page
 
     Returns:
         messages (list): list of dictionaries containing:
@@ -401,20 +528,20 @@ def appointment_messages(appointment_id):
             - sentBy (str): id of the user who sent the message
             - sentTime (str): time the message was sent
             - content (str): content of the message
+        nextCursor (str | None): cursor of the page of older messages, None if
+            there are none
 
     Raises:
         ExpectedError: if the user is not logged in
         ExpectedError: appointment does not exist
         ExpectedError: user is not the tutor or student of the appointment
+        ExpectedError: the cursor is invalid
 
     """
     if "user_id" not in session:
         raise ExpectedError("No user is logged in", 401)
 
-    appointment = Appointment.prisma().find_unique(
-        where={"id": appointment_id},
-        include={"messages": {"orderBy": {"sentTime": "desc"}}},
-    )
+    appointment = Appointment.prisma().find_unique(where={"id": appointment_id})
 
     if not appointment:
         raise ExpectedError("Appointment does not exist", 400)
@@ -425,6 +552,14 @@ def appointment_messages(appointment_id):
     ):
         raise ExpectedError("User is not the tutor or student of the appointment", 403)
 
+    messages, next_cursor = find_page_by_time(
+        Message.prisma(),
+        where={"appointmentId": appointment.id},
+        field="sentTime",
+        page=parse_page_args(args, cursor_arg="before"),
+        nullable=False,
+    )
+
     return (
         jsonify(
             {
@@ -435,8 +570,9 @@ def appointment_messages(appointment_id):
                         "sentTime": message.sentTime.isoformat(),
                         "content": message.content,
                     }
-                    for message in appointment.messages
-                ]
+                    for message in messages
+                ],
+                "nextCursor": next_cursor,
             }
         ),
         200,
@@ -486,12 +622,12 @@ def appointment_message(args):
         "appointment": {"connect": {"id": args["id"]}},
     }
 
-    pusher_client: Pusher = current_app.extensions["pusher"]
-    channel_info = pusher_client.channel_info(args["id"])
+    outbox: RealtimeOutbox = current_app.extensions["realtime"]
+    occupied = occupancy.is_occupied(args["id"])
     msg = Message.prisma().create(data=message_info)
-    if channel_info["occupied"]:
+    if occupied:
         try:
-            pusher_client.trigger(
+            outbox.publish(
                 args["id"],
                 "appointment_message",
                 {
@@ -504,21 +640,25 @@ def appointment_message(args):
             raise ExpectedError("Message format is invalid", 400)
         Appointment.prisma().update(
             where={"id": args["id"]},
-            data={"messages": {"connect": {"id": msg.id}}},
+            data={
+                "messages": {"connect": {"id": msg.id}},
+                "lastMessageAt": message_info["sentTime"],
+            },
         )
     else:
         user = user_view(id=session["user_id"])
-        Notification.prisma().create(
-            data={
-                "id": str(uuid4()),
-                "forUser": {"connect": {"id": other_id}},
-                "message": {"connect": {"id": msg.id}},
-                "content": f"Received a message in appointment with {user.name}, for appointment scheduled at {appointment.startTime.isoformat()}",
-            }
+        create_notification(
+            other_id,
+            f"Received a message in appointment with {user.name}, for appointment scheduled at {appointment.startTime.isoformat()}",
+            message_id=msg.id,
+            conversation_key=f"appointment:{args['id']}",
         )
         Appointment.prisma().update(
             where={"id": args["id"]},
-            data={"messages": {"connect": {"id": msg.id}}},
+            data={
+                "messages": {"connect": {"id": msg.id}},
+                "lastMessageAt": message_info["sentTime"],
+            },
         )
 
     return (
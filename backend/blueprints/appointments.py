@@ -1,7 +1,8 @@
 from flask import Blueprint, jsonify, session
-from datetime import datetime, MINYEAR, timezone
-from prisma.models import User
+from prisma.models import Appointment
 from jsonschemas import appointments_schema
+from helpers.check_user_account_type import session_account_type
+from helpers.pagination import find_page_by_id, find_page_by_time, parse_page_args
 from helpers.error_handlers import (
     ExpectedError,
     error_decorator,
@@ -19,61 +20,50 @@ def get_appointments(args):
 
     Query Params:
         sortBy (str): sorting method for the messages
+        limit (str, optional): maximum number of appointments, 20 if omitted
+        cursor (str, optional): nextCursor of the previous page
 
     Returns:
         appointments (list of str): list of appointment ids
+        nextCursor (str | None): cursor of the next page, None if there isn't
+        one
 
     Raises:
         ExpectedError: if the user is not logged in
         ExpectedError: if the user is not a student or tutor
+        ExpectedError: if the cursor is invalid
 
     """
     if "user_id" not in session:
         raise ExpectedError("No user is logged in", 401)
 
-    user = User.prisma().find_unique(
-        where={
-            "id": session["user_id"],
-        },
-        include={
-            "adminInfo": True,
-            "tutorInfo": {
-                "include": {
-                    "appointments": {
-                        "include": {
-                            "messages": {"order_by": {"sentTime": "desc"}},
-                        }
-                    }
-                }
-            },
-            "studentInfo": {
-                "include": {
-                    "appointments": {
-                        "include": {
-                            "messages": {"order_by": {"sentTime": "desc"}},
-                        }
-                    }
-                }
-            },
-        },
-    )
-
-    appointments = []
-    if user.adminInfo is not None:
+    user_type = session_account_type()
+    if user_type == "admin":
         raise ExpectedError("Must be a student or tutor to view appointments", 403)
-    elif user.studentInfo is not None:
-        appointments = user.studentInfo.appointments
-    elif user.tutorInfo is not None:
-        appointments = user.tutorInfo.appointments
+    elif user_type == "student":
+        where = {"studentId": session["user_id"]}
+    elif user_type == "tutor":
+        where = {"tutorId": session["user_id"]}
+    else:
+        return jsonify({"appointments": [], "nextCursor": None}), 200
 
+    page = parse_page_args(args)
     if "sortBy" in args:
-        # figure out a way to sort by msgs
-        appointments = sorted(
-            appointments,
-            key=lambda apt: apt.messages[0].sentTime
-            if len(apt.messages) != 0
-            else datetime(MINYEAR, 1, 1, tzinfo=timezone.utc),
-            reverse=True,
+        # sorted by the denormalised lastMessageAt, so no messages are loaded
+        appointments, next_cursor = find_page_by_time(
+            Appointment.prisma(), where=where, field="lastMessageAt", page=page
+        )
+    else:
+        appointments, next_cursor = find_page_by_id(
+            Appointment.prisma(), where=where, page=page
         )
 
-    return jsonify({"appointments": [apt.id for apt in appointments]}), 200
+    return (
+        jsonify(
+            {
+                "appointments": [apt.id for apt in appointments],
+                "nextCursor": next_cursor,
+            }
+        ),
+        200,
+    )
@@ -3,7 +3,10 @@ from prisma.models import User
 from uuid import uuid4
 from hashlib import sha256
 from jsonschemas import register_schema, reset_password_schema, login_schema
+from helpers import identity_map
 from helpers.views import user_view, admin_view, tutor_view, student_view
+from helpers.check_user_account_type import session_account_type
+from helpers.profile_cache import tutor_changed
 from helpers.error_handlers import (
     validate_decorator,
     ExpectedError,
@@ -50,9 +53,15 @@ def register(args):
         case "student":
             data["studentInfo"] = {"create": {"id": new_user_id}}
             User.prisma().create(data=data)
+            session["account_type"] = "student"
         case "tutor":
             data["tutorInfo"] = {"create": {"id": new_user_id}}
             User.prisma().create(data=data)
+            # new tutors need to be searchable
+            tutor_changed(new_user_id)
+            session["account_type"] = "tutor"
+    # they were looked up by email above, and found not to exist
+    identity_map.forget()
 
     session["user_id"] = new_user_id
 
@@ -89,6 +98,8 @@ def login(args):
         and user.hashed_password == sha256(str(args["password"]).encode()).hexdigest()
     ):
         session["user_id"] = user.id
+        # saves looking up the account type for every request made in the session
+        session["account_type"] = args["accountType"]
         return jsonify({"id": user.id}), 200
     else:
         raise ExpectedError("Invalid login attempt", 401)
@@ -105,6 +116,7 @@ def logout():
     """
     if "user_id" in session:
         session.pop("user_id")
+    session.pop("account_type", None)
     return jsonify({"success": True}), 200
 
 
@@ -131,8 +143,7 @@ def resetpassword(args):
     if "user_id" not in session:
         raise ExpectedError("No user is logged in", 401)
 
-    admin = admin_view(id=session["user_id"])
-    if not admin:
+    if session_account_type() != "admin":
         raise ExpectedError("Insufficient permission to modify this profile", 403)
 
     user = user_view(id=args["id"])
@@ -145,5 +156,6 @@ def resetpassword(args):
         raise ExpectedError("New password cannot be the same as the old password", 400)
 
     User.prisma().update(where={"id": user.id}, data={"hashedPassword": new_password})
+    identity_map.forget()
 
     return jsonify({"success": True}), 200
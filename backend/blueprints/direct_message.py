@@ -1,12 +1,24 @@
 from typing import TypedDict
 from flask import Blueprint, jsonify, session, current_app
-from pusher import Pusher
 from uuid import uuid4
-from prisma.models import DirectMessage, Notification
+from prisma import Prisma
+from prisma.models import DirectMessage, Message, Notification, User
 from prisma.errors import UniqueViolationError
-from datetime import datetime, MINYEAR, timezone
-from jsonschemas import direct_message_schema
+from datetime import datetime, timezone
+from jsonschemas import (
+    direct_message_schema,
+    message_history_schema,
+    pagination_schema,
+)
 from helpers.views import user_view
+from helpers import identity_map
+from helpers.pagination import find_page_by_time, parse_page_args
+from helpers.realtime import RealtimeOutbox
+from helpers import occupancy
+from helpers.create_notification import (
+    count_unread_notifications,
+    create_notification,
+)
 from helpers.error_handlers import (
     validate_decorator,
     ExpectedError,
@@ -18,59 +30,65 @@ direct_message = Blueprint("direct_message", __name__)
 
 @direct_message.route("/all", methods=["GET"])
 @error_decorator
-def dm_all():
+@validate_decorator("query_string", pagination_schema)
+def dm_all(args):
     """Retrieves all ids of other users the session user has messaged or received
     a message from, sorted by most recently messaged/received from.
 
     Args:
+        limit (str, optional): maximum number of ids to return, 20 if omitted
+        cursor (str, optional): nextCursor of the previous page
 
     Returns:
         (json): dictionary containing:
             - otherIds (list of str): list of ids of other users the session user
             has messaged or received
+            - nextCursor (str | None): cursor of the next page, None if there
+            isn't one
 
     Raises:
         ExpectedError: If the user is not logged in
+        ExpectedError: If the cursor is invalid
 
     """
     if "user_id" not in session:
         raise ExpectedError("No user is logged in", 401)
 
-    dms = DirectMessage.prisma().find_many(
+    # sorted by the denormalised lastMessageAt, so no messages are loaded
+    dms, next_cursor = find_page_by_time(
+        DirectMessage.prisma(),
         where={
             "OR": [
                 {"fromUserId": session["user_id"]},
                 {"otherUserId": session["user_id"]},
             ]
         },
-        include={"messages": {"order_by": {"sentTime": "desc"}}},
-    )
-    sorted_dms = sorted(
-        dms,
-        key=lambda dm: dm.messages[0].sentTime
-        if len(dm.messages) != 0
-        else datetime(MINYEAR, 1, 1, tzinfo=timezone.utc),
-        reverse=True,
+        field="lastMessageAt",
+        page=parse_page_args(args),
     )
 
     otherIds = []
-    for dm in sorted_dms:
+    for dm in dms:
         if dm.fromUserId == session["user_id"]:
             otherIds.append(dm.otherUserId)
         elif dm.otherUserId == session["user_id"]:
             otherIds.append(dm.fromUserId)
 
-    return jsonify({"otherIds": otherIds}), 200
+    return jsonify({"otherIds": otherIds, "nextCursor": next_cursor}), 200
 
 
 @direct_message.route("/<other_id>", methods=["GET"])
 @error_decorator
-def dm_info(other_id):
+@validate_decorator("query_string", message_history_schema)
+def dm_info(args, other_id):
     """Retrieves the direct messages of a session user with another user given
-    their Id in the order of sentTime descending.
+    their Id in the order of sentTime descending. Older messages are paged
+    through by passing the nextCursor of a page as `before`.
 
     Query Params:
         other_id (int): The id of the other user
+        limit (str, optional): maximum number of messages, 20 if omitted
+        before (str, optional): nextCursor of the previous (newer) page
 
     Returns:
         (json): dictionary containing:
@@ -79,14 +97,18 @@ def dm_info(other_id):
                 - sentBy (str): id of the user who sent the message
                 - sentTime (str): time the message was sent
                 - content (str): content of the message
+            - nextCursor (str | None): cursor of the page of older messages,
+            None if there are none
 
     Raises:
         ExpectedError: If the user is not logged in
+        ExpectedError: If the cursor is invalid
 
     """
     if "user_id" not in session:
         raise ExpectedError("No user is logged in", 401)
 
+    page = parse_page_args(args, cursor_arg="before")
     direct_message = DirectMessage.prisma().find_first(
         where={
             "OR": [
@@ -94,15 +116,27 @@ def dm_info(other_id):
                 {"fromUserId": other_id, "otherUserId": session["user_id"]},
             ]
         },
-        include={"messages": {"order_by": {"sentTime": "desc"}}},
     )
     if direct_message is None:
-        return jsonify({"messages": []}), 200
+        return jsonify({"messages": [], "nextCursor": None}), 200
+
+    page_messages, next_cursor = find_page_by_time(
+        Message.prisma(),
+        where={"directMessageId": direct_message.id},
+        field="sentTime",
+        page=page,
+        nullable=False,
+        include={"notification": True},
+    )
 
     messages = []
     notifications_to_clear = []
-    for message in direct_message.messages:
-        if message.notification is not None:
+    for message in page_messages:
+        # only the notifications of messages sent to the session user
+        if (
+            message.notification is not None
+            and message.notification.userId == session["user_id"]
+        ):
             notifications_to_clear.append(message.notification.id)
 
         messages.append(
@@ -114,14 +148,20 @@ def dm_info(other_id):
             }
         )
 
-    Notification.prisma().delete_many(where={"id": {"in": notifications_to_clear}})
+    if len(notifications_to_clear) > 0:
+        prisma: Prisma = current_app.extensions["prisma"]
+        with prisma.tx() as transaction:
+            cleared = Notification.prisma(transaction).delete_many(
+                where={"id": {"in": notifications_to_clear}}
+            )
+            count_unread_notifications(session["user_id"], -cleared, transaction)
 
-    return jsonify({"messages": messages}), 200
+    return jsonify({"messages": messages, "nextCursor": next_cursor}), 200
 
 
 class MessageInfo(TypedDict, total=True):
     id: str
-    sentTime: str
+    sentTime: datetime
     content: str
     sentBy: dict
 
@@ -144,6 +184,10 @@ def dm_create_message(
     # ! Upsert can and will fail when it's called multiple times due to a race condition:
     # https://www.prisma.io/docs/reference/api-reference/prisma-client-reference#unique-key-constraint-errors-on-upserts
     # https://github.com/prisma/prisma/issues/3242
+    update = {
+        "messages": {"create": message_info},
+        "lastMessageAt": message_info["sentTime"],
+    }
     try:
         DirectMessage.prisma().upsert(
             where={"id": dm_id},
@@ -152,16 +196,14 @@ def dm_create_message(
                     "id": dm_id,
                     "fromUser": {"connect": {"id": sender_id}},
                     "otherUser": {"connect": {"id": receiver_id}},
-                    "messages": {"create": message_info},
+                    **update,
                 },
-                "update": {"messages": {"create": message_info}},
+                "update": update,
             },
         )
     except UniqueViolationError:
         # attempt to update with the message when the upsert fails
-        DirectMessage.prisma().update(
-            where={"id": dm_id}, data={"messages": {"create": message_info}}
-        )
+        DirectMessage.prisma().update(where={"id": dm_id}, data=update)
 
 
 @direct_message.route("/", methods=["POST"])
@@ -188,6 +230,8 @@ def dm_message(args):
     if "user_id" not in session:
         raise ExpectedError("No user is logged in", 401)
 
+    # the sender may be needed for a notification, so both are loaded at once
+    identity_map.defer(User, [args["otherId"], session["user_id"]])
     other_user = user_view(id=args["otherId"])
     if other_user is None:
         raise ExpectedError("otherId does not correspond to an user", 400)
@@ -209,12 +253,12 @@ def dm_message(args):
         "sentBy": {"connect": {"id": session["user_id"]}},
     }
 
-    pusher_client: Pusher = current_app.extensions["pusher"]
-    channel_info = pusher_client.channel_info(args["otherId"])
+    outbox: RealtimeOutbox = current_app.extensions["realtime"]
+    occupied = occupancy.is_occupied(args["otherId"])
     dm_create_message(dm_id, session["user_id"], args["otherId"], message_info)
-    if channel_info["occupied"]:
+    if occupied:
         try:
-            pusher_client.trigger(
+            outbox.publish(
                 args["otherId"],
                 "direct_message",
                 {
@@ -228,13 +272,11 @@ def dm_message(args):
 
     else:
         user = user_view(id=session["user_id"])
-        Notification.prisma().create(
-            data={
-                "id": str(uuid4()),
-                "forUser": {"connect": {"id": args["otherId"]}},
-                "message": {"connect": {"id": message_info["id"]}},
-                "content": f"Received a direct message from {user.name}",
-            }
+        create_notification(
+            args["otherId"],
+            f"Received a direct message from {user.name}",
+            message_id=message_info["id"],
+            conversation_key=f"directMessage:{dm_id}",
         )
 
     return (
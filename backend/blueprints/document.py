@@ -1,14 +1,139 @@
+import binascii
+from base64 import b64decode, b64encode
+from datetime import datetime, timedelta, timezone
+from typing import BinaryIO, Iterable, List, Set, Tuple
 from uuid import uuid4
-from flask import Blueprint, request, jsonify, session
-from prisma.models import Document
+from flask import Blueprint, Response, current_app, jsonify, redirect, request
+from flask import send_file, session
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from prisma import Prisma
+from prisma.models import Document, UploadSession, User
 from prisma.errors import RecordNotFoundError
-from jsonschemas import document_upload_schema, document_delete_schema
-from helpers.views import tutor_view
+from jsonschemas import (
+    document_upload_schema,
+    document_delete_schema,
+    upload_commit_schema,
+    upload_session_schema,
+)
+from helpers.blob_store import BlobCollector, BlobStore, read_chunks, write_blob
+from helpers.check_user_account_type import session_account_type
+from helpers.etag import bump_version, etag_decorator
+from helpers.profile_cache import tutor_changed
+from helpers import identity_map
+from helpers.upload_staging import ChunkError, UploadStaging
 from helpers.error_handlers import ExpectedError, error_decorator, validate_decorator
 
 document = Blueprint("document", __name__)
 
 
+def parse_data_url(url: str) -> Tuple[bytes, str] | None:
+    """Parses a document as uploaded, a base64 data URL e.g.
+    "data:application/pdf;base64,JVBERi0...".
+
+    Args:
+        url (str): the data URL
+
+    Returns:
+        (bytes, str): the content of the document, and its media type. None
+        if it isn't a data URL which can be rebuilt exactly from them e.g.
+        plain text, which is then kept as is.
+
+    """
+    if not url.startswith("data:") or "," not in url:
+        return None
+
+    header, data = url[len("data:") :].split(",", 1)
+    media_type, _, encoding = header.rpartition(";")
+    if not media_type or encoding != "base64":
+        return None
+
+    try:
+        content = b64decode(data, validate=True)
+    except binascii.Error:
+        return None
+    # e.g. without padding, which it would have when it's returned
+    if b64encode(content).decode() != data:
+        return None
+
+    return content, media_type
+
+
+def store_document(url: str) -> dict:
+    """Stores a document's content in the blob store, if it's a data URL
+
+    Args:
+        url (str): the document, as uploaded
+
+    Returns:
+        (dict): the Document fields describing the stored content, or holding
+        the document as is
+
+    """
+    parsed = parse_data_url(url)
+    if parsed is None:
+        return {"document": url}
+
+    content, mime_type = parsed
+    store: BlobStore = current_app.extensions["blob_store"]
+    blob = write_blob(store, [content])
+
+    return {"blobHash": blob.hash, "size": blob.size, "mimeType": mime_type}
+
+
+def store_legacy_document(doc: Document) -> dict | None:
+    """Moves a document uploaded before documents were stored as blobs into
+    the blob store, rather than all of them being moved at once by a migration
+
+    Args:
+        doc (Document): the document, with its content in Document.document
+
+    Returns:
+        (dict | None): the Document fields now describing its content, None
+        if it isn't a data URL and so is kept as is
+
+    """
+    fields = store_document(doc.document)
+    if "blobHash" not in fields:
+        return None
+
+    Document.prisma().update_many(
+        where={"id": doc.id, "blobHash": None}, data={**fields, "document": None}
+    )
+
+    return fields
+
+
+def referenced_blobs(keys: List[str]) -> Set[str]:
+    """The keys of blobs which documents refer to"""
+    docs = Document.prisma().find_many(
+        where={"blobHash": {"in": keys}}, distinct=["blobHash"]
+    )
+    return {doc.blobHash for doc in docs}
+
+
+def collect_unreferenced_blobs():
+    """Deletes the blobs no document refers to, run every BLOB_GC_INTERVAL
+    seconds by Maintenance"""
+    collector: BlobCollector = current_app.extensions["blob_collector"]
+    store: BlobStore = current_app.extensions["blob_store"]
+    collector.collect(store, referenced_blobs)
+
+
+def limit_size(chunks: Iterable[bytes], max_size: int) -> Iterable[bytes]:
+    """Passes chunks through until more than max_size bytes have been seen
+
+    Raises:
+        ExpectedError: If there are more than max_size bytes
+
+    """
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        if size > max_size:
+            raise ExpectedError(f"document is larger than {max_size} bytes", 413)
+        yield chunk
+
+
 @document.route("/", methods=["POST"])
 @error_decorator
 @validate_decorator("json", document_upload_schema)
@@ -16,7 +141,9 @@ def upload_document(args):
     """Uploads a document to tutor, returns the generated id for it if successful.
 
     Args:
-        document (str): The document to upload
+        document (str): The document to upload, as a data URL (anything else
+            is stored, and returned, as is)
+        filename (str, optional): The name of the document's file
 
     Returns:
         id (str): The id of the document
@@ -29,26 +156,39 @@ def upload_document(args):
     if "user_id" not in session:
         raise ExpectedError("No user is logged in", 401)
 
-    tutor = tutor_view(id=session["user_id"])
-
-    if tutor is None:
+    if session_account_type() != "tutor":
         raise ExpectedError("User is not a tutor", 401)
 
-    args = request.get_json()
-
+    # only the blob's hash and metadata are kept in the db, for data URLs
     doc = Document.prisma().create(
         data={
             "id": str(uuid4()),
-            "tutor": {"connect": {"id": tutor.id}},
-            "document": args["document"],
+            "tutor": {"connect": {"id": session["user_id"]}},
+            "filename": args.get("filename"),
+            **store_document(args["document"]),
         }
     )
+    # the ids of their documents are on their profile
+    bump_version(User, session["user_id"])
+    tutor_changed(session["user_id"])
 
     return jsonify({"id": doc.id})
 
 
+def document_version(document_id: str) -> tuple | None:
+    doc = identity_map.find_unique(Document, {"id": document_id})
+    # legacy documents are moved into the blob store when they're first read,
+    # and are only then given a version
+    if doc is None or doc.blobHash is None:
+        return None
+
+    # content addressed, so the hash only changes along with the content
+    return (doc.blobHash, doc.mimeType)
+
+
 @document.route("/<document_id>", methods=["GET"])
 @error_decorator
+@etag_decorator(document_version)
 def get_document(document_id):
     """Gets the document with the given id.
 
@@ -56,10 +196,110 @@ def get_document(document_id):
         document_id (str): The id of the document to get
 
     Returns:
-        document (str): The document
+        document (str): The document, as a data URL
+
+    Raises:
+        ExpectedError: If the document id does not exist
+
+    """
+    doc = identity_map.find_unique(Document, {"id": document_id})
+
+    if doc is None:
+        raise ExpectedError("document id does not exist", 400)
+
+    if doc.blobHash is None:
+        store_legacy_document(doc)
+        return jsonify({"document": doc.document})
+
+    store: BlobStore = current_app.extensions["blob_store"]
+    with store.open(doc.blobHash) as blob:
+        content = b64encode(blob.read()).decode()
+
+    return jsonify({"document": f"data:{doc.mimeType};base64,{content}"})
+
+
+@document.route("/file", methods=["PUT", "POST"])
+@error_decorator
+def upload_document_file():
+    """Uploads a document to tutor as a file, rather than a data URL. The file
+    is streamed into the blob store, so it's never held in memory as a whole.
+
+    Either the body is the file (PUT), optionally sent with chunked
+    transfer-encoding, or the body is multipart/form-data with the file in its
+    "file" field (POST).
+
+    Query Params:
+        filename (str, optional): The name of the document's file (PUT)
+
+    Returns:
+        id (str): The id of the document
+
+    Raises:
+        ExpectedError: If the user is not logged in
+        ExpectedError: If the user is not a tutor
+        ExpectedError: If the file is missing (POST)
+        ExpectedError: If the file is larger than DOCUMENT_MAX_SIZE
+
+    """
+    if "user_id" not in session:
+        raise ExpectedError("No user is logged in", 401)
+
+    if session_account_type() != "tutor":
+        raise ExpectedError("User is not a tutor", 401)
+
+    max_size = current_app.config["DOCUMENT_MAX_SIZE"]
+    # multipart bodies are a little larger than their file
+    if request.method == "PUT" and (request.content_length or 0) > max_size:
+        raise ExpectedError(f"document is larger than {max_size} bytes", 413)
+
+    stream: BinaryIO
+    if request.method == "POST":
+        # werkzeug spools large files to disk while parsing the form
+        file = request.files.get("file")
+        if file is None:
+            raise ExpectedError("'file' was missing from field(s)", 400)
+        stream, filename, mime_type = file.stream, file.filename, file.mimetype
+    else:
+        stream = request.stream
+        filename, mime_type = request.args.get("filename"), request.mimetype
+
+    store: BlobStore = current_app.extensions["blob_store"]
+    blob = write_blob(store, limit_size(read_chunks(stream), max_size))
+
+    doc = Document.prisma().create(
+        data={
+            "id": str(uuid4()),
+            "tutor": {"connect": {"id": session["user_id"]}},
+            "blobHash": blob.hash,
+            "size": blob.size,
+            "mimeType": mime_type or "application/octet-stream",
+            "filename": filename or None,
+        }
+    )
+    bump_version(User, session["user_id"])
+    tutor_changed(session["user_id"])
+
+    return jsonify({"id": doc.id})
+
+
+@document.route("/<document_id>/file", methods=["GET"])
+@error_decorator
+def get_document_file(document_id):
+    """Downloads the document with the given id as a file, streamed from the
+    blob store. Supports Range requests, and conditional requests with the
+    ETag (the hash of the content) e.g. If-None-Match.
+
+    Args:
+        document_id (str): The id of the document to get
+
+    Returns:
+        (file): the document, or a redirect to it if the blob store serves
+        files itself e.g. S3
 
     Raises:
         ExpectedError: If the document id does not exist
+        ExpectedError: If the document is not a valid data URL (legacy)
+        ExpectedError: If the Range is not satisfiable
 
     """
     doc = Document.prisma().find_unique(where={"id": document_id})
@@ -67,7 +307,34 @@ def get_document(document_id):
     if doc is None:
         raise ExpectedError("document id does not exist", 400)
 
-    return jsonify({"document": doc.document})
+    if doc.blobHash is None:
+        fields = store_legacy_document(doc)
+        if fields is None:
+            raise ExpectedError("document is not a valid data URL", 400)
+        blob_hash, mime_type = fields["blobHash"], fields["mimeType"]
+    else:
+        blob_hash, mime_type = doc.blobHash, doc.mimeType
+
+    store: BlobStore = current_app.extensions["blob_store"]
+    path = store.local_path(blob_hash)
+    if path is None:
+        return redirect(store.download_url(blob_hash, mime_type, doc.filename))
+
+    try:
+        response = send_file(
+            path,
+            mimetype=mime_type,
+            download_name=doc.filename or doc.id,
+            conditional=True,
+            # content addressed, so the hash is a strong ETag
+            etag=blob_hash,
+        )
+    except RequestedRangeNotSatisfiable:
+        raise ExpectedError("Range is not satisfiable", 416)
+    # advertised on every response, such that e.g. pdf viewers use ranges
+    response.headers["Accept-Ranges"] = "bytes"
+
+    return response
 
 
 @document.route("/", methods=["DELETE"])
@@ -91,12 +358,278 @@ def delete_document(args):
         raise ExpectedError("No user is logged in", 401)
 
     try:
-        Document.prisma().delete(
+        doc = Document.prisma().delete(
             where={"id_tutorId": {"id": args["id"], "tutorId": session["user_id"]}}
         )
     except RecordNotFoundError:
+        doc = None
+
+    if doc is None:
         raise ExpectedError(
             "Document doesn't belong to user or no document exists with id", 400
         )
+    bump_version(User, doc.tutorId)
+    tutor_changed(doc.tutorId)
+
+    # its blob is deleted by the BlobCollector, unless another document with
+    # identical content refers to it
+    return jsonify({"success": True}), 200
+
+
+def chunk_count(upload: UploadSession) -> int:
+    return -(-upload.size // upload.chunkSize)
+
+
+def upload_json(upload: UploadSession) -> dict:
+    staging: UploadStaging = current_app.extensions["upload_staging"]
+    return {
+        "id": upload.id,
+        "chunkSize": upload.chunkSize,
+        "chunks": chunk_count(upload),
+        "received": staging.received(upload.id),
+    }
+
+
+def find_upload_session(session_id: str) -> UploadSession:
+    """Finds one of the session user's upload sessions, which hasn't expired
+
+    Raises:
+        ExpectedError: If the user is not logged in
+        ExpectedError: If there's no such upload session
+
+    """
+    if "user_id" not in session:
+        raise ExpectedError("No user is logged in", 401)
+
+    ttl = current_app.config["UPLOAD_SESSION_TTL"]
+    upload = UploadSession.prisma().find_first(
+        where={
+            "id": session_id,
+            "tutorId": session["user_id"],
+            "createdAt": {"gte": datetime.now(timezone.utc) - timedelta(seconds=ttl)},
+        }
+    )
+    if upload is None:
+        raise ExpectedError("Upload session does not exist", 404)
+
+    return upload
+
+
+def collect_expired_uploads():
+    """Deletes the upload sessions which expired before they were committed,
+    and their staged chunks, run every UPLOAD_GC_INTERVAL seconds by
+    Maintenance"""
+    ttl = current_app.config["UPLOAD_SESSION_TTL"]
+    UploadSession.prisma().delete_many(
+        where={"createdAt": {"lt": datetime.now(timezone.utc) - timedelta(seconds=ttl)}}
+    )
+    staging: UploadStaging = current_app.extensions["upload_staging"]
+    staging.discard_older_than(ttl)
+
+
+@document.route("/uploads", methods=["POST"])
+@error_decorator
+@validate_decorator("json", upload_session_schema)
+def create_upload(args):
+    """Starts a resumable upload of a document, which is sent in chunks (see
+    PUT /document/uploads/<id>/<index>) and then committed. Uploads expire
+    after UPLOAD_SESSION_TTL seconds.
+
+    Args:
+        size (int): The size of the document, in bytes
+        filename (str, optional): The name of the document's file
+        mimeType (str, optional): The mime type of the document
+
+    Returns:
+        id (str): The id of the upload
+        chunkSize (int): The size of every chunk but the last, in bytes
+        chunks (int): The number of chunks
+        received (list of int): The indexes of the chunks received (none)
+
+    Raises:
+        ExpectedError: If the user is not logged in
+        ExpectedError: If the user is not a tutor
+        ExpectedError: If the document is larger than DOCUMENT_MAX_SIZE
+
+    """
+    if "user_id" not in session:
+        raise ExpectedError("No user is logged in", 401)
+
+    if session_account_type() != "tutor":
+        raise ExpectedError("User is not a tutor", 401)
+
+    max_size = current_app.config["DOCUMENT_MAX_SIZE"]
+    if args["size"] > max_size:
+        raise ExpectedError(f"document is larger than {max_size} bytes", 413)
+
+    upload = UploadSession.prisma().create(
+        data={
+            "id": str(uuid4()),
+            "tutor": {"connect": {"id": session["user_id"]}},
+            "filename": args.get("filename"),
+            "mimeType": args.get("mimeType", "application/octet-stream"),
+            "size": args["size"],
+            "chunkSize": current_app.config["UPLOAD_CHUNK_SIZE"],
+        }
+    )
+    staging: UploadStaging = current_app.extensions["upload_staging"]
+    staging.create(upload.id)
+
+    return jsonify(upload_json(upload))
+
+
+@document.route("/uploads/<session_id>", methods=["GET"])
+@error_decorator
+def get_upload(session_id):
+    """Gets the progress of an upload, e.g. to resume it
+
+    Args:
+        session_id (str): The id of the upload
+
+    Returns:
+        id (str): The id of the upload
+        chunkSize (int): The size of every chunk but the last, in bytes
+        chunks (int): The number of chunks
+        received (list of int): The indexes of the chunks received
+
+    Raises:
+        ExpectedError: If the user is not logged in
+        ExpectedError: If the upload does not exist (or has expired)
+
+    """
+    return jsonify(upload_json(find_upload_session(session_id)))
+
+
+@document.route("/uploads/<session_id>/<int:index>", methods=["PUT"])
+@error_decorator
+def upload_chunk(session_id, index):
+    """Uploads a chunk of a document, the body being the chunk. Chunks can be
+    uploaded in any order, and uploading one again replaces it.
+
+    Headers:
+        X-Chunk-Sha256 (str): hex SHA-256 digest of the chunk
+
+    Args:
+        session_id (str): The id of the upload
+        index (int): The index of the chunk, from 0
+
+    Returns:
+        Response with status code 204
+
+    Raises:
+        ExpectedError: If the user is not logged in
+        ExpectedError: If the upload does not exist (or has expired)
+        ExpectedError: If the X-Chunk-Sha256 header is missing
+        ExpectedError: If the index is out of range
+        ExpectedError: If the chunk is the wrong size or doesn't match its digest
+
+    """
+    upload = find_upload_session(session_id)
+
+    sha256 = request.headers.get("X-Chunk-Sha256")
+    if sha256 is None:
+        raise ExpectedError("X-Chunk-Sha256 header is missing", 400)
+
+    chunks = chunk_count(upload)
+    if index >= chunks:
+        raise ExpectedError(f"index must be less than {chunks}", 400)
+
+    # every chunk is chunkSize bytes, but the last which has what's left
+    size = min(upload.chunkSize, upload.size - index * upload.chunkSize)
+    staging: UploadStaging = current_app.extensions["upload_staging"]
+    try:
+        staging.write_chunk(upload.id, index, request.stream, size, sha256)
+    except ChunkError as e:
+        raise ExpectedError(str(e), 400)
+    except FileNotFoundError:
+        # its chunks were collected, as it was about to expire
+        raise ExpectedError("Upload session does not exist", 404)
+
+    return Response(status=204)
+
+
+@document.route("/uploads/<session_id>/commit", methods=["POST"])
+@error_decorator
+@validate_decorator("json", upload_commit_schema)
+def commit_upload(args, session_id):
+    """Assembles an upload's chunks into a document, once every chunk has
+    been uploaded. The upload no longer exists afterwards.
+
+    Args:
+        session_id (str): The id of the upload
+        sha256 (str, optional): hex SHA-256 digest of the whole document
+
+    Returns:
+        id (str): The id of the document
+
+    Raises:
+        ExpectedError: If the user is not logged in
+        ExpectedError: If the upload does not exist (or has expired)
+        ExpectedError: If any chunks have not been uploaded
+        ExpectedError: If the document doesn't match sha256
+
+    """
+    upload = find_upload_session(session_id)
+
+    staging: UploadStaging = current_app.extensions["upload_staging"]
+    chunks = chunk_count(upload)
+    missing = chunks - len(staging.received(upload.id))
+    if missing > 0:
+        raise ExpectedError(f"{missing} chunk(s) have not been uploaded", 400)
+
+    store: BlobStore = current_app.extensions["blob_store"]
+    try:
+        blob = write_blob(store, staging.read(upload.id, chunks))
+    except FileNotFoundError:
+        # it was deleted, or its chunks were collected, since they were counted
+        raise ExpectedError("Upload session does not exist", 404)
+    if "sha256" in args and blob.hash != args["sha256"].lower():
+        # left for the BlobCollector, as nothing refers to it
+        raise ExpectedError("document does not match its checksum", 400)
+
+    prisma: Prisma = current_app.extensions["prisma"]
+    with prisma.tx() as transaction:
+        # only one commit of an upload creates a document
+        if UploadSession.prisma(transaction).delete_many(where={"id": upload.id}) == 0:
+            raise ExpectedError("Upload session does not exist", 404)
+
+        doc = Document.prisma(transaction).create(
+            data={
+                "id": str(uuid4()),
+                "tutor": {"connect": {"id": upload.tutorId}},
+                "blobHash": blob.hash,
+                "size": blob.size,
+                "mimeType": upload.mimeType,
+                "filename": upload.filename,
+            }
+        )
+        bump_version(User, upload.tutorId, transaction)
+    staging.discard(upload.id)
+    tutor_changed(upload.tutorId)
+
+    return jsonify({"id": doc.id})
+
+
+@document.route("/uploads/<session_id>", methods=["DELETE"])
+@error_decorator
+def delete_upload(session_id):
+    """Abandons an upload, discarding its chunks
+
+    Args:
+        session_id (str): The id of the upload
+
+    Returns:
+        success (bool): True
+
+    Raises:
+        ExpectedError: If the user is not logged in
+        ExpectedError: If the upload does not exist (or has expired)
+
+    """
+    upload = find_upload_session(session_id)
+
+    UploadSession.prisma().delete_many(where={"id": upload.id})
+    staging: UploadStaging = current_app.extensions["upload_staging"]
+    staging.discard(upload.id)
 
     return jsonify({"success": True}), 200
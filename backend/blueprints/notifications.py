@@ -1,12 +1,46 @@
-from flask import Blueprint, jsonify, session
+import json
+from time import monotonic
+from flask import Blueprint, Response, current_app, jsonify, session
+from flask import stream_with_context
+from prisma import Prisma
 from prisma.models import User, Notification
+from jsonschemas import batch_schema, notification_ack_schema
+from helpers.create_notification import (
+    count_unread_notifications,
+    recount_unread_notifications,
+)
+from helpers.notification_hub import NotificationHub
+from helpers.parse_ids import parse_ids
 from helpers.error_handlers import (
     ExpectedError,
     error_decorator,
+    validate_decorator,
 )
 
 notifications = Blueprint("notifications", __name__)
 
+# seconds between comments which keep idle streams from being closed by proxies
+STREAM_KEEPALIVE = 15
+
+
+def notification_json(notification: Notification) -> dict:
+    """Converts a notification into what the notification routes return
+
+    Args:
+        notification (Notification): the notification
+
+    Returns:
+        (dict): the notification, with its type derived from what it's about
+        and the number of messages it's about (see NOTIFICATION_COALESCING)
+
+    """
+    return {
+        "id": notification.id,
+        "type": "appointment" if notification.messageId is None else "message",
+        "content": notification.content,
+        "count": notification.count,
+    }
+
 
 @notifications.route("/", methods=["GET"])
 @error_decorator
@@ -40,9 +74,173 @@ def notifications_get():
         else []
     )
 
+    # every notification was just loaded anyway, so the counter is corrected
+    # should it have drifted
+    if user.unreadNotifications != len(notifications_l):
+        recount_unread_notifications(user.id)
+
     return jsonify({"notifications": notifications_l})
 
 
+@notifications.route("/count", methods=["GET"])
+@error_decorator
+def notifications_count():
+    """Returns the number of the session user's waiting notifications, from
+    a counter kept alongside them rather than counting them.
+
+    Returns:
+        count (int): the number of notifications
+
+    Raises:
+        ExpectedError: If the user is not logged in
+        ExpectedError: If the user does not exist
+
+    """
+    if "user_id" not in session:
+        raise ExpectedError("No user is logged in", 401)
+
+    user = User.prisma().find_unique(where={"id": session["user_id"]})
+
+    if user is None:
+        raise ExpectedError("User does not exist", 400)
+
+    return jsonify({"count": user.unreadNotifications})
+
+
+@notifications.route("/stream", methods=["GET"])
+@error_decorator
+def notifications_stream():
+    """Streams the ids of the session user's notifications as server-sent
+    events, replacing polling GET /notifications/.
+
+    On connecting every waiting notification is sent, followed by new ones as
+    they're created. Streams end after NOTIFICATION_STREAM_TIMEOUT seconds,
+    as each holds onto a worker thread, and EventSource reconnects by itself
+    (getting every waiting notification again, so none are missed). At most
+    NOTIFICATION_STREAM_LIMIT streams are open per worker, such that threads
+    are left for every other request, beyond which clients should poll.
+
+    Returns:
+        (text/event-stream): events whose data is a dictionary containing:
+            - id (str): the id of a notification
+
+    Raises:
+        ExpectedError: If the user is not logged in
+        ExpectedError: If the worker has as many streams open as it can
+
+    """
+    if "user_id" not in session:
+        raise ExpectedError("No user is logged in", 401)
+
+    user_id = session["user_id"]
+    hub: NotificationHub = current_app.extensions["notification_hub"]
+    timeout = current_app.config["NOTIFICATION_STREAM_TIMEOUT"]
+    if not hub.open_stream():
+        raise ExpectedError("Too many notification streams are open", 503)
+
+    def event(notification_id: str) -> str:
+        return f"data: {json.dumps({'id': notification_id})}\n\n"
+
+    def stream():
+        # subscribed before looking up waiting notifications such that none
+        # created in between are missed, at worst they're sent twice
+        with hub.subscribe(user_id) as subscription:
+            waiting = Notification.prisma().find_many(where={"userId": user_id})
+            for notification in waiting:
+                yield event(notification.id)
+
+            end = monotonic() + timeout
+            while (remaining := end - monotonic()) > 0:
+                notification_id = subscription.get(min(remaining, STREAM_KEEPALIVE))
+                if notification_id is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield event(notification_id)
+
+    response = Response(
+        stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # closed by the server once the stream ends or the client disconnects,
+    # even if the stream was never started
+    response.call_on_close(hub.close_stream)
+
+    return response
+
+
+@notifications.route("/details", methods=["GET"])
+@error_decorator
+@validate_decorator("query_string", batch_schema)
+def notifications_details(args):
+    """Returns the details of many of the session user's notifications at once,
+    without acknowledging them (see /notifications/ack).
+
+    Args:
+        ids (str): JSON list of notification ids
+
+    Returns:
+        notifications (list): in the order requested, ids which don't
+        correspond to a notification of the user are omitted, dictionaries
+        containing:
+            - id (str): the id of the notification
+            - type (str): the type of the notification
+            - content (str): the content of the notification
+            - count (int): the number of messages the notification is about
+
+    Raises:
+        ExpectedError: If the user is not logged in
+        ExpectedError: If ids is not a JSON list of at most 100 strings
+
+    """
+    if "user_id" not in session:
+        raise ExpectedError("No user is logged in", 401)
+
+    ids = parse_ids(args)
+    found = {
+        notification.id: notification
+        for notification in Notification.prisma().find_many(
+            where={"id": {"in": ids}, "userId": session["user_id"]}
+        )
+    }
+
+    return jsonify(
+        {"notifications": [notification_json(found[id]) for id in ids if id in found]}
+    )
+
+
+@notifications.route("/ack", methods=["POST"])
+@error_decorator
+@validate_decorator("json", notification_ack_schema)
+def notifications_ack(args):
+    """Acknowledges (i.e. deletes) many of the session user's notifications at
+    once.
+
+    Args:
+        ids (list of str): ids of the notifications
+
+    Returns:
+        acknowledged (int): the number of notifications acknowledged, ids which
+        don't correspond to a notification of the user are ignored
+
+    Raises:
+        ExpectedError: If the user is not logged in
+        ExpectedError: If ids is not a list of at most 100 strings
+
+    """
+    if "user_id" not in session:
+        raise ExpectedError("No user is logged in", 401)
+
+    prisma: Prisma = current_app.extensions["prisma"]
+    with prisma.tx() as transaction:
+        acknowledged = Notification.prisma(transaction).delete_many(
+            where={"id": {"in": args["ids"]}, "userId": session["user_id"]}
+        )
+        count_unread_notifications(session["user_id"], -acknowledged, transaction)
+
+    return jsonify({"acknowledged": acknowledged})
+
+
 @notifications.route("/<notificationId>", methods=["GET"])
 @error_decorator
 def notifications_get_by_id(notificationId):
@@ -55,6 +253,7 @@ def notifications_get_by_id(notificationId):
         id (str): the id of the notification
         type (str): the type of the notification
         content (str): the content of the notification
+        count (int): the number of messages the notification is about
 
     Raises:
         ExpectedError: If the user is not logged in
@@ -73,13 +272,11 @@ def notifications_get_by_id(notificationId):
     if notification.userId != session["user_id"]:
         raise ExpectedError("notification is not for this user", 403)
 
-    if notification.messageId is None:
-        type = "appointment"
-    elif notification.appointmentId is None:
-        type = "message"
-
-    Notification.prisma().delete(where={"id": notificationId})
+    prisma: Prisma = current_app.extensions["prisma"]
+    with prisma.tx() as transaction:
+        # already deleted if the notification was read concurrently
+        deleted = Notification.prisma(transaction).delete(where={"id": notificationId})
+        if deleted is not None:
+            count_unread_notifications(notification.userId, -1, transaction)
 
-    return jsonify(
-        {"id": notification.id, "type": type, "content": notification.content}
-    )
+    return jsonify(notification_json(notification))
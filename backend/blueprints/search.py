@@ -1,13 +1,10 @@
-import json
-import re
-from flask import Blueprint, jsonify
-from prisma.models import Tutor
+from flask import Blueprint, jsonify, current_app
 from jsonschemas import tutor_search_schema
-from helpers.process_time_block import process_time_block
-from helpers.rating_calc import rating_calc
+from helpers.tutor_search import parse_search_args, search_tutors
+from helpers.pagination import parse_page_args
+from helpers.tutor_search_index import TutorSearchIndex
 from helpers.error_handlers import (
     validate_decorator,
-    ExpectedError,
     error_decorator,
 )
 
@@ -28,86 +25,30 @@ def tutor_search(args):
         timeRange (dict): The time range of the tutor to search for (optional)
             - startTime (str): The start time of the time range
             - endTime (str): The end time of the time range
+        limit (int): The maximum number of tutors to return, at most 100 and 20
+            if omitted (optional)
+        cursor (str): The nextCursor of the previous page (optional)
 
     Returns:
-        tutorIds (list of str): list of tutor ids
+        tutorIds (list of str): list of tutor ids, sorted by relevance, rating
+            (descending) and then id
+        nextCursor (str | None): cursor of the next page, None if this is the last
 
     Raises:
         ExpectedError: if timeRange field is not a valid JSON
         ExpectedError: timeRange argument missing fields
         ExpectedError: if courseOfferings field is not a valid JSON
+        ExpectedError: if cursor is malformed
 
     """
     # * Note: timesAvailable should never overlap and is assumed not to
-    tutors = Tutor.prisma().find_many(
-        include={
-            "userInfo": True,
-            "ratings": True,
-            "courseOfferings": True,
-            "timesAvailable": {"order_by": {"startTime": "asc"}},
-        }
-    )
+    filters = parse_search_args(args)
+    page = parse_page_args(args)
 
-    if len(args) == 0:
-        return jsonify({"tutorIds": [tutor.id for tutor in tutors]}), 200
+    if current_app.config["TUTOR_SEARCH_INDEX"]:
+        index: TutorSearchIndex = current_app.extensions["tutor_search_index"]
+        tutor_ids, next_cursor = index.search(filters, page)
+    else:
+        tutor_ids, next_cursor = search_tutors(filters, page)
 
-    valid_tutors = []
-    for tutor in tutors:
-        valid = True
-
-        if "name" in args:
-            valid &= (
-                re.search(args["name"].lower().strip(), tutor.userInfo.name.lower())
-                is not None
-            )
-
-        if "timeRange" in args and len(tutor.timesAvailable) != 0:
-            try:
-                time_range = json.loads(args["timeRange"])
-            except json.decoder.JSONDecodeError:
-                raise ExpectedError("timeRange field must be valid JSON", 400)
-
-            if "startTime" not in time_range or "endTime" not in time_range:
-                raise ExpectedError("field(s) were missing in 'timeRange'", 400)
-
-            data = process_time_block(time_range)
-            st = data["startTime"]
-            et = data["endTime"]
-
-            # Note: datetimes extracted from the db are default UTC
-            valid &= any(
-                et >= times_available.startTime and st <= times_available.endTime
-                for times_available in tutor.timesAvailable
-            )
-        elif "timeRange" in args:
-            continue
-
-        if "location" in args and tutor.userInfo.location:
-            tutor_location = tutor.userInfo.location.lower().strip()
-            search_location = args["location"].lower().strip()
-            valid &= re.search(search_location, tutor_location) is not None
-        elif "location" in args:
-            continue
-
-        if "rating" in args:
-            # conversion required as rating is passed in a query string
-            valid &= rating_calc(tutor.ratings) >= float(args["rating"])
-
-        if "courseOfferings" in args:
-            # Although flask has a `get_list` method on request.args,
-            # due to how the current frontend is setup, this is more acceptable
-            try:
-                course_offerings = json.loads(args["courseOfferings"])
-            except json.decoder.JSONDecodeError:
-                raise ExpectedError("courseOfferings field must be valid JSON", 400)
-
-            args_offerings = [offerings.lower() for offerings in course_offerings]
-            valid &= any(
-                offerings.name.lower() in args_offerings
-                for offerings in tutor.courseOfferings
-            )
-
-        if valid:
-            valid_tutors.append(tutor.id)
-
-    return jsonify({"tutorIds": valid_tutors}), 200
+    return jsonify({"tutorIds": tutor_ids, "nextCursor": next_cursor}), 200
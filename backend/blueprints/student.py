@@ -1,9 +1,17 @@
-from flask import Blueprint, request, jsonify, session
+from collections import defaultdict
+from flask import Blueprint, request, jsonify, session, current_app
 from datetime import datetime, timezone
-from prisma.models import User
+from prisma import Prisma
+from prisma.models import Appointment, User, Rating
 from jsonschemas import student_modify_schema
+from helpers import identity_map
 from helpers.views import student_view
+from helpers.etag import etag_decorator, profile_version
 from helpers.admin_id_check import admin_id_check
+from helpers.check_user_account_type import forget_user
+from helpers.create_notification import uncount_deleted_user_notifications
+from helpers.rating_calc import lock_rating_aggregates, update_rating_aggregates
+from helpers.profile_cache import tutor_changed
 from helpers.error_handlers import (
     validate_decorator,
     ExpectedError,
@@ -15,6 +23,7 @@ student = Blueprint("student", __name__)
 
 @student.route("/<student_id>", methods=["GET"])
 @error_decorator
+@etag_decorator(lambda student_id: profile_version(student_id))
 def get_profile(student_id):
     """Get the profile of a student
 
@@ -105,8 +114,10 @@ def modify_profile(args):
             "profilePicture": profile_picture,
             "location": location,
             "phoneNumber": phone_number,
+            "version": {"increment": 1},
         },
     )
+    identity_map.forget()
 
     return jsonify({"success": True}), 200
 
@@ -140,7 +151,44 @@ def delete_profile():
     if not student:
         raise ExpectedError("Profile does not exist", 404)
 
-    User.prisma().delete(where={"id": mod_id})
+    prisma: Prisma = current_app.extensions["prisma"]
+    with prisma.tx() as transaction:
+        # ratings of the student's appointments are cascade deleted with them,
+        # so they need to be removed from their tutors' rating aggregates. The
+        # tutors are locked (in order, so deletes can't deadlock each other)
+        # before the ratings are read, so they can't change in between.
+        tutor_ids = sorted(
+            {
+                appointment.tutorId
+                for appointment in Appointment.prisma(transaction).find_many(
+                    where={"studentId": mod_id}
+                )
+            }
+        )
+        for tutor_id in tutor_ids:
+            lock_rating_aggregates(tutor_id, transaction)
+        ratings = Rating.prisma(transaction).find_many(
+            where={"appointment": {"is": {"studentId": mod_id}}}
+        )
+        rating_totals = defaultdict(int)
+        rating_counts = defaultdict(int)
+        for rating in ratings:
+            rating_totals[rating.tutorId] += rating.score
+            rating_counts[rating.tutorId] += 1
+
+        uncount_deleted_user_notifications(mod_id, transaction)
+        User.prisma(transaction).delete(where={"id": mod_id})
+        for tutor_id in rating_totals:
+            update_rating_aggregates(
+                tutor_id,
+                -rating_totals[tutor_id],
+                -rating_counts[tutor_id],
+                transaction,
+            )
+
+    for tutor_id in rating_totals:
+        tutor_changed(tutor_id)
+    forget_user(mod_id)
 
     return jsonify({"success": True}), 200
 
@@ -165,7 +213,7 @@ def get_appointment_lists():
     if "user_id" not in session:
         raise ExpectedError("No user is logged in", 401)
 
-    student = student_view(id=session["user_id"])
+    student = student_view(id=session["user_id"], include={"appointments"})
     if not student:
         raise ExpectedError("Current user is not a student", 400)
 
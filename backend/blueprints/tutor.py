@@ -1,10 +1,17 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, current_app
+from prisma import Prisma
 from prisma.models import Tutor, Subject, User
-from jsonschemas import tutor_modify_schema
+from jsonschemas import tutor_modify_schema, batch_schema
 from helpers.process_time_block import process_time_block
-from helpers.views import tutor_view
+from helpers.availability import find_overlap
+from helpers.views import TutorView, tutor_view, tutor_views
+from helpers.etag import bump_version, etag_decorator, profile_version
+from helpers.parse_ids import parse_ids
 from helpers.admin_id_check import admin_id_check
+from helpers.check_user_account_type import forget_user
+from helpers.create_notification import uncount_deleted_user_notifications
 from helpers.rating_calc import rating_calc
+from helpers.profile_cache import ProfileCache, tutor_changed
 from helpers.error_handlers import (
     validate_decorator,
     ExpectedError,
@@ -13,6 +20,9 @@ from helpers.error_handlers import (
 
 tutor = Blueprint("tutor", __name__)
 
+# relations shown on a tutor's public profile
+PROFILE_RELATIONS = {"courseOfferings", "timesAvailable", "documents"}
+
 
 def addingSubjects(course_offerings, tutor):
     """Adds the subjects to the tutor's course offerings
@@ -35,6 +45,8 @@ def addingSubjects(course_offerings, tutor):
         },
     )
 
+    tutor_changed(tutor.id)
+
     # tutor is changing their subjects offered to zero
     if course_offerings is None or len(course_offerings) == 0:
         return
@@ -65,43 +77,87 @@ def addingTimes(times_available, tutor):
         ExpectedError: If the times_available are overlapping
 
     """
+    formatted_availabilities = (
+        []
+        if times_available is None
+        else [process_time_block(t) for t in times_available]
+    )
+    # validate before wiping the previous availabilities, such that they're kept
+    # when the new ones are invalid
+    if find_overlap((t["startTime"], t["endTime"]) for t in formatted_availabilities):
+        raise ExpectedError("Time availabilities should not overlap", 400)
+
     # tutor is adding/deleting timesAvailable
     # wipe previous stuff, if there is any
     Tutor.prisma().update(
         where={"id": tutor.id}, data={"timesAvailable": {"deleteMany": {}}}
     )
+    tutor_changed(tutor.id)
 
-    if times_available is None or len(times_available) == 0:
+    if len(formatted_availabilities) == 0:
         return
 
-    formatted_availabilities = sorted(
-        map(lambda t: process_time_block(t), times_available),
-        key=lambda d: d["startTime"],
+    # create all the tutoravailability records again with the new timesAvailable
+    Tutor.prisma().update(
+        where={"id": tutor.id},
+        data={"timesAvailable": {"create": formatted_availabilities}},
     )
 
-    to_create = []
-    prev_block = None
-    # create all the tutoravailability records again with the new timesAvailable
-    for i, time_block in enumerate(formatted_availabilities):
-        if i == 0:
-            to_create.append(time_block)
-            prev_block = time_block
-            continue
 
-        if prev_block["endTime"] > time_block["startTime"]:
-            raise ExpectedError("Time availabilities should not overlap", 400)
+def tutor_profile(tutor: TutorView) -> dict:
+    """Converts a tutor into the public profile returned by the tutor routes
+
+    Args:
+        tutor (TutorView): the tutor, with its courseOfferings, timesAvailable
+            and documents loaded
 
-        to_create.append(time_block)
-        prev_block = time_block
+    Returns:
+        (dict): the tutor's profile
 
-    Tutor.prisma().update(
-        where={"id": tutor.id},
-        data={"timesAvailable": {"create": to_create}},
-    )
+    """
+    if tutor.course_offerings is None:
+        course_offerings = []
+    else:
+        course_offerings = list(map(lambda c: c.name, tutor.course_offerings))
+
+    if tutor.times_available is None:
+        times_available = []
+    else:
+        times_available = list(
+            map(
+                lambda d: {
+                    "startTime": d.startTime.isoformat(),
+                    "endTime": d.endTime.isoformat(),
+                },
+                tutor.times_available,
+            )
+        )
+
+    rating = rating_calc(tutor.rating_sum, tutor.rating_count)
+
+    if tutor.documents is None:
+        documents = []
+    else:
+        documents = list(map(lambda d: d.id, tutor.documents))
+
+    return {
+        "id": tutor.id,
+        "name": tutor.name,
+        "bio": tutor.bio if tutor.bio else "",
+        "email": tutor.email,
+        "rating": rating,
+        "profilePicture": tutor.profile_picture,
+        "location": tutor.location,
+        "phoneNumber": tutor.phone_number,
+        "courseOfferings": course_offerings,
+        "timesAvailable": times_available,
+        "documentIds": documents,
+    }
 
 
 @tutor.route("/<tutor_id>", methods=["GET"])
 @error_decorator
+@etag_decorator(lambda tutor_id: profile_version(tutor_id))
 def get_profile(tutor_id):
     """Get the profile of a tutor
 
@@ -125,53 +181,41 @@ def get_profile(tutor_id):
         ExpectedError: If the times_available are overlapping
 
     """
-    tutor = tutor_view(id=tutor_id)
-    if tutor is None:
-        raise ExpectedError("Profile does not exist", 404)
+    # found (once per request) by the etag_decorator
+    version = profile_version(tutor_id)
+    cache: ProfileCache = current_app.extensions["profile_cache"]
+    profile = cache.get(tutor_id, version) if version is not None else None
+    if profile is None:
+        tutor = tutor_view(id=tutor_id, include=PROFILE_RELATIONS)
+        if tutor is None:
+            raise ExpectedError("Profile does not exist", 404)
 
-    if tutor.course_offerings is None:
-        course_offerings = []
-    else:
-        course_offerings = list(map(lambda c: c.name, tutor.course_offerings))
+        profile = tutor_profile(tutor)
+        cache.set(tutor_id, version, profile)
 
-    if tutor.times_available is None:
-        times_available = []
-    else:
-        times_available = list(
-            map(
-                lambda d: {
-                    "startTime": d.startTime.isoformat(),
-                    "endTime": d.endTime.isoformat(),
-                },
-                tutor.times_available,
-            )
-        )
+    return jsonify(profile)
 
-    if tutor.ratings is None:
-        rating = 0
-    else:
-        rating = rating_calc(tutor.ratings)
 
-    if tutor.documents is None:
-        documents = []
-    else:
-        documents = list(map(lambda d: d.id, tutor.documents))
+@tutor.route("/batch", methods=["GET"])
+@error_decorator
+@validate_decorator("query_string", batch_schema)
+def get_profiles(args):
+    """Get the profiles of many tutors at once
 
-    return jsonify(
-        {
-            "id": tutor.id,
-            "name": tutor.name,
-            "bio": tutor.bio if tutor.bio else "",
-            "email": tutor.email,
-            "rating": rating,
-            "profilePicture": tutor.profile_picture,
-            "location": tutor.location,
-            "phoneNumber": tutor.phone_number,
-            "courseOfferings": course_offerings,
-            "timesAvailable": times_available,
-            "documentIds": documents,
-        }
-    )
+    Args:
+        ids (list of str): JSON list of the ids of the tutors to get, at most 100
+
+    Returns:
+        tutors (list of dict): the profiles of the tutors which exist, in the order
+            of ids, in the same shape as returned by `/tutor/<tutor_id>`
+
+    Raises:
+        ExpectedError: if ids is not a valid JSON list of strings
+        ExpectedError: if too many ids are requested
+
+    """
+    tutors = tutor_views(parse_ids(args), include=PROFILE_RELATIONS)
+    return jsonify({"tutors": [tutor_profile(tutor) for tutor in tutors]})
 
 
 @tutor.route("/profile", methods=["PUT"])
@@ -206,7 +250,7 @@ def modify_profile(args):
 
     modify_tutor_id = admin_id_check(args)
 
-    tutor = tutor_view(id=modify_tutor_id)
+    tutor = tutor_view(id=modify_tutor_id, include={"courseOfferings"})
     if tutor is None:
         raise ExpectedError("Profile does not exist", 404)
 
@@ -223,23 +267,29 @@ def modify_profile(args):
     phone_number = (
         tutor.phone_number if "phoneNumber" not in args else args["phoneNumber"]
     )
-    if "courseOfferings" in args:
-        addingSubjects(args["courseOfferings"], tutor)
-
-    if "timesAvailable" in args:
-        addingTimes(args["timesAvailable"], tutor)
-
-    User.prisma().update(
-        where={"id": tutor.id},
-        data={
-            "name": name,
-            "bio": bio,
-            "email": email,
-            "profilePicture": profile_picture,
-            "location": location,
-            "phoneNumber": phone_number,
-        },
-    )
+    try:
+        if "courseOfferings" in args:
+            addingSubjects(args["courseOfferings"], tutor)
+
+        if "timesAvailable" in args:
+            addingTimes(args["timesAvailable"], tutor)
+
+        User.prisma().update(
+            where={"id": tutor.id},
+            data={
+                "name": name,
+                "bio": bio,
+                "email": email,
+                "profilePicture": profile_picture,
+                "location": location,
+                "phoneNumber": phone_number,
+            },
+        )
+    finally:
+        # even when only some of the changes were made e.g. the subjects but
+        # not the (invalid) times
+        bump_version(User, tutor.id)
+    tutor_changed(tutor.id)
 
     return jsonify({"success": True})
 
@@ -267,7 +317,7 @@ def delete_profile():
 
     delete_tutor_id = admin_id_check(args)
 
-    tutor = tutor_view(id=delete_tutor_id)
+    tutor = tutor_view(id=delete_tutor_id, include={"courseOfferings"})
     if tutor is None:
         raise ExpectedError("Profile does not exist", 404)
 
@@ -283,7 +333,12 @@ def delete_profile():
         },
     )
 
-    User.prisma().delete(where={"id": tutor.id})
+    prisma: Prisma = current_app.extensions["prisma"]
+    with prisma.tx() as transaction:
+        uncount_deleted_user_notifications(tutor.id, transaction)
+        User.prisma(transaction).delete(where={"id": tutor.id})
+    tutor_changed(tutor.id)
+    forget_user(tutor.id)
 
     return jsonify({"success": True})
 
@@ -304,7 +359,7 @@ def get_tutor_appointments(tutor_id):
         ExpectedError: No tutor related to the id
 
     """
-    tutor = tutor_view(id=tutor_id)
+    tutor = tutor_view(id=tutor_id, include={"appointments"})
 
     if tutor is None:
         raise ExpectedError("no tutor relates to the id", 404)
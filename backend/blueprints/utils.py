@@ -1,7 +1,7 @@
 from flask import Blueprint, jsonify, session
-from prisma.models import User
 from helpers.error_handlers import error_decorator
-from helpers.check_user_account_type import check_type
+from helpers.check_user_account_type import account_type, session_account_type
+from helpers.etag import etag_decorator
 
 utils = Blueprint("utils", __name__)
 
@@ -16,20 +16,17 @@ def get_id():
         accountType (str): The account type of the user
 
     """
-    if "user_id" in session:
-        user = User.prisma().find_unique(
-            where={"id": session["user_id"]},
-            include={"adminInfo": True, "studentInfo": True, "tutorInfo": True},
-        )
-        if user is None:
-            return jsonify({}), 404
-        return jsonify({"id": session["user_id"], "accountType": check_type(user)}), 200
-    else:
+    user_type = session_account_type()
+    if user_type is None:
         return jsonify({}), 404
 
+    return jsonify({"id": session["user_id"], "accountType": user_type}), 200
+
 
 @utils.route("/usertype/<user_id>", methods=["GET"])
 @error_decorator
+# account types never change
+@etag_decorator(lambda user_id: account_type(user_id))
 def get_type(user_id):
     """Gets the account type of the user logged in.
 
@@ -37,10 +34,8 @@ def get_type(user_id):
         accountType (str): The account type of the user
 
     """
-    user = User.prisma().find_unique(
-        where={"id": user_id},
-        include={"adminInfo": True, "studentInfo": True, "tutorInfo": True},
-    )
-    if user is None:
+    user_type = account_type(user_id)
+    if user_type is None:
         return jsonify({}), 404
-    return jsonify({"accountType": check_type(user)}), 200
+
+    return jsonify({"accountType": user_type}), 200
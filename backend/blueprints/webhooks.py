@@ -0,0 +1,49 @@
+from datetime import datetime, timezone
+from flask import Blueprint, current_app, jsonify, request
+from pusher import Pusher
+from helpers.error_handlers import ExpectedError, error_decorator
+from helpers.occupancy import record_occupancy
+
+webhooks = Blueprint("webhooks", __name__)
+
+# channel existence events, see https://pusher.com/docs/channels/server_api/webhooks
+OCCUPANCY_EVENTS = {"channel_occupied": True, "channel_vacated": False}
+
+
+@webhooks.route("/pusher", methods=["POST"])
+@error_decorator
+def pusher_webhook():
+    """Receives pusher's webhooks, recording which channels are occupied.
+
+    Headers:
+        X-Pusher-Key (str): the app key the webhook was signed with
+        X-Pusher-Signature (str): HMAC SHA256 of the body
+
+    Args:
+        time_ms (int): when the events happened, in ms since the epoch
+        events (list): list of dictionaries containing:
+            - name (str): the name of the event
+            - channel (str): the channel the event happened on
+
+    Returns:
+        success (bool): True
+
+    Raises:
+        ExpectedError: if the webhook isn't signed by pusher (or is too old)
+
+    """
+    pusher_client: Pusher = current_app.extensions["pusher"]
+    webhook = pusher_client.validate_webhook(
+        key=request.headers.get("X-Pusher-Key", ""),
+        signature=request.headers.get("X-Pusher-Signature", ""),
+        body=request.get_data(as_text=True),
+    )
+    if webhook is None:
+        raise ExpectedError("Webhook is invalid", 401)
+
+    at = datetime.fromtimestamp(webhook["time_ms"] / 1000, timezone.utc)
+    for event in webhook.get("events", []):
+        if event.get("name") in OCCUPANCY_EVENTS:
+            record_occupancy(event["channel"], OCCUPANCY_EVENTS[event["name"]], at)
+
+    return jsonify({"success": True}), 200
@@ -5,7 +5,9 @@ from multiprocessing import cpu_count
 
 wsgi_app = "wsgi:app"
 workers = 4
-threads = 2
+# notification streams (/notifications/stream) each hold a thread, at most
+# NOTIFICATION_STREAM_LIMIT (4) per worker, which leaves the rest for requests
+threads = 8
 worker_class = "gthread"
 loglevel = "critical"
 
@@ -1,13 +1,12 @@
 from flask import session
-from helpers.views import admin_view
+from helpers.check_user_account_type import session_account_type
 from helpers.error_handlers import ExpectedError
 
 
 # Function that checks admin permissions and returns the respective id
 def admin_id_check(args) -> str:
     # Check if admin
-    admin = admin_view(id=session["user_id"])
-    if admin:
+    if session_account_type() == "admin":
         # Check id in args if admin
         if "id" not in args:
             raise ExpectedError("id field was missing", 400)
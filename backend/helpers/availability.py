@@ -0,0 +1,137 @@
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from itertools import accumulate
+from typing import Generic, Iterable, List, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# (startTime, endTime, value associated with the interval e.g. its tutor id)
+Interval = Tuple[datetime, datetime, T]
+
+
+def find_overlap(
+    blocks: Iterable[Tuple[datetime, datetime]],
+) -> Tuple[Tuple[datetime, datetime], Tuple[datetime, datetime]] | None:
+    """Finds a pair of overlapping time blocks, blocks which only touch at
+    their ends (i.e. one ends when the next starts) don't overlap.
+
+    Args:
+        blocks (iterable of (datetime, datetime)): (startTime, endTime) pairs
+
+    Returns:
+        (tuple | None): the first overlapping pair of blocks if there is one
+
+    """
+    prev_block = None
+    for block in sorted(blocks, key=lambda b: b[0]):
+        if prev_block is not None and prev_block[1] > block[0]:
+            return prev_block, block
+
+        prev_block = block
+
+    return None
+
+
+def overlaps_any(
+    blocks: Iterable[Tuple[datetime, datetime]], start: datetime, end: datetime
+) -> bool:
+    """Whether any time block overlaps [start, end], blocks which only touch
+    it at their ends don't. A single pass, so cheaper than an IntervalIndex
+    when there's only one query to answer.
+
+    Args:
+        blocks (iterable of (datetime, datetime)): (startTime, endTime) pairs
+        start (datetime): start of the block to check
+        end (datetime): end of the block to check
+
+    """
+    return any(st < end and et > start for st, et in blocks)
+
+
+class IntervalIndex(Generic[T]):
+    """A static index over (possibly overlapping) time intervals, e.g. all of a
+    tutor's availabilities, or every availability of every tutor, which answers
+    'which intervals overlap [start, end]' in O(log n + number of results).
+
+    Intervals are sorted by their start, such that all intervals starting
+    before `end` are a prefix, and of those, the ones overlapping are the ones
+    which end after `start`. The prefix maximum of end times decides if there
+    is any such interval, and a max end time segment tree finds all of them,
+    only descending into subtrees which contain at least one.
+
+    If `closed`, intervals are treated as [start, end] so touching intervals
+    overlap (as tutor search does), otherwise they're treated as [start, end)
+    (as appointments do).
+    """
+
+    def __init__(self, intervals: Iterable[Interval]):
+        self._intervals: List[Interval] = sorted(intervals, key=lambda i: i[0])
+        self._starts = [interval[0] for interval in self._intervals]
+        self._max_ends = list(accumulate((i[1] for i in self._intervals), max))
+
+        # tree[1] is the root, node i has children 2i and 2i + 1
+        self._tree: List[datetime | None] = [None] * (4 * len(self._intervals))
+        if len(self._intervals) != 0:
+            self._build(1, 0, len(self._intervals))
+
+    def __len__(self) -> int:
+        return len(self._intervals)
+
+    def __iter__(self):
+        return iter(self._intervals)
+
+    def _build(self, node: int, lo: int, hi: int) -> datetime:
+        if hi - lo == 1:
+            self._tree[node] = self._intervals[lo][1]
+        else:
+            mid = (lo + hi) // 2
+            self._tree[node] = max(
+                self._build(2 * node, lo, mid), self._build(2 * node + 1, mid, hi)
+            )
+
+        return self._tree[node]
+
+    def _prefix_length(self, end: datetime, closed: bool) -> int:
+        # number of intervals which start before end
+        if closed:
+            return bisect_right(self._starts, end)
+        return bisect_left(self._starts, end)
+
+    @staticmethod
+    def _ends_after(interval_end: datetime, start: datetime, closed: bool) -> bool:
+        return interval_end >= start if closed else interval_end > start
+
+    def any_overlapping(
+        self, start: datetime, end: datetime, closed: bool = True
+    ) -> bool:
+        """Whether any interval overlaps [start, end], in O(log n)"""
+        k = self._prefix_length(end, closed)
+        return k != 0 and self._ends_after(self._max_ends[k - 1], start, closed)
+
+    def overlapping(
+        self, start: datetime, end: datetime, closed: bool = True
+    ) -> List[T]:
+        """The values of every interval overlapping [start, end], ordered by the
+        intervals' start, in O(log n + number of results)"""
+        k = self._prefix_length(end, closed)
+        if k == 0:
+            return []
+
+        found = []
+        # iterative depth first traversal, (node, lo, hi)
+        stack = [(1, 0, len(self._intervals))]
+        while len(stack) != 0:
+            node, lo, hi = stack.pop()
+            if lo >= k or not self._ends_after(self._tree[node], start, closed):
+                continue
+
+            if hi - lo == 1:
+                found.append(self._intervals[lo][2])
+                continue
+
+            mid = (lo + hi) // 2
+            # right child first, so the left one is popped (and found) first
+            stack.append((2 * node + 1, mid, hi))
+            stack.append((2 * node, lo, mid))
+
+        return found
@@ -0,0 +1,357 @@
+import hashlib
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from time import time
+from typing import (
+    BinaryIO,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Protocol,
+    Set,
+)
+from urllib.parse import quote
+from uuid import uuid4
+
+# Documents (and anything else large) are stored as blobs outside the db, keyed
+# by the sha256 of their content such that identical uploads are only stored
+# once. Rows only refer to blobs by their hash, see Document.blobHash, and
+# blobs nothing refers to are deleted later on by a BlobCollector.
+
+# bytes read/written at a time when streaming blobs
+CHUNK_SIZE = 64 * 1024
+
+
+class Blob(NamedTuple):
+    hash: str
+    size: int
+
+
+class BlobStore(Protocol):
+    def exists(self, key: str) -> bool: ...
+
+    def put(self, key: str, path: str):
+        """Stores the (local, temporary) file at path as the blob key, taking
+        ownership of the file. If the blob already exists the file is removed,
+        and the blob is marked as put now (see delete_older_than)."""
+        ...
+
+    def open(self, key: str) -> BinaryIO:
+        """Opens a blob for reading.
+
+        Raises:
+            FileNotFoundError: if the blob does not exist
+
+        """
+        ...
+
+    def size(self, key: str) -> int: ...
+
+    def local_path(self, key: str) -> str | None:
+        """Path of a blob on the local filesystem, if it's stored there"""
+        ...
+
+    def download_url(
+        self, key: str, mime_type: str | None, filename: str | None
+    ) -> str | None:
+        """URL from which clients can download a blob themselves, if the
+        store serves blobs"""
+        ...
+
+    def list_older_than(self, age: float) -> Iterator[str]:
+        """Keys of the blobs last put more than age seconds ago"""
+        ...
+
+    def delete_older_than(self, key: str, age: float) -> bool:
+        """Deletes a blob, unless it was put within the last age seconds
+
+        Returns:
+            (bool): whether it was deleted
+
+        """
+        ...
+
+    def spool_dir(self) -> str:
+        """Directory for files on their way into the store"""
+        ...
+
+
+class FileSystemBlobStore:
+    """Stores blobs as files under a directory, fanned out by the first bytes
+    of their hash e.g. <root>/ab/cd/abcd..."""
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.spool_dir(), exist_ok=True)
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self.local_path(key))
+
+    def put(self, key: str, path: str):
+        try:
+            os.utime(self.local_path(key))
+            os.remove(path)
+            return
+        except FileNotFoundError:
+            # doesn't exist, or was just deleted
+            pass
+
+        os.makedirs(os.path.dirname(self.local_path(key)), exist_ok=True)
+        # atomic, so a blob is either whole or absent, even with concurrent puts
+        os.replace(path, self.local_path(key))
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.local_path(key), "rb")
+
+    def size(self, key: str) -> int:
+        return os.path.getsize(self.local_path(key))
+
+    def download_url(
+        self, key: str, mime_type: str | None, filename: str | None
+    ) -> None:
+        return None
+
+    def list_older_than(self, age: float) -> Iterator[str]:
+        cutoff = time() - age
+        for directory, subdirectories, files in os.walk(self.root):
+            if directory == self.root:
+                # files being spooled aren't blobs yet
+                subdirectories[:] = [
+                    name
+                    for name in subdirectories
+                    if os.path.join(directory, name) != self.spool_dir()
+                ]
+            for name in files:
+                # moved aside to be deleted (see delete_older_than)
+                if "." in name:
+                    continue
+                try:
+                    if os.path.getmtime(os.path.join(directory, name)) < cutoff:
+                        yield name
+                except FileNotFoundError:
+                    pass
+
+    def delete_older_than(self, key: str, age: float) -> bool:
+        path = self.local_path(key)
+        # moved aside first, so a put either happened beforehand (and is seen
+        # below) or finds no blob and stores it again
+        deleting = f"{path}.{uuid4().hex}"
+        try:
+            os.rename(path, deleting)
+        except FileNotFoundError:
+            return False
+
+        if os.path.getmtime(deleting) >= time() - age:
+            # if it was stored again meanwhile, it has the same content anyway
+            os.replace(deleting, path)
+            return False
+
+        os.remove(deleting)
+        return True
+
+    def spool_dir(self) -> str:
+        # within root, such that spooled files can be renamed into place
+        return os.path.join(self.root, "tmp")
+
+
+class S3BlobStore:
+    """Stores blobs as objects in an S3 (compatible) bucket, which needs `boto3`.
+    Credentials are found by boto3 e.g. from AWS_ACCESS_KEY_ID and
+    AWS_SECRET_ACCESS_KEY."""
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "blobs/",
+        endpoint_url: str | None = None,
+        spool_dir: str | None = None,
+        url_expiry: int = 300,
+    ):
+        # imported here as it's only needed by this (optional) store
+        import boto3
+        from botocore.exceptions import ClientError
+
+        self._ClientError = ClientError
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.url_expiry = url_expiry
+        self._spool_dir = spool_dir or tempfile.gettempdir()
+        os.makedirs(self._spool_dir, exist_ok=True)
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def _head(self, key: str) -> dict | None:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except self._ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def exists(self, key: str) -> bool:
+        return self._head(key) is not None
+
+    def _touch(self, key: str) -> bool:
+        """Copies an object onto itself, which updates when it was last
+        modified, False if it doesn't exist"""
+        try:
+            self.client.copy_object(
+                Bucket=self.bucket,
+                Key=self._key(key),
+                CopySource={"Bucket": self.bucket, "Key": self._key(key)},
+                MetadataDirective="REPLACE",
+            )
+            return True
+        except self._ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put(self, key: str, path: str):
+        try:
+            if not self._touch(key):
+                self.client.upload_file(path, self.bucket, self._key(key))
+        finally:
+            os.remove(path)
+
+    def open(self, key: str) -> BinaryIO:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except self.client.exceptions.NoSuchKey:
+            raise FileNotFoundError(key)
+        return response["Body"]
+
+    def size(self, key: str) -> int:
+        head = self._head(key)
+        if head is None:
+            raise FileNotFoundError(key)
+        return head["ContentLength"]
+
+    def local_path(self, key: str) -> None:
+        return None
+
+    def download_url(
+        self, key: str, mime_type: str | None, filename: str | None
+    ) -> str:
+        # presigned, so S3 handles Range and conditional requests itself
+        params = {"Bucket": self.bucket, "Key": self._key(key)}
+        if mime_type is not None:
+            params["ResponseContentType"] = mime_type
+        if filename is not None:
+            params["ResponseContentDisposition"] = (
+                f"inline; filename*=UTF-8''{quote(filename)}"
+            )
+
+        return self.client.generate_presigned_url(
+            "get_object", Params=params, ExpiresIn=self.url_expiry
+        )
+
+    def list_older_than(self, age: float) -> Iterator[str]:
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=age)
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get("Contents", []):
+                if obj["LastModified"] < cutoff:
+                    yield obj["Key"][len(self.prefix) :]
+
+    def delete_older_than(self, key: str, age: float) -> bool:
+        # S3 can't delete conditionally, so a put in between the check and the
+        # delete is lost. The check makes that window short, as is the time
+        # between putting a blob and referring to it.
+        head = self._head(key)
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=age)
+        if head is None or head["LastModified"] >= cutoff:
+            return False
+
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+        return True
+
+    def spool_dir(self) -> str:
+        return self._spool_dir
+
+
+def write_blob(store: BlobStore, chunks: Iterable[bytes]) -> Blob:
+    """Streams content into a store, through a spooled file such that it
+    never has to be held in memory as a whole.
+
+    Args:
+        store (BlobStore): the store
+        chunks (iterable of bytes): the content
+
+    Returns:
+        (Blob): the hash (i.e. key) and size of the blob
+
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(dir=store.spool_dir())
+    try:
+        with os.fdopen(fd, "wb") as spooled:
+            for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                spooled.write(chunk)
+        store.put(digest.hexdigest(), path)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+    return Blob(digest.hexdigest(), size)
+
+
+def read_chunks(file: BinaryIO) -> Iterable[bytes]:
+    """Reads a file CHUNK_SIZE bytes at a time"""
+    while chunk := file.read(CHUNK_SIZE):
+        yield chunk
+
+
+class BlobCollector:
+    """Deletes the blobs nothing refers to e.g. those of deleted documents,
+    including those cascade deleted with their tutor. Run periodically by
+    Maintenance (see helpers/maintenance.py).
+
+    Blobs are only deleted once they haven't been put for `grace` seconds, far
+    longer than it takes to refer to a blob after putting it, such that one
+    which is about to be referred to is never deleted.
+    """
+
+    # keys checked for references at a time
+    BATCH_SIZE = 500
+
+    def __init__(self, grace: float):
+        self.grace = grace
+
+    def collect(
+        self, store: BlobStore, referenced: Callable[[List[str]], Set[str]]
+    ) -> int:
+        """Deletes the blobs nothing refers to, which are older than grace
+
+        Args:
+            store (BlobStore): the store
+            referenced (callable): finds which of the keys it's given are
+                referred to
+
+        Returns:
+            (int): the number of blobs deleted
+
+        """
+        deleted = 0
+        keys = store.list_older_than(self.grace)
+        while batch := list(islice(keys, self.BATCH_SIZE)):
+            in_use = referenced(batch)
+            for key in batch:
+                # checked again, as it may have been put again since it was listed
+                if key not in in_use and store.delete_older_than(key, self.grace):
+                    deleted += 1
+
+        return deleted
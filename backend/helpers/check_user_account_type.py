@@ -1,4 +1,10 @@
+from flask import current_app, session
 from prisma.models import User
+from helpers import identity_map
+from helpers.ttl_cache import TTLCache
+
+# includes required by `check_type`
+ACCOUNT_TYPE_INCLUDE = {"adminInfo": True, "studentInfo": True, "tutorInfo": True}
 
 
 # ! Note: requires a user with all fields INCLUDED
@@ -12,3 +18,67 @@ def check_type(user: User) -> str:
         return "student"
 
     return "N/A"
+
+
+# Account types never change after an account is created, so they're cached
+# both in the session of the logged in user, and per worker for any user.
+# Only deleting an account invalidates them, which also ends their sessions
+# such that none are left with the type of a user who doesn't exist.
+
+
+def account_type(user_id: str) -> str | None:
+    """The account type of a user, cached per worker
+
+    Args:
+        user_id (str): the id of the user
+
+    Returns:
+        (str | None): the account type, None if the user doesn't exist
+
+    """
+    cache: TTLCache[str, str] = current_app.extensions["account_type_cache"]
+    user_type = cache.get(user_id)
+    if user_type is None:
+        user = User.prisma().find_unique(
+            where={"id": user_id}, include=ACCOUNT_TYPE_INCLUDE
+        )
+        if user is None:
+            return None
+
+        user_type = check_type(user)
+        cache.set(user_id, user_type)
+
+    return user_type
+
+
+def session_account_type() -> str | None:
+    """The account type of the logged in user, which is stored in their session
+    on login/registration (and on first use for sessions from before then)
+
+    Returns:
+        (str | None): the account type, None if no (existing) user is logged in
+
+    """
+    if "user_id" not in session:
+        return None
+
+    if "account_type" not in session:
+        user_type = account_type(session["user_id"])
+        if user_type is None:
+            return None
+
+        session["account_type"] = user_type
+
+    return session["account_type"]
+
+
+def forget_user(user_id: str):
+    """Invalidates the cached account type of a deleted user, and anything
+    else cached about them, and logs them out of every session, including the
+    current one if it's theirs"""
+    cache: TTLCache[str, str] = current_app.extensions["account_type_cache"]
+    cache.delete(user_id)
+    current_app.session_interface.end_user_sessions(user_id)
+    if session.get("user_id") == user_id:
+        session.clear()
+    identity_map.forget()
@@ -0,0 +1,180 @@
+from collections import Counter
+from uuid import uuid4
+from flask import current_app
+from prisma import Prisma
+from prisma.errors import UniqueViolationError
+from prisma.models import Notification, User
+from helpers.notification_hub import NotificationHub
+
+
+def create_notification(
+    user_id: str,
+    content: str,
+    message_id: str | None = None,
+    appointment_id: str | None = None,
+    conversation_key: str | None = None,
+) -> Notification:
+    """Creates a notification for a user, and pushes it to their notification
+    streams (see /notifications/stream)
+
+    With NOTIFICATION_COALESCING, a notification about a conversation instead
+    updates the user's pending notification about it if there is one, which
+    counts the messages and points at the latest.
+
+    Args:
+        user_id (str): id of the user the notification is for
+        content (str): what the notification says
+        message_id (str, optional): id of the message it's about
+        appointment_id (str, optional): id of the appointment it's about
+        conversation_key (str, optional): the conversation the message is in
+            e.g. "directMessage:<id>"
+
+    Returns:
+        (Notification): the notification
+
+    """
+    data = {
+        "id": str(uuid4()),
+        "forUser": {"connect": {"id": user_id}},
+        "content": content,
+    }
+    if message_id is not None:
+        data["message"] = {"connect": {"id": message_id}}
+    if appointment_id is not None:
+        data["appointment"] = {"connect": {"id": appointment_id}}
+
+    prisma: Prisma = current_app.extensions["prisma"]
+    if conversation_key is not None and current_app.config["NOTIFICATION_COALESCING"]:
+        notification = _coalesce_notification(prisma, user_id, conversation_key, data)
+        if notification is not None:
+            publish_notification(user_id, notification.id)
+            return notification
+
+    with prisma.tx() as transaction:
+        notification = Notification.prisma(transaction).create(data=data)
+        count_unread_notifications(user_id, 1, transaction)
+    publish_notification(user_id, data["id"])
+
+    return notification
+
+
+def _coalesce_notification(
+    prisma: Prisma, user_id: str, conversation_key: str, data: dict
+) -> Notification | None:
+    where = {
+        "userId_conversationKey": {
+            "userId": user_id,
+            "conversationKey": conversation_key,
+        }
+    }
+    update = {"content": data["content"], "count": {"increment": 1}}
+    if "message" in data:
+        update["message"] = data["message"]
+
+    try:
+        with prisma.tx() as transaction:
+            notification = Notification.prisma(transaction).upsert(
+                where=where,
+                data={
+                    "create": {**data, "conversationKey": conversation_key},
+                    "update": update,
+                },
+            )
+            # only a created notification is another unread one
+            if notification.id == data["id"]:
+                count_unread_notifications(user_id, 1, transaction)
+    except UniqueViolationError:
+        # created concurrently, between the upsert looking for and creating it
+        notification = Notification.prisma().update(where=where, data=update)
+
+    # None if it was acknowledged meanwhile
+    return notification
+
+
+def count_unread_notifications(user_id: str, delta: int, client: Prisma | None = None):
+    """Applies a change in the number of a user's notifications to their
+    denormalised unread notification counter (see /notifications/count).
+
+    Args:
+        user_id (str): id of the user the notifications are for
+        delta (int): the change in the number of the user's notifications
+        client (Prisma): the transaction the notifications were changed in
+
+    """
+    # many rather than one, as the user may have been deleted meanwhile
+    User.prisma(client).update_many(
+        where={"id": user_id}, data={"unreadNotifications": {"increment": delta}}
+    )
+
+
+def recount_unread_notifications(user_id: str):
+    """Sets a user's unread notification counter to the number of their
+    notifications, correcting it should it have drifted.
+
+    Args:
+        user_id (str): id of the user
+
+    """
+    prisma: Prisma = current_app.extensions["prisma"]
+    with prisma.tx() as transaction:
+        # notifications created or deleted concurrently then change the counter
+        # after this transaction, so each is counted either here or by them
+        transaction.execute_raw(
+            'SELECT 1 FROM "User" WHERE "id" = $1 FOR UPDATE', user_id
+        )
+        count = Notification.prisma(transaction).count(where={"userId": user_id})
+        User.prisma(transaction).update_many(
+            where={"id": user_id}, data={"unreadNotifications": count}
+        )
+
+
+def uncount_deleted_user_notifications(user_id: str, client: Prisma):
+    """Removes the notifications which are cascade deleted along with a user
+    e.g. about their appointments or messages, from the unread notification
+    counters of the other users they were for. Must be called in the same
+    transaction as the user is deleted in.
+
+    Args:
+        user_id (str): id of the user being deleted
+        client (Prisma): the transaction the user is deleted in
+
+    """
+    appointment_with_user = {"OR": [{"tutorId": user_id}, {"studentId": user_id}]}
+    direct_message_with_user = {
+        "OR": [{"fromUserId": user_id}, {"otherUserId": user_id}]
+    }
+    message_about_user = {
+        "OR": [
+            {"sentById": user_id},
+            {"appointment": {"is": appointment_with_user}},
+            {"directMessage": {"is": direct_message_with_user}},
+        ]
+    }
+    deleted = Counter(
+        notification.userId
+        for notification in Notification.prisma(client).find_many(
+            where={
+                "userId": {"not": user_id},
+                "OR": [
+                    {"appointment": {"is": appointment_with_user}},
+                    {"message": {"is": message_about_user}},
+                ],
+            }
+        )
+    )
+    for other_user_id, count in deleted.items():
+        count_unread_notifications(other_user_id, -count, client)
+
+
+def publish_notification(user_id: str, notification_id: str):
+    """Pushes a notification, created by other means e.g. a nested create, to
+    its user's notification streams. Its creation must have been counted by
+    `count_unread_notifications`
+
+    Args:
+        user_id (str): id of the user the notification is for
+        notification_id (str): id of the notification
+
+    """
+    hub: NotificationHub = current_app.extensions["notification_hub"]
+    hub.publish(user_id, notification_id)
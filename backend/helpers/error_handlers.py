@@ -1,5 +1,7 @@
-from typing import Tuple
-from jsonschema import validate
+from typing import Dict, Tuple
+from jsonschema import FormatChecker, validators
+from jsonschema.exceptions import best_match
+from jsonschema.protocols import Validator
 from flask import Response, jsonify, current_app, request
 from re import search
 from jsonschema import ValidationError
@@ -54,6 +56,18 @@ def validation_pattern_match(error: ValidationError) -> Tuple[Response, int]:
         ] | [*_, "properties", "rating", "pattern"]:
             # Error will need to be changed if the boundaries of rating ever change
             return error_generator("rating must be between 1 to 5, inclusive", 400)
+        case [*_, "properties", "ids", "items", "type"]:
+            return error_generator("ids field must be a list of strings", 400)
+        case [*_, "properties", "ids", "maxItems"]:
+            return error_generator(
+                f"at most {error.validator_value} ids can be requested", 400
+            )
+        case [*_, "properties", "size", "minimum"]:
+            return error_generator("size must be a positive integer", 400)
+        case [*_, "properties", "sha256", "pattern"]:
+            return error_generator("sha256 must be a hex encoded SHA-256 digest", 400)
+        case [*_, "properties", "limit", "pattern"]:
+            return error_generator("limit must be a positive integer", 400)
         case [*_, "properties", "sortBy", "pattern"]:
             return error_generator(
                 "When specified, 'sortBy' must be equal to 'messageSent'", 400
@@ -77,7 +91,41 @@ def error_decorator(f):
     return wrapper
 
 
+# (id of schema, format checker) -> compiled validator, schemas are module level
+# dicts which live as long as the app, so their ids are stable
+_compiled_validators: Dict[Tuple[int, FormatChecker | None], Validator] = {}
+
+
+def compile_schema(schema, format_checker: FormatChecker | None = None) -> Validator:
+    """Checks a schema against its metaschema and builds its validator, once
+
+    Args:
+        schema (dict): the schema, whose `$schema` decides the draft used
+        format_checker (FormatChecker): checks the `format` keyword (optional)
+
+    Returns:
+        (Validator): the validator of the schema
+
+    Raises:
+        SchemaError: if the schema is invalid
+
+    """
+    key = (id(schema), format_checker)
+    if key not in _compiled_validators:
+        cls = validators.validator_for(schema)
+        cls.check_schema(schema)
+        _compiled_validators[key] = cls(schema, format_checker=format_checker)
+
+    return _compiled_validators[key]
+
+
 def validate_decorator(request_type: str, schema, format_checker=None):
+    if request_type not in ("json", "query_string"):
+        raise ValueError("request_type must be either json or query_string")
+
+    # compiled when the route is defined rather than on every request
+    validator = compile_schema(schema, format_checker)
+
     def _validate_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
@@ -86,12 +134,10 @@ def validate_decorator(request_type: str, schema, format_checker=None):
                     instance = request.get_json()
                 case "query_string":
                     instance = request.args
-                case _:
-                    raise ValueError("request_type must be either json or query_string")
-            if format_checker:
-                validate(instance, schema, format_checker=format_checker)
-            else:
-                validate(instance, schema)
+            # the same error `jsonschema.validate` would raise
+            error = best_match(validator.iter_errors(instance))
+            if error is not None:
+                raise error
             kwargs["args"] = instance
             return f(*args, **kwargs)
 
@@ -0,0 +1,83 @@
+from functools import wraps
+from hashlib import sha256
+from typing import Any, Callable
+from flask import Response, current_app, make_response, request
+from prisma import Prisma
+from prisma.models import User
+from helpers import identity_map
+
+# Responses of read-mostly routes are tagged with a strong ETag derived from a
+# cheap to find version of what they return (e.g. User.version), such that a
+# client repeating a request with If-None-Match gets a 304 without the route
+# ever building the body.
+
+
+def bump_version(model, id: str, client: Prisma | None = None):
+    """Increments the version of a record, must be called after (or in the
+    same transaction as) every write which changes what's returned for it,
+    else clients keep using what they were sent before the write.
+
+    Args:
+        model: the prisma model, which must have a `version` field
+        id (str): the id of the record
+        client (Prisma): the transaction the write was made in
+
+    """
+    model.prisma(client).update_many(
+        where={"id": id}, data={"version": {"increment": 1}}
+    )
+    # the write it's called after
+    identity_map.forget()
+
+
+def profile_version(user_id: str) -> int | None:
+    """Version of a user's profile, None if they don't exist"""
+    # only the user's row, rather than every relation shown on their profile
+    user = identity_map.find_unique(User, {"id": user_id})
+    return user.version if user is not None else None
+
+
+def etag_decorator(version: Callable[..., Any], public: bool = True):
+    """Makes GET requests of a route conditional, version is called with the
+    route's arguments and returns anything whose repr changes whenever the
+    response would. The response is built as usual if version returns None.
+
+    Args:
+        version (callable): finds the version of what the route returns
+        public (bool): whether the response is the same whoever's logged in,
+            such that shared caches can store it (see PUBLIC_CACHE_CONTROL)
+
+    """
+
+    def _etag_decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            # found before the response is built, so if it's written to in
+            # between the response is newer than its tag rather than older
+            found = version(**kwargs)
+            if found is None:
+                return f(*args, **kwargs)
+
+            tag = sha256(
+                repr((request.endpoint, sorted(kwargs.items()), found)).encode()
+            ).hexdigest()
+            cache_control = (
+                current_app.config["PUBLIC_CACHE_CONTROL"]
+                if public
+                else "private, no-cache"
+            )
+
+            if request.if_none_match.contains_weak(tag):
+                response = Response(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(tag)
+            response.headers["Cache-Control"] = cache_control
+            return response
+
+        return wrapper
+
+    return _etag_decorator
@@ -0,0 +1,189 @@
+from typing import Any, Dict, Hashable, Iterable, List, Tuple
+from flask import g, has_app_context
+
+
+def _freeze(value: Any) -> Hashable:
+    """Converts (nested) where/include arguments into something hashable"""
+    if isinstance(value, dict):
+        return frozenset((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _covers(loaded: Dict | None, wanted: Dict | None) -> bool:
+    """Whether a record loaded with `loaded` has every relation of `wanted`"""
+    if not wanted:
+        return True
+    if not loaded:
+        return False
+
+    for relation, wanted_include in wanted.items():
+        if relation not in loaded:
+            return False
+        # nested includes e.g. {"tutorInfo": {"include": {...}}}
+        if isinstance(wanted_include, dict) and not _covers(
+            (
+                loaded[relation].get("include")
+                if isinstance(loaded[relation], dict)
+                else None
+            ),
+            wanted_include.get("include"),
+        ):
+            return False
+
+    return True
+
+
+class IdentityMap:
+    """Records loaded during a single request, such that loading the same
+    record twice (e.g. the logged in user's view in several helpers) only
+    queries the database once.
+
+    Records are keyed on their model and the unique `where` they were loaded
+    by, and are reused for any lookup whose include is covered by the include
+    they were loaded with. Ids can also be deferred, such that the first lookup
+    of any of them loads them all with a single `IN` query.
+
+    Records (including ones found not to exist) are kept until `forget` is
+    called, which must be done after every write to a record, or a relation
+    of one, loaded earlier in the request.
+    """
+
+    def __init__(self):
+        # (model, where) -> [(include, record)]
+        self._records: Dict[Tuple[str, Hashable], List[Tuple[Dict | None, Any]]] = {}
+        # (model, include) -> ids to load on the next lookup of any of them
+        self._pending: Dict[Tuple[str, Hashable], Tuple[Any, Dict | None, Dict]] = {}
+
+    def _get(self, model, where: Dict, include: Dict | None) -> Tuple[bool, Any]:
+        for loaded_include, record in self._records.get(
+            (model.__name__, _freeze(where)), []
+        ):
+            if _covers(loaded_include, include):
+                return True, record
+
+        return False, None
+
+    def _put(self, model, where: Dict, include: Dict | None, record: Any):
+        self._records.setdefault((model.__name__, _freeze(where)), []).append(
+            (include, record)
+        )
+        # records found by another unique field (e.g. email) are also by id
+        if record is not None and "id" not in where:
+            self._put(model, {"id": record.id}, include, record)
+
+    def find_unique(self, model, where: Dict, include: Dict | None = None) -> Any:
+        """`model.prisma().find_unique`, but only querying each record once"""
+        found, record = self._get(model, where, include)
+        if found:
+            return record
+
+        pending = self._pending.get((model.__name__, _freeze(include)))
+        if pending is not None and set(where) == {"id"} and where["id"] in pending[2]:
+            self._flush(model.__name__, include)
+            found, record = self._get(model, where, include)
+            if found:
+                return record
+
+        record = model.prisma().find_unique(where=where, include=include)
+        self._put(model, where, include, record)
+        return record
+
+    def find_many(
+        self, model, ids: Iterable[str], include: Dict | None = None
+    ) -> Dict[str, Any]:
+        """Loads many records by id with a single query, skipping the ones
+        which have already been loaded.
+
+        Returns:
+            (dict): id -> record, for the records which exist
+
+        """
+        records = {}
+        missing = []
+        for id in dict.fromkeys(ids):
+            found, record = self._get(model, {"id": id}, include)
+            if not found:
+                missing.append(id)
+            elif record is not None:
+                records[id] = record
+
+        if len(missing) != 0:
+            for record in model.prisma().find_many(
+                where={"id": {"in": missing}}, include=include
+            ):
+                self._put(model, {"id": record.id}, include, record)
+                records[record.id] = record
+
+        return records
+
+    def defer(self, model, ids: Iterable[str], include: Dict | None = None):
+        """Queues ids to be loaded together on the first lookup of any of them,
+        with the same include."""
+        key = (model.__name__, _freeze(include))
+        # a dict rather than a set to keep the order ids were deferred in
+        _, _, ids_pending = self._pending.setdefault(key, (model, include, {}))
+        ids_pending.update(dict.fromkeys(ids))
+
+    def _flush(self, model_name: str, include: Dict | None):
+        # ids missing from the batch aren't cached, so they're then looked up on
+        # their own exactly as if they were never deferred
+        model, include, ids = self._pending.pop((model_name, _freeze(include)))
+        self.find_many(model, ids, include)
+
+    def forget(self):
+        """Drops every record loaded so far, as after a write any of them may
+        be stale, whether it was written to or included what was."""
+        self._records.clear()
+
+
+def identity_map() -> IdentityMap | None:
+    """The identity map of the current request, None outside of one"""
+    if not has_app_context():
+        return None
+
+    if "identity_map" not in g:
+        g.identity_map = IdentityMap()
+
+    return g.identity_map
+
+
+def find_unique(model, where: Dict, include: Dict | None = None) -> Any:
+    """`model.prisma().find_unique`, memoised for the current request"""
+    records = identity_map()
+    if records is None:
+        return model.prisma().find_unique(where=where, include=include)
+
+    return records.find_unique(model, where, include)
+
+
+def find_many(model, ids: Iterable[str], include: Dict | None = None) -> Dict[str, Any]:
+    """Loads many records by id with a single `IN` query, memoised for the
+    current request
+
+    Returns:
+        (dict): id -> record, for the records which exist
+
+    """
+    records = identity_map()
+    if records is None:
+        records = IdentityMap()
+
+    return records.find_many(model, ids, include)
+
+
+def defer(model, ids: Iterable[str], include: Dict | None = None):
+    """Queues ids to be loaded with a single `IN` query on the first lookup of
+    any of them within the current request, a no-op outside of one"""
+    records = identity_map()
+    if records is not None:
+        records.defer(model, ids, include)
+
+
+def forget():
+    """Drops every record loaded in the current request, such that lookups
+    after a write see it, a no-op outside of one"""
+    records = identity_map()
+    if records is not None:
+        records.forget()
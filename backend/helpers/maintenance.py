@@ -0,0 +1,71 @@
+import fcntl
+import logging
+import os
+from threading import Lock, Thread
+from time import monotonic, sleep
+from typing import Callable, List, TypedDict
+from flask import Flask
+
+logger = logging.getLogger(__name__)
+
+
+class Job(TypedDict):
+    name: str
+    # seconds between each run
+    interval: float
+    run: Callable[[], object]
+
+
+class Maintenance:
+    """Runs periodic housekeeping jobs e.g. garbage collection, off the request
+    path in a background thread, within an app context.
+
+    Only one worker on a host runs them at a time, whichever holds an exclusive
+    lock on `lock_path`. If it exits the lock is released, and another worker
+    takes over. Jobs first run an interval after the worker takes over, and
+    those which fail are logged and run again the next interval.
+
+    The thread is started on first use such that it belongs to the process
+    it's used in (e.g. a gunicorn worker rather than its arbiter).
+    """
+
+    def __init__(self, app: Flask, lock_path: str):
+        self.app = app
+        self.lock_path = lock_path
+        self._jobs: List[Job] = []
+        self._lock = Lock()
+        self._pid = None
+
+    def add_job(self, name: str, interval: float, run: Callable[[], object]):
+        """Runs `run` every `interval` seconds"""
+        self._jobs.append({"name": name, "interval": interval, "run": run})
+
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            self._pid = os.getpid()
+            Thread(target=self._work, daemon=True).start()
+
+    def run_job(self, job: Job):
+        with self.app.app_context():
+            try:
+                job["run"]()
+            except Exception:
+                logger.exception(f"maintenance job {job['name']} failed")
+
+    def _work(self):
+        # kept open (so locked) until the process exits
+        lock_file = open(self.lock_path, "a")
+        # blocks until no other worker holds it
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        now = monotonic()
+        due = [now + job["interval"] for job in self._jobs]
+        while len(self._jobs) != 0:
+            sleep(max(0, min(due) - monotonic()))
+            for index, job in enumerate(self._jobs):
+                if due[index] <= monotonic():
+                    self.run_job(job)
+                    due[index] = monotonic() + job["interval"]
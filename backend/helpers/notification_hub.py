@@ -0,0 +1,148 @@
+import json
+import logging
+import os
+from contextlib import contextmanager
+from queue import Empty, Queue
+from threading import Lock, Thread
+from time import sleep
+from typing import Dict, Iterator, Set
+from urllib.parse import urlsplit, urlunsplit
+from prisma import Prisma
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """The ids of notifications created for a user, while subscribed"""
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self._queue: Queue[str] = Queue()
+
+    def put(self, notification_id: str):
+        self._queue.put(notification_id)
+
+    def get(self, timeout: float) -> str | None:
+        """Waits up to `timeout` seconds for the id of a new notification"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except Empty:
+            return None
+
+
+class NotificationHub:
+    """In process pub/sub of new notifications, by the user they're for.
+
+    A hub only knows about notifications published in its own worker, unless
+    it has a fanout e.g. `PostgresFanout`, which relays notifications published
+    by any worker to the hubs of every worker.
+    """
+
+    def __init__(self, max_streams: int):
+        self._lock = Lock()
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+        self.fanout: PostgresFanout | None = None
+        # each stream holds onto a worker thread for as long as it's open
+        self.max_streams = max_streams
+        self._streams = 0
+
+    def open_stream(self) -> bool:
+        """Claims one of this worker's max_streams stream slots, which must be
+        released with `close_stream`.
+
+        Returns:
+            (bool): False if every slot is taken, so the stream can't be opened
+
+        """
+        with self._lock:
+            if self._streams >= self.max_streams:
+                return False
+            self._streams += 1
+            return True
+
+    def close_stream(self):
+        with self._lock:
+            self._streams -= 1
+
+    @contextmanager
+    def subscribe(self, user_id: str) -> Iterator[Subscription]:
+        if self.fanout is not None:
+            self.fanout.start()
+
+        subscription = Subscription(user_id)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                subscriptions = self._subscriptions[user_id]
+                subscriptions.discard(subscription)
+                if len(subscriptions) == 0:
+                    del self._subscriptions[user_id]
+
+    def publish(self, user_id: str, notification_id: str):
+        if self.fanout is not None:
+            self.fanout.publish(user_id, notification_id)
+        else:
+            self.deliver(user_id, notification_id)
+
+    def deliver(self, user_id: str, notification_id: str):
+        """Passes a notification onto the subscriptions of this worker"""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+
+        for subscription in subscriptions:
+            subscription.put(notification_id)
+
+
+class PostgresFanout:
+    """Relays notifications between the hubs of every worker with postgres'
+    LISTEN/NOTIFY.
+
+    Notifications are NOTIFY'd through prisma, while a thread per worker
+    LISTENs, which needs `psycopg` (3) as prisma can't.
+    """
+
+    # postgres channel, not to be confused with pusher's
+    CHANNEL = "notifications"
+
+    def __init__(self, hub: NotificationHub, prisma: Prisma, database_url: str):
+        # imported here as it's only needed by this (optional) fanout
+        import psycopg
+
+        self._psycopg = psycopg
+        self.hub = hub
+        self.prisma = prisma
+        # psycopg doesn't accept prisma's parameters e.g. ?schema=public
+        self.dsn = urlunsplit(urlsplit(database_url)._replace(query=""))
+        self._lock = Lock()
+        self._pid = None
+
+    def publish(self, user_id: str, notification_id: str):
+        self.prisma.execute_raw(
+            "SELECT pg_notify($1, $2)",
+            self.CHANNEL,
+            json.dumps({"userId": user_id, "id": notification_id}),
+        )
+
+    def start(self):
+        """Starts listening, once per process"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            self._pid = os.getpid()
+            Thread(target=self._listen, daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                with self._psycopg.connect(self.dsn, autocommit=True) as connection:
+                    connection.execute(f"LISTEN {self.CHANNEL}")
+                    for notify in connection.notifies():
+                        payload = json.loads(notify.payload)
+                        self.hub.deliver(payload["userId"], payload["id"])
+            except Exception:
+                logger.exception("lost the notifications listener, reconnecting")
+                sleep(1)
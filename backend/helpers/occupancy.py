@@ -0,0 +1,80 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from prisma.errors import UniqueViolationError
+from prisma.models import ChannelOccupancy
+from helpers.realtime import RealtimeOutbox
+from helpers.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Whether a channel is occupied (i.e. someone is listening for its events) is
+# recorded from pusher's channel existence webhooks into ChannelOccupancy,
+# which is shared by all workers, and cached per worker for a short time such
+# that sending a message usually doesn't need any lookup.
+#
+# Channels pusher hasn't told us about, e.g. if webhooks aren't set up, and
+# records old enough that a webhook may have been missed (a minute by default,
+# see CHANNEL_OCCUPANCY_MAX_AGE) fall back to asking pusher, whose answer is
+# recorded like a webhook's. Channels are taken to be unoccupied if pusher
+# can't be asked, as then a notification is created rather than an event lost.
+
+
+def is_occupied(channel: str) -> bool:
+    """Whether anyone is listening for events on a channel
+
+    Args:
+        channel (str): the channel e.g. the id of a user
+
+    Returns:
+        (bool): True if the channel is occupied
+
+    """
+    cache: TTLCache[str, bool] = current_app.extensions["channel_occupancy_cache"]
+    occupied = cache.get(channel)
+    if occupied is not None:
+        return occupied
+
+    record = ChannelOccupancy.prisma().find_unique(where={"channel": channel})
+    max_age = timedelta(seconds=current_app.config["CHANNEL_OCCUPANCY_MAX_AGE"])
+    if record is not None and datetime.now(timezone.utc) - record.updatedAt < max_age:
+        occupied = record.occupied
+    else:
+        outbox: RealtimeOutbox = current_app.extensions["realtime"]
+        try:
+            occupied = outbox.channel_info(channel)["occupied"]
+        except Exception:
+            # not cached, so it's asked again next time
+            logger.exception("couldn't get the occupancy of a channel")
+            return False
+        record_occupancy(channel, occupied, datetime.now(timezone.utc))
+
+    cache.set(channel, occupied)
+    return occupied
+
+
+def record_occupancy(channel: str, occupied: bool, at: datetime):
+    """Records whether a channel is occupied, unless something more recent
+    has already been recorded (webhooks can arrive out of order)
+
+    Args:
+        channel (str): the channel e.g. the id of a user
+        occupied (bool): whether the channel is occupied
+        at (datetime): when the channel was (un)occupied
+
+    """
+    updated = ChannelOccupancy.prisma().update_many(
+        where={"channel": channel, "updatedAt": {"lt": at}},
+        data={"occupied": occupied, "updatedAt": at},
+    )
+    if updated == 0:
+        try:
+            ChannelOccupancy.prisma().create(
+                data={"channel": channel, "occupied": occupied, "updatedAt": at}
+            )
+        except UniqueViolationError:
+            # a more recent record exists
+            return
+
+    cache: TTLCache[str, bool] = current_app.extensions["channel_occupancy_cache"]
+    cache.set(channel, occupied)
@@ -0,0 +1,187 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from datetime import datetime
+from typing import Any, Dict, List, Tuple, TypedDict
+from helpers.error_handlers import ExpectedError
+
+# upper bound of the size of a page of any paginated route
+MAX_PAGE_SIZE = 100
+# size of a page when the client doesn't give a limit
+DEFAULT_PAGE_SIZE = 20
+
+
+class Page(TypedDict, total=False):
+    # no limit means everything, only for internal callers as requests
+    # always have one (see parse_page_args)
+    limit: int
+    # decoded cursor, i.e. the sort key of the last record of the previous page
+    cursor: List
+
+
+def encode_cursor(sort_key: List) -> str:
+    """Encodes the (json serialisable) sort key of a record into an opaque cursor"""
+    return urlsafe_b64encode(json.dumps(sort_key).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> List:
+    """Decodes a cursor made by `encode_cursor`.
+
+    Raises:
+        ExpectedError: if the cursor is malformed
+
+    """
+    try:
+        sort_key = json.loads(urlsafe_b64decode(cursor.encode()))
+    except (BinasciiError, ValueError):
+        raise ExpectedError("cursor is invalid", 400)
+
+    if not isinstance(sort_key, list):
+        raise ExpectedError("cursor is invalid", 400)
+
+    return sort_key
+
+
+def parse_page_args(args, cursor_arg: str = "cursor") -> Page:
+    """Extracts the (already schema validated) `limit` and cursor arguments,
+    the limit being DEFAULT_PAGE_SIZE if it's omitted
+
+    Args:
+        args (dict): the query string arguments
+        cursor_arg (str): name of the cursor argument e.g. `before`
+
+    Raises:
+        ExpectedError: if the cursor is malformed
+
+    """
+    page: Page = {
+        "limit": min(int(args.get("limit", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+    }
+
+    if cursor_arg in args:
+        page["cursor"] = decode_cursor(args[cursor_arg])
+
+    return page
+
+
+def _decode_time_cursor(cursor: List) -> Tuple[datetime | None, str]:
+    try:
+        time, id = cursor
+        if not isinstance(id, str):
+            raise TypeError
+        return (datetime.fromisoformat(time) if time is not None else None), id
+    except (TypeError, ValueError):
+        raise ExpectedError("cursor is invalid", 400)
+
+
+def find_page_by_time(
+    actions, where: Dict, field: str, page: Page, nullable: bool = True, **kwargs
+) -> Tuple[List[Any], str | None]:
+    """Finds a page of records sorted by a DateTime `field` descending, with the
+    records where it's null last, then by id.
+
+    As the client can't order nulls last, the records where `field` is set
+    are paged through first, followed by the ones where it's null. Both are
+    keyset paginated, so a page only reads the records it returns (plus one,
+    to know if there's a next page).
+
+    Args:
+        actions: the model's actions e.g. `DirectMessage.prisma()`
+        where (dict): filters the records
+        field (str): the DateTime field to sort on, it should be indexed
+        page (Page): the requested page
+        nullable (bool): whether `field` is nullable, if not there's no need
+            to look for records where it's null
+        **kwargs: passed onto `find_many` e.g. include
+
+    Returns:
+        (list): the records of the page
+        (str | None): cursor of the next page, if there is one
+
+    Raises:
+        ExpectedError: if the cursor is malformed
+
+    """
+    after_time, after_id = (
+        _decode_time_cursor(page["cursor"]) if "cursor" in page else (None, None)
+    )
+    take = page["limit"] + 1 if "limit" in page else None
+
+    records = []
+    # records where field is set, unless the previous page ended on a null one
+    if after_id is None or after_time is not None:
+        after = {field: {"not": None}} if nullable else None
+        if after_id is not None:
+            after = {
+                "OR": [
+                    {field: {"lt": after_time}},
+                    {field: {"equals": after_time}, "id": {"gt": after_id}},
+                ]
+            }
+        records = actions.find_many(
+            where={"AND": [where, after]} if after is not None else where,
+            order=[{field: "desc"}, {"id": "asc"}],
+            take=take,
+            **kwargs,
+        )
+
+    if nullable and (take is None or len(records) < take):
+        after = {field: None}
+        if after_id is not None and after_time is None:
+            after["id"] = {"gt": after_id}
+        records = records + actions.find_many(
+            where={"AND": [where, after]},
+            order={"id": "asc"},
+            take=take - len(records) if take is not None else None,
+            **kwargs,
+        )
+
+    next_cursor = None
+    if "limit" in page and len(records) > page["limit"]:
+        records = records[: page["limit"]]
+        last_time = getattr(records[-1], field)
+        next_cursor = encode_cursor(
+            [last_time.isoformat() if last_time is not None else None, records[-1].id]
+        )
+
+    return records, next_cursor
+
+
+def find_page_by_id(
+    actions, where: Dict, page: Page, **kwargs
+) -> Tuple[List[Any], str | None]:
+    """Finds a page of records sorted by id, keyset paginated like
+    `find_page_by_time`
+
+    Args:
+        actions: the model's actions e.g. `Appointment.prisma()`
+        where (dict): filters the records
+        page (Page): the requested page
+        **kwargs: passed onto `find_many` e.g. include
+
+    Returns:
+        (list): the records of the page
+        (str | None): cursor of the next page, if there is one
+
+    Raises:
+        ExpectedError: if the cursor is malformed
+
+    """
+    if "cursor" in page:
+        if len(page["cursor"]) != 1 or not isinstance(page["cursor"][0], str):
+            raise ExpectedError("cursor is invalid", 400)
+        where = {"AND": [where, {"id": {"gt": page["cursor"][0]}}]}
+
+    records = actions.find_many(
+        where=where,
+        order={"id": "asc"},
+        take=page["limit"] + 1 if "limit" in page else None,
+        **kwargs,
+    )
+
+    next_cursor = None
+    if "limit" in page and len(records) > page["limit"]:
+        records = records[: page["limit"]]
+        next_cursor = encode_cursor([records[-1].id])
+
+    return records, next_cursor
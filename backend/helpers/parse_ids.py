@@ -0,0 +1,33 @@
+import json
+from typing import List
+from helpers.error_handlers import ExpectedError
+from jsonschemas.batch_schema import MAX_BATCH_SIZE
+
+
+def parse_ids(args) -> List[str]:
+    """Parses the (already schema validated) `ids` argument of a batch endpoint
+
+    Args:
+        args (dict): the query string arguments
+
+    Returns:
+        (list of str): the ids, without duplicates, in the order given
+
+    Raises:
+        ExpectedError: if ids is not a valid JSON list of strings
+        ExpectedError: if there are more than MAX_BATCH_SIZE ids
+
+    """
+    try:
+        ids = json.loads(args["ids"])
+    except json.decoder.JSONDecodeError:
+        raise ExpectedError("ids field must be valid JSON", 400)
+
+    if not isinstance(ids, list) or not all(isinstance(id, str) for id in ids):
+        raise ExpectedError("ids field must be a list of strings", 400)
+
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > MAX_BATCH_SIZE:
+        raise ExpectedError(f"at most {MAX_BATCH_SIZE} ids can be requested", 400)
+
+    return ids
@@ -0,0 +1,117 @@
+import json
+import logging
+from threading import Lock
+from typing import Dict, Tuple
+from flask import current_app
+from helpers.ttl_cache import TTLCache
+from helpers.tutor_search_index import invalidate_tutor
+
+logger = logging.getLogger(__name__)
+
+
+class RedisProfileStore:
+    """Profiles shared by every worker (and server) in a redis (protocol)
+    server, which needs `redis`. Entries expire after `ttl` seconds.
+
+    The db is the source of truth, so errors talking to redis are logged and
+    otherwise treated as misses.
+    """
+
+    PREFIX = "tutor_profile:"
+
+    def __init__(self, url: str, ttl: float):
+        # imported here as it's only needed by this (optional) store
+        import redis
+
+        self._redis_error = redis.RedisError
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, tutor_id: str) -> Tuple[int, Dict] | None:
+        try:
+            value = self.client.get(self.PREFIX + tutor_id)
+        except self._redis_error:
+            logger.exception("couldn't get a profile from redis")
+            return None
+        if value is None:
+            return None
+
+        entry = json.loads(value)
+        return entry["version"], entry["profile"]
+
+    def set(self, tutor_id: str, version: int, profile: Dict):
+        try:
+            self.client.set(
+                self.PREFIX + tutor_id,
+                json.dumps({"version": version, "profile": profile}),
+                px=int(self.ttl * 1000),
+            )
+        except self._redis_error:
+            logger.exception("couldn't set a profile in redis")
+
+    def delete(self, tutor_id: str):
+        try:
+            self.client.delete(self.PREFIX + tutor_id)
+        except self._redis_error:
+            # its entry is still keyed by the version from before the change
+            logger.exception("couldn't delete a profile from redis")
+
+
+class ProfileCache:
+    """Read through cache of tutors' public profiles (see GET /tutor/<id>),
+    held by this worker and optionally shared with every other one.
+
+    Profiles are cached along with the User.version they were built for, and
+    are only used for that version, so they're never served after the tutor
+    changed even if the change was made (and invalidated) by another worker.
+    """
+
+    def __init__(self, local: TTLCache, shared: RedisProfileStore | None = None):
+        self.local = local
+        self.shared = shared
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, tutor_id: str, version: int) -> Dict | None:
+        """The profile of a tutor, if it was cached for this version"""
+        entry = self.local.get(tutor_id)
+        # another worker may have already cached the current version
+        if (entry is None or entry[0] != version) and self.shared is not None:
+            shared_entry = self.shared.get(tutor_id)
+            if shared_entry is not None:
+                entry = shared_entry
+                self.local.set(tutor_id, entry)
+
+        hit = entry is not None and entry[0] == version
+        self._count(hit)
+        return entry[1] if hit else None
+
+    def set(self, tutor_id: str, version: int, profile: Dict):
+        self.local.set(tutor_id, (version, profile))
+        if self.shared is not None:
+            self.shared.set(tutor_id, version, profile)
+
+    def invalidate(self, tutor_id: str):
+        self.local.delete(tutor_id)
+        if self.shared is not None:
+            self.shared.delete(tutor_id)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.local)}
+
+
+def tutor_changed(tutor_id: str):
+    """Invalidates everything derived from a tutor in the current app, should
+    be called after every change to a tutor, their profile or their ratings"""
+    invalidate_tutor(tutor_id)
+    cache: ProfileCache = current_app.extensions["profile_cache"]
+    cache.invalidate(tutor_id)
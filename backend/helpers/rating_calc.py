@@ -1,10 +1,50 @@
-from typing import List
-from prisma.models import Rating
+from prisma import Prisma
+from prisma.models import Tutor, User
+from helpers.etag import bump_version
 
 
-def rating_calc(ratings: List[Rating]) -> float:
-    return (
-        sum(rating.score for rating in ratings) / len(ratings)
-        if len(ratings) != 0
-        else 0
+def rating_calc(rating_sum: int, rating_count: int) -> float:
+    return rating_sum / rating_count if rating_count != 0 else 0
+
+
+def lock_rating_aggregates(tutor_id: str, client: Prisma):
+    """Locks a tutor's row until the transaction ends, so their ratings are
+    changed one at a time, and ratings read after it can't change before the
+    aggregates are updated.
+
+    Args:
+        tutor_id (str): the id of the tutor
+        client (Prisma): the transaction the ratings are changed in
+
+    """
+    client.execute_raw('SELECT 1 FROM "Tutor" WHERE "id" = $1 FOR UPDATE', tutor_id)
+
+
+def update_rating_aggregates(
+    tutor_id: str, score_delta: int, count_delta: int, client: Prisma | None = None
+):
+    """Applies a change in a tutor's ratings to their denormalised rating
+    aggregates (ratingSum, ratingCount and ratingAverage).
+
+    Args:
+        tutor_id (str): the id of the tutor the ratings are for
+        score_delta (int): the change in the sum of the tutor's scores
+        count_delta (int): the change in the number of the tutor's ratings
+        client (Prisma): the transaction the rating change was made in
+
+    """
+    # the increment locks the tutor's row until the transaction ends, so no
+    # other rating can change the sum/count before the average is written
+    tutor = Tutor.prisma(client).update(
+        where={"id": tutor_id},
+        data={
+            "ratingSum": {"increment": score_delta},
+            "ratingCount": {"increment": count_delta},
+        },
+    )
+    Tutor.prisma(client).update(
+        where={"id": tutor_id},
+        data={"ratingAverage": rating_calc(tutor.ratingSum, tutor.ratingCount)},
     )
+    # the rating is shown on their profile
+    bump_version(User, tutor_id, client)
@@ -0,0 +1,224 @@
+import json
+import logging
+import os
+import random
+import sys
+from queue import Empty, Full, Queue
+from threading import Condition, Lock, Thread
+from time import sleep
+from typing import Dict, List, Protocol, TypedDict
+from pusher import Pusher
+from pusher.errors import PusherBadAuth, PusherBadRequest, PusherForbidden
+from pusher.util import validate_channel
+
+logger = logging.getLogger(__name__)
+
+# most events pusher accepts in a single batch
+MAX_BATCH_SIZE = 10
+# most bytes of data pusher accepts in a single event
+MAX_EVENT_SIZE = 10240
+
+
+class Event(TypedDict, total=True):
+    channel: str
+    name: str
+    # json encoded
+    data: str
+
+
+class PermanentDeliveryError(Exception):
+    """Raised by a transport when a batch will never be accepted, so retrying
+    it is pointless e.g. bad credentials"""
+
+
+class Transport(Protocol):
+    def encode(self, channel: str, name: str, data: Dict) -> Event:
+        """Validates and encodes an event.
+
+        Raises:
+            ValueError, TypeError: if the event is invalid
+
+        """
+        ...
+
+    def trigger_batch(self, events: List[Event]):
+        """Delivers a batch of at most MAX_BATCH_SIZE events.
+
+        Raises:
+            PermanentDeliveryError: if the batch should not be retried
+            Exception: if the batch can be retried
+
+        """
+        ...
+
+    def channel_info(self, channel: str) -> Dict: ...
+
+
+class PusherTransport:
+    """Delivers events with pusher"""
+
+    def __init__(self, client: Pusher):
+        self.client = client
+
+    def encode(self, channel: str, name: str, data: Dict) -> Event:
+        validate_channel(channel)
+        if len(name) > 200:
+            raise ValueError("event_name too long")
+
+        encoded = json.dumps(data, ensure_ascii=False)
+        if sys.getsizeof(encoded) > MAX_EVENT_SIZE:
+            raise ValueError("Too much data")
+
+        return {"channel": channel, "name": name, "data": encoded}
+
+    def trigger_batch(self, events: List[Event]):
+        try:
+            self.client.trigger_batch(
+                [dict(event) for event in events], already_encoded=True
+            )
+        except (PusherBadRequest, PusherBadAuth, PusherForbidden) as e:
+            raise PermanentDeliveryError(str(e)) from e
+
+    def channel_info(self, channel: str) -> Dict:
+        return self.client.channel_info(channel)
+
+
+class InMemoryTransport:
+    """Records events instead of delivering them, for tests and benchmarks.
+    Channels are occupied once `subscribe`d to."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.events: List[Event] = []
+        self.batches: List[List[Event]] = []
+        self.subscribed: Dict[str, int] = {}
+
+    def subscribe(self, channel: str):
+        with self._lock:
+            self.subscribed[channel] = self.subscribed.get(channel, 0) + 1
+
+    def encode(self, channel: str, name: str, data: Dict) -> Event:
+        return {"channel": channel, "name": name, "data": json.dumps(data)}
+
+    def trigger_batch(self, events: List[Event]):
+        with self._lock:
+            self.batches.append(list(events))
+            self.events.extend(events)
+
+    def channel_info(self, channel: str) -> Dict:
+        with self._lock:
+            count = self.subscribed.get(channel, 0)
+        return {"occupied": count > 0, "subscription_count": count}
+
+
+class RealtimeOutbox:
+    """Delivers realtime events off the request thread.
+
+    Events are queued by `publish`, which returns immediately, and delivered
+    in batches by a pool of worker threads. Batches that fail are retried with
+    exponential backoff (and jitter) until `max_attempts` is reached, after
+    which they're dropped and logged, as are events published while the outbox
+    is full. Realtime events are best effort, whatever they notify about is
+    already persisted.
+
+    Workers are started on first use such that they belong to the process
+    they're used in (e.g. a gunicorn worker rather than its arbiter).
+    """
+
+    def __init__(
+        self,
+        transport: Transport,
+        workers: int = 2,
+        max_attempts: int = 5,
+        backoff: float = 0.5,
+        max_backoff: float = 30,
+        maxsize: int = 10000,
+    ):
+        self.transport = transport
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._queue: Queue[Event] = Queue(maxsize=maxsize)
+        self._lock = Lock()
+        self._pid = None
+        # number of events which are queued or being delivered
+        self._pending = 0
+        self._drained = Condition(self._lock)
+
+    def publish(self, channel: str, name: str, data: Dict):
+        """Queues an event for delivery.
+
+        Args:
+            channel (str): the channel e.g. the id of a user
+            name (str): the name of the event
+            data (dict): the (json serialisable) data of the event
+
+        Raises:
+            ValueError, TypeError: if the event is invalid
+
+        """
+        event = self.transport.encode(channel, name, data)
+        self._start()
+        with self._lock:
+            try:
+                self._queue.put_nowait(event)
+            except Full:
+                logger.warning(f"realtime outbox is full, dropped {name} event")
+                return
+            self._pending += 1
+
+    def channel_info(self, channel: str) -> Dict:
+        return self.transport.channel_info(channel)
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Waits until every published event has been delivered (or dropped)
+
+        Returns:
+            (bool): False if the timeout was reached first
+
+        """
+        with self._drained:
+            return self._drained.wait_for(lambda: self._pending == 0, timeout)
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            self._pid = os.getpid()
+            for _ in range(self.workers):
+                Thread(target=self._work, daemon=True).start()
+
+    def _work(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < MAX_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except Empty:
+                    break
+
+            self._deliver(batch)
+            with self._drained:
+                self._pending -= len(batch)
+                self._drained.notify_all()
+
+    def _deliver(self, batch: List[Event]):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.transport.trigger_batch(batch)
+                return
+            except PermanentDeliveryError:
+                logger.exception(f"dropped a batch of {len(batch)} realtime events")
+                return
+            except Exception:
+                if attempt == self.max_attempts:
+                    logger.exception(
+                        f"dropped a batch of {len(batch)} realtime events after "
+                        f"{attempt} attempts"
+                    )
+                    return
+
+                delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+                sleep(random.uniform(delay / 2, delay))
@@ -0,0 +1,285 @@
+import json
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Protocol, Tuple
+from flask import Flask, Request, Response
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+from prisma.models import Session
+from helpers.ttl_cache import TTLCache
+
+# Sessions are kept server side, by a random id which is all the cookie holds.
+# Only requests which change a session write it, rather than every request
+# which has one, and sessions are refreshed (written again with a later
+# expiry) at most once every half a lifetime. Sessions are stored along with
+# the user logged in with them, so they can all be ended when the user is
+# deleted.
+
+# sessions hold what flask's cookie sessions can e.g. bytes, datetimes
+serializer = TaggedJSONSerializer()
+
+
+class SessionStore(Protocol):
+    def load(self, sid: str) -> Tuple[Dict, datetime] | None:
+        """The data of a session and when it expires, None if it doesn't
+        exist or has expired"""
+        ...
+
+    def save(self, sid: str, data: Dict, expires: datetime): ...
+
+    def delete(self, sid: str): ...
+
+    def delete_user(self, user_id: str) -> int:
+        """Deletes every session the user is logged in with
+
+        Returns:
+            (int): the number of sessions deleted
+
+        """
+        ...
+
+    def sweep(self) -> int:
+        """Deletes the sessions which have expired
+
+        Returns:
+            (int): the number of sessions deleted
+
+        """
+        ...
+
+
+class MemorySessionStore:
+    """Sessions held in this worker's memory, so only usable with a single
+    worker. The least recently used sessions are dropped beyond maxsize."""
+
+    def __init__(self, maxsize: int, lifetime: timedelta):
+        # sessions expire a lifetime after they're saved, as do the entries
+        self._sessions: TTLCache[str, Tuple[str, datetime, str | None]] = TTLCache(
+            maxsize=maxsize, ttl=lifetime.total_seconds()
+        )
+
+    def load(self, sid: str) -> Tuple[Dict, datetime] | None:
+        entry = self._sessions.get(sid)
+        if entry is None or entry[1] <= datetime.now(timezone.utc):
+            return None
+
+        # stored serialised, such that changes are only kept when saved
+        return serializer.loads(entry[0]), entry[1]
+
+    def save(self, sid: str, data: Dict, expires: datetime):
+        self._sessions.set(sid, (serializer.dumps(data), expires, data.get("user_id")))
+
+    def delete(self, sid: str):
+        self._sessions.delete(sid)
+
+    def delete_user(self, user_id: str) -> int:
+        return self._sessions.delete_where(lambda _, entry: entry[2] == user_id)
+
+    def sweep(self) -> int:
+        return self._sessions.expire()
+
+
+class PostgresSessionStore:
+    """Sessions as rows of Session, shared by every worker"""
+
+    def load(self, sid: str) -> Tuple[Dict, datetime] | None:
+        row = Session.prisma().find_first(
+            where={"id": sid, "expiresAt": {"gt": datetime.now(timezone.utc)}}
+        )
+        if row is None:
+            return None
+
+        return serializer.loads(row.data), row.expiresAt
+
+    def save(self, sid: str, data: Dict, expires: datetime):
+        serialized = serializer.dumps(data)
+        Session.prisma().upsert(
+            where={"id": sid},
+            data={
+                "create": {
+                    "id": sid,
+                    "data": serialized,
+                    "expiresAt": expires,
+                    "userId": data.get("user_id"),
+                },
+                "update": {
+                    "data": serialized,
+                    "expiresAt": expires,
+                    "userId": data.get("user_id"),
+                },
+            },
+        )
+
+    def delete(self, sid: str):
+        Session.prisma().delete_many(where={"id": sid})
+
+    def delete_user(self, user_id: str) -> int:
+        return Session.prisma().delete_many(where={"userId": user_id})
+
+    def sweep(self) -> int:
+        return Session.prisma().delete_many(
+            where={"expiresAt": {"lte": datetime.now(timezone.utc)}}
+        )
+
+
+class RedisSessionStore:
+    """Sessions shared by every worker (and server) in a redis (protocol)
+    server, which needs `redis`. Redis expires them itself."""
+
+    PREFIX = "session:"
+    # ids of the sessions of each user, which may include expired ones
+    USER_PREFIX = "user_sessions:"
+
+    def __init__(self, url: str):
+        # imported here as it's only needed by this (optional) store
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+
+    def load(self, sid: str) -> Tuple[Dict, datetime] | None:
+        value = self.client.get(self.PREFIX + sid)
+        if value is None:
+            return None
+
+        entry = json.loads(value)
+        return (
+            serializer.loads(entry["data"]),
+            datetime.fromtimestamp(entry["expires"], timezone.utc),
+        )
+
+    def save(self, sid: str, data: Dict, expires: datetime):
+        pxat = int(expires.timestamp() * 1000)
+        pipeline = self.client.pipeline()
+        pipeline.set(
+            self.PREFIX + sid,
+            json.dumps(
+                {"data": serializer.dumps(data), "expires": expires.timestamp()}
+            ),
+            pxat=pxat,
+        )
+        if "user_id" in data:
+            # kept until the user's last saved (so last to expire) session expires
+            pipeline.sadd(self.USER_PREFIX + data["user_id"], sid)
+            pipeline.pexpireat(self.USER_PREFIX + data["user_id"], pxat)
+        pipeline.execute()
+
+    def delete(self, sid: str):
+        self.client.delete(self.PREFIX + sid)
+
+    def delete_user(self, user_id: str) -> int:
+        sids = self.client.smembers(self.USER_PREFIX + user_id)
+        keys = [self.PREFIX + sid.decode() for sid in sids]
+        self.client.delete(self.USER_PREFIX + user_id)
+        return self.client.delete(*keys) if keys else 0
+
+    def sweep(self) -> int:
+        return 0
+
+
+class ServerSession(SecureCookieSession):
+    def __init__(
+        self,
+        initial: Dict | None = None,
+        sid: str | None = None,
+        expires: datetime | None = None,
+        permanent: bool = True,
+    ):
+        super().__init__(initial)
+        # None until the session is first saved
+        self.sid = sid
+        self.expires = expires
+        self.new = sid is None
+        # saved sessions keep what they were saved with, as with flask
+        if "_permanent" not in self:
+            self.permanent = permanent
+        self.modified = False
+        self.accessed = False
+
+
+class ServerSessionInterface(SessionInterface):
+    """Keeps sessions in a SessionStore, written only when they change, in
+    place of flask's cookie sessions.
+
+    Expired sessions are swept off the request path, by Maintenance running
+    `store.sweep` (see helpers/maintenance.py).
+    """
+
+    session_class = ServerSession
+
+    def __init__(self, store: SessionStore):
+        self.store = store
+
+    def end_user_sessions(self, user_id: str) -> int:
+        """Logs a (deleted) user out of every session, on every worker
+
+        Returns:
+            (int): the number of sessions ended
+
+        """
+        return self.store.delete_user(user_id)
+
+    def open_session(self, app: Flask, request: Request) -> ServerSession:
+        permanent = app.config["SESSION_PERMANENT"]
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            loaded = self.store.load(sid)
+            if loaded is not None:
+                data, expires = loaded
+                return self.session_class(
+                    data, sid=sid, expires=expires, permanent=permanent
+                )
+
+        return self.session_class(permanent=permanent)
+
+    def save_session(self, app: Flask, session: ServerSession, response: Response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        # e.g. logging out, which leaves only whether it's permanent
+        if not session.keys() - {"_permanent"}:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(
+                    name,
+                    domain=domain,
+                    path=path,
+                    secure=secure,
+                    samesite=samesite,
+                    httponly=httponly,
+                )
+                response.vary.add("Cookie")
+
+            return
+
+        lifetime = app.permanent_session_lifetime
+        now = datetime.now(timezone.utc)
+        refresh_due = session.expires is not None and (
+            session.expires - now < lifetime / 2
+        )
+        if not session.modified and not refresh_due:
+            return
+
+        if session.new:
+            session.sid = secrets.token_urlsafe(32)
+
+        expires = now + lifetime
+        self.store.save(session.sid, dict(session), expires)
+        response.set_cookie(
+            name,
+            session.sid,
+            # else the cookie is dropped when the browser closes
+            expires=expires if session.permanent else None,
+            httponly=httponly,
+            domain=domain,
+            path=path,
+            secure=secure,
+            samesite=samesite,
+        )
+        response.vary.add("Cookie")
@@ -0,0 +1,92 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Callable, Generic, Hashable, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+class TTLCache(Generic[K, V]):
+    """A thread safe, in memory (i.e. per worker) least recently used cache
+    whose entries also expire `ttl` seconds after being set.
+
+    The ttl bounds how stale an entry can be w.r.t. writes served by other
+    workers, which can't invalidate this worker's entries.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = Lock()
+        # key -> (expiry, value), least recently used first
+        self._entries: OrderedDict[K, Tuple[float, V]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        """The value of an entry which hasn't expired, otherwise `default`"""
+        with self._lock:
+            expiry, value = self._entries.get(key, (None, _MISSING))
+            if value is _MISSING:
+                return default
+
+            if monotonic() >= expiry:
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: K, value: V):
+        with self._lock:
+            self._entries[key] = (monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: K):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def expire(self) -> int:
+        """Drops every entry which has expired, rather than when it's next got
+
+        Returns:
+            (int): the number of entries dropped
+
+        """
+        with self._lock:
+            now = monotonic()
+            expired = [
+                key for key, (expiry, _) in self._entries.items() if now >= expiry
+            ]
+            for key in expired:
+                del self._entries[key]
+
+            return len(expired)
+
+    def delete_where(self, predicate: Callable[[K, V], bool]) -> int:
+        """Drops every entry for which predicate(key, value) is true
+
+        Returns:
+            (int): the number of entries dropped
+
+        """
+        with self._lock:
+            matching = [
+                key
+                for key, (_, value) in self._entries.items()
+                if predicate(key, value)
+            ]
+            for key in matching:
+                del self._entries[key]
+
+            return len(matching)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
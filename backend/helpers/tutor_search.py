@@ -0,0 +1,204 @@
+import json
+from typing import Dict, List, Tuple, TypedDict
+from datetime import datetime
+from prisma.models import Tutor
+from helpers.process_time_block import process_time_block
+from helpers.error_handlers import ExpectedError
+from helpers.pagination import Page, encode_cursor
+
+
+class SearchFilters(TypedDict, total=False):
+    # all keys are optional, a missing key means 'don't filter on this'
+    name: str
+    location: str
+    rating: float
+    courseOfferings: List[str]
+    # ! Note: These are UTC offset-aware datetimes
+    startTime: datetime
+    endTime: datetime
+
+
+def parse_search_cursor(cursor: List) -> Tuple[int, float, str]:
+    """The sort key (relevance, rating, tutor id) held by a decoded search cursor
+
+    Raises:
+        ExpectedError: if the cursor is malformed
+
+    """
+    try:
+        relevance, rating, tutor_id = cursor
+        if not isinstance(tutor_id, str):
+            raise TypeError
+        return int(relevance), float(rating), tutor_id
+    except (TypeError, ValueError):
+        raise ExpectedError("cursor is invalid", 400)
+
+
+def parse_search_args(args) -> SearchFilters:
+    """Converts the (already schema validated) query string of a tutor search
+    into typed filters.
+
+    Args:
+        args (dict): the query string arguments
+
+    Returns:
+        (SearchFilters): the parsed filters
+
+    Raises:
+        ExpectedError: if timeRange field is not a valid JSON
+        ExpectedError: timeRange argument missing fields
+        ExpectedError: if courseOfferings field is not a valid JSON
+
+    """
+    filters: SearchFilters = {}
+
+    if "name" in args:
+        filters["name"] = args["name"].strip()
+
+    if "location" in args:
+        filters["location"] = args["location"].strip()
+
+    if "rating" in args:
+        # conversion required as rating is passed in a query string
+        filters["rating"] = float(args["rating"])
+
+    if "courseOfferings" in args:
+        # Although flask has a `get_list` method on request.args,
+        # due to how the current frontend is setup, this is more acceptable
+        try:
+            course_offerings = json.loads(args["courseOfferings"])
+        except json.decoder.JSONDecodeError:
+            raise ExpectedError("courseOfferings field must be valid JSON", 400)
+
+        filters["courseOfferings"] = [offering.lower() for offering in course_offerings]
+
+    if "timeRange" in args:
+        try:
+            time_range = json.loads(args["timeRange"])
+        except json.decoder.JSONDecodeError:
+            raise ExpectedError("timeRange field must be valid JSON", 400)
+
+        if "startTime" not in time_range or "endTime" not in time_range:
+            raise ExpectedError("field(s) were missing in 'timeRange'", 400)
+
+        data = process_time_block(time_range)
+        filters["startTime"] = data["startTime"]
+        filters["endTime"] = data["endTime"]
+
+    return filters
+
+
+def build_search_where(filters: SearchFilters) -> Dict:
+    """Builds the prisma `where` clause for the given filters.
+
+    Args:
+        filters (SearchFilters): the parsed filters
+
+    Returns:
+        (dict): a `where` argument for `Tutor.prisma().find_many`
+
+    """
+    conditions = []
+
+    if "name" in filters:
+        conditions.append(
+            {
+                "userInfo": {
+                    "is": {"name": {"contains": filters["name"], "mode": "insensitive"}}
+                }
+            }
+        )
+
+    # tutors without a location never match a location search
+    if "location" in filters:
+        conditions.append(
+            {
+                "userInfo": {
+                    "is": {
+                        "location": {
+                            "contains": filters["location"],
+                            "mode": "insensitive",
+                        }
+                    }
+                }
+            }
+        )
+
+    if "courseOfferings" in filters:
+        conditions.append(
+            {
+                "courseOfferings": {
+                    "some": {
+                        "name": {
+                            "in": filters["courseOfferings"],
+                            "mode": "insensitive",
+                        }
+                    }
+                }
+            }
+        )
+
+    # tutors without any availabilities never match a timeRange search
+    # Note: datetimes extracted from the db are default UTC
+    if "startTime" in filters:
+        conditions.append(
+            {
+                "timesAvailable": {
+                    "some": {
+                        "startTime": {"lte": filters["endTime"]},
+                        "endTime": {"gte": filters["startTime"]},
+                    }
+                }
+            }
+        )
+
+    if "rating" in filters:
+        conditions.append({"ratingAverage": {"gte": filters["rating"]}})
+
+    return {"AND": conditions} if len(conditions) != 0 else {}
+
+
+def search_tutors(filters: SearchFilters, page: Page) -> Tuple[List[str], str | None]:
+    """Returns the ids of the tutors matching every given filter, sorted by
+    rating (descending) then id, and only fetches the requested page of them.
+
+    As every tutor the database returns matches every filter, they're all
+    equally relevant, so relevance isn't part of the order here.
+
+    Args:
+        filters (SearchFilters): the parsed filters
+        page (Page): the requested page
+
+    Returns:
+        (list of str): list of tutor ids
+        (str | None): cursor of the next page, if there is one
+
+    Raises:
+        ExpectedError: if the cursor is malformed
+
+    """
+    where = build_search_where(filters)
+    if "cursor" in page:
+        # keyset pagination, everything sorted after the previous page's last
+        _, rating, tutor_id = parse_search_cursor(page["cursor"])
+        after_cursor = {
+            "OR": [
+                {"ratingAverage": {"lt": rating}},
+                {"ratingAverage": {"equals": rating}, "id": {"gt": tutor_id}},
+            ]
+        }
+        where = {"AND": [where, after_cursor]}
+
+    # one more than a page is fetched to know whether there is a next page
+    tutors = Tutor.prisma().find_many(
+        where=where,
+        order=[{"ratingAverage": "desc"}, {"id": "asc"}],
+        take=page["limit"] + 1 if "limit" in page else None,
+    )
+
+    next_cursor = None
+    if "limit" in page and len(tutors) > page["limit"]:
+        tutors = tutors[: page["limit"]]
+        next_cursor = encode_cursor([0, tutors[-1].ratingAverage, tutors[-1].id])
+
+    return [tutor.id for tutor in tutors], next_cursor
@@ -0,0 +1,317 @@
+import re
+from bisect import bisect_left
+from datetime import datetime
+from threading import Lock
+from time import monotonic
+from typing import Dict, Iterable, List, Set, Tuple
+from flask import current_app
+from prisma.models import Tutor
+from helpers.tutor_search import SearchFilters, parse_search_cursor
+from helpers.pagination import Page, encode_cursor
+from helpers.availability import IntervalIndex
+from helpers.rating_calc import rating_calc
+
+# everything a search can filter on, ratings are aggregated on the tutor itself
+TUTOR_SEARCH_INCLUDE = {
+    "userInfo": True,
+    "courseOfferings": True,
+    "timesAvailable": {"order_by": {"startTime": "asc"}},
+}
+
+
+def tokenize(text: str | None) -> List[str]:
+    """Normalises free text (names, locations) into lowercase word tokens"""
+    if text is None:
+        return []
+
+    return [token for token in re.split(r"[^0-9a-z]+", text.lower()) if token]
+
+
+class SubstringIndex:
+    """Finds the ids whose text contains a query (case insensitively), i.e. the
+    same as the database's `contains` search.
+
+    Any word (token) of the query must be within one of the text's words, so the
+    ids with a word containing the query's longest word are found by bisecting
+    a sorted list of every suffix of every word, and then only those ids' texts
+    are checked for the whole query.
+    """
+
+    def __init__(self):
+        # id -> lowercase text
+        self._texts: Dict[str, str] = {}
+        # suffix of a word -> ids with that word
+        self._suffix_ids: Dict[str, Set[str]] = {}
+        # sorted keys of _suffix_ids, only sorted on the first search such that
+        # loading every tutor beforehand doesn't insert them one by one
+        self._suffixes: List[str] | None = None
+
+    @staticmethod
+    def _suffixes_of(text: str) -> Set[str]:
+        return {token[i:] for token in tokenize(text) for i in range(len(token))}
+
+    def add(self, id: str, text: str | None):
+        # like the database, a missing text never matches
+        if text is None:
+            return
+
+        self._texts[id] = text.lower()
+        for suffix in self._suffixes_of(text):
+            if suffix not in self._suffix_ids:
+                self._suffix_ids[suffix] = set()
+                if self._suffixes is not None:
+                    self._suffixes.insert(bisect_left(self._suffixes, suffix), suffix)
+
+            self._suffix_ids[suffix].add(id)
+
+    def remove(self, id: str):
+        text = self._texts.pop(id, None)
+        if text is None:
+            return
+
+        for suffix in self._suffixes_of(text):
+            self._suffix_ids[suffix].discard(id)
+            if len(self._suffix_ids[suffix]) == 0:
+                del self._suffix_ids[suffix]
+                if self._suffixes is not None:
+                    del self._suffixes[bisect_left(self._suffixes, suffix)]
+
+    def search(self, query: str) -> Set[str]:
+        query = query.lower()
+        tokens = tokenize(query)
+        if len(tokens) == 0:
+            candidates: Iterable[str] = self._texts.keys()
+        else:
+            if self._suffixes is None:
+                self._suffixes = sorted(self._suffix_ids)
+
+            # every suffix starting with the token is sorted right after it
+            longest = max(tokens, key=len)
+            candidates = set()
+            index = bisect_left(self._suffixes, longest)
+            while index < len(self._suffixes) and self._suffixes[index].startswith(
+                longest
+            ):
+                candidates |= self._suffix_ids[self._suffixes[index]]
+                index += 1
+
+        return {id for id in candidates if query in self._texts[id]}
+
+
+class TutorSearchIndex:
+    """An in memory (i.e. per worker) index of every tutor's searchable
+    information, such that a search intersects sets of ids instead of
+    looping over every tutor.
+
+    The index is built lazily on the first search, tutors which are written to
+    are marked dirty and reloaded individually before the next search, and the
+    whole index is rebuilt once it is older than `max_age` seconds, which bounds
+    how stale it is w.r.t. writes served by other workers.
+    """
+
+    def __init__(self, max_age: float):
+        self.max_age = max_age
+        self._lock = Lock()
+        self._built_at: float | None = None
+        self._dirty: Set[str] = set()
+        self._clear()
+
+    def _clear(self):
+        self._ids: Set[str] = set()
+        self._names = SubstringIndex()
+        self._locations = SubstringIndex()
+        # inverted map, subject -> tutor ids
+        self._subject_ids: Dict[str, Set[str]] = {}
+        # forward map, tutor id -> subjects, needed to un-index a tutor
+        self._subjects: Dict[str, List[str]] = {}
+        self._rating_sum: Dict[str, int] = {}
+        self._rating_count: Dict[str, int] = {}
+        self._availability: Dict[str, IntervalIndex[str]] = {}
+        # every tutor's availabilities, rebuilt lazily after any of them change
+        self._all_availability: IntervalIndex[str] | None = None
+
+    # writes ###################################################################
+
+    def invalidate(self, tutor_id: str):
+        """Marks a tutor as needing to be reloaded before the next search.
+        Should be called after anything a search filters on is written to."""
+        with self._lock:
+            # nothing to do if the index hasn't been built, it'll be loaded fresh
+            if self._built_at is not None:
+                self._dirty.add(tutor_id)
+
+    def _add(self, tutor: Tutor):
+        self._ids.add(tutor.id)
+
+        self._names.add(tutor.id, tutor.userInfo.name)
+        self._locations.add(tutor.id, tutor.userInfo.location)
+
+        self._subjects[tutor.id] = [
+            subject.name.lower() for subject in tutor.courseOfferings or []
+        ]
+        for subject in self._subjects[tutor.id]:
+            self._subject_ids.setdefault(subject, set()).add(tutor.id)
+
+        self._rating_sum[tutor.id] = tutor.ratingSum
+        self._rating_count[tutor.id] = tutor.ratingCount
+
+        self._availability[tutor.id] = IntervalIndex(
+            (block.startTime, block.endTime, tutor.id)
+            for block in tutor.timesAvailable or []
+        )
+        self._all_availability = None
+
+    def _remove(self, tutor_id: str):
+        if tutor_id not in self._ids:
+            return
+
+        self._ids.discard(tutor_id)
+        self._names.remove(tutor_id)
+        self._locations.remove(tutor_id)
+        for subject in self._subjects.pop(tutor_id):
+            self._subject_ids[subject].discard(tutor_id)
+            if len(self._subject_ids[subject]) == 0:
+                del self._subject_ids[subject]
+
+        del self._rating_sum[tutor_id]
+        del self._rating_count[tutor_id]
+        del self._availability[tutor_id]
+        self._all_availability = None
+
+    def _rebuild(self):
+        self._clear()
+        for tutor in Tutor.prisma().find_many(include=TUTOR_SEARCH_INCLUDE):
+            self._add(tutor)
+
+        self._dirty.clear()
+        self._built_at = monotonic()
+
+    def _refresh(self, tutor_id: str):
+        self._remove(tutor_id)
+        tutor = Tutor.prisma().find_unique(
+            where={"id": tutor_id}, include=TUTOR_SEARCH_INCLUDE
+        )
+        # tutor was deleted
+        if tutor is not None:
+            self._add(tutor)
+
+    def _ensure_fresh(self):
+        if self._built_at is None or monotonic() - self._built_at > self.max_age:
+            self._rebuild()
+            return
+
+        while len(self._dirty) != 0:
+            self._refresh(self._dirty.pop())
+
+    # reads ####################################################################
+
+    def _rating(self, tutor_id: str) -> float:
+        return rating_calc(self._rating_sum[tutor_id], self._rating_count[tutor_id])
+
+    def _available(
+        self, candidates: Iterable[str] | None, st: datetime, et: datetime
+    ) -> Iterable[str]:
+        if candidates is not None:
+            return [
+                id
+                for id in candidates
+                if self._availability[id].any_overlapping(st, et)
+            ]
+
+        # nothing else was searched on, so query every availability at once
+        if self._all_availability is None:
+            self._all_availability = IntervalIndex(
+                interval
+                for availability in self._availability.values()
+                for interval in availability
+            )
+
+        return set(self._all_availability.overlapping(st, et))
+
+    def search(
+        self, filters: SearchFilters, page: Page
+    ) -> Tuple[List[str], str | None]:
+        """Returns the ids of the tutors matching every given filter, sorted by
+        relevance (how many of the searched courseOfferings they offer), rating
+        (descending) and then id.
+
+        Args:
+            filters (SearchFilters): the parsed filters
+            page (Page): the requested page
+
+        Returns:
+            (list of str): list of tutor ids
+            (str | None): cursor of the next page, if there is one
+
+        Raises:
+            ExpectedError: if the cursor is malformed
+
+        """
+        with self._lock:
+            self._ensure_fresh()
+
+            id_sets: List[Set[str]] = []
+            if "name" in filters:
+                id_sets.append(self._names.search(filters["name"]))
+
+            if "location" in filters:
+                id_sets.append(self._locations.search(filters["location"]))
+
+            if "courseOfferings" in filters:
+                ids = set()
+                for subject in filters["courseOfferings"]:
+                    ids |= self._subject_ids.get(subject, set())
+                id_sets.append(ids)
+
+            # None means every tutor is a candidate
+            candidates: Iterable[str] | None = None
+            if len(id_sets) != 0:
+                # intersecting from the smallest set keeps this O(result size)
+                id_sets.sort(key=len)
+                candidates = id_sets[0].intersection(*id_sets[1:])
+
+            if "startTime" in filters:
+                candidates = self._available(
+                    candidates, filters["startTime"], filters["endTime"]
+                )
+
+            if candidates is None:
+                candidates = self._ids
+
+            if "rating" in filters:
+                candidates = [
+                    id for id in candidates if self._rating(id) >= filters["rating"]
+                ]
+
+            searched_subjects = set(filters.get("courseOfferings", []))
+            results = [
+                (
+                    len(searched_subjects.intersection(self._subjects[id])),
+                    self._rating(id),
+                    id,
+                )
+                for id in candidates
+            ]
+
+        def sort_key(result: Tuple[int, float, str]):
+            relevance, rating, id = result
+            return -relevance, -rating, id
+
+        if "cursor" in page:
+            after = sort_key(parse_search_cursor(page["cursor"]))
+            results = [result for result in results if sort_key(result) > after]
+
+        results.sort(key=sort_key)
+
+        next_cursor = None
+        if "limit" in page and len(results) > page["limit"]:
+            results = results[: page["limit"]]
+            next_cursor = encode_cursor(list(results[-1]))
+
+        return [id for _, _, id in results], next_cursor
+
+
+def invalidate_tutor(tutor_id: str):
+    """Marks a tutor as changed in the current app's tutor search index"""
+    index: TutorSearchIndex = current_app.extensions["tutor_search_index"]
+    index.invalidate(tutor_id)
@@ -0,0 +1,107 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from time import time
+from typing import BinaryIO, Iterator, List
+from helpers.blob_store import read_chunks
+
+# The chunks of resumable uploads (see /document/uploads) are staged on local
+# disk, a directory per upload session holding a file per chunk, until they're
+# committed into the blob store. Chunks are renamed into place once they've
+# been verified, so a chunk file is always complete.
+
+
+class ChunkError(Exception):
+    """Raised when a chunk isn't what was expected, and so wasn't staged"""
+
+
+class UploadStaging:
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _dir(self, session_id: str) -> str:
+        return os.path.join(self.root, session_id)
+
+    def _chunk_path(self, session_id: str, index: int) -> str:
+        return os.path.join(self._dir(session_id), str(index))
+
+    def create(self, session_id: str):
+        os.makedirs(self._dir(session_id), exist_ok=True)
+
+    def write_chunk(
+        self, session_id: str, index: int, stream: BinaryIO, size: int, sha256: str
+    ):
+        """Stages a chunk, replacing it if it was already staged (e.g. a retry)
+
+        Args:
+            session_id (str): id of the upload session
+            index (int): the index of the chunk
+            stream (BinaryIO): the content of the chunk
+            size (int): the size the chunk must be
+            sha256 (str): the hex SHA-256 digest the chunk must have
+
+        Raises:
+            ChunkError: if the chunk isn't of the size or digest expected
+            FileNotFoundError: if the session has no staging directory
+
+        """
+        digest = hashlib.sha256()
+        received = 0
+        fd, path = tempfile.mkstemp(dir=self._dir(session_id), prefix=".")
+        try:
+            with os.fdopen(fd, "wb") as staged:
+                for chunk in read_chunks(stream):
+                    received += len(chunk)
+                    if received > size:
+                        raise ChunkError(f"chunk must be {size} bytes")
+                    digest.update(chunk)
+                    staged.write(chunk)
+
+            if received != size:
+                raise ChunkError(f"chunk must be {size} bytes")
+            if digest.hexdigest() != sha256.lower():
+                raise ChunkError("chunk does not match its checksum")
+
+            os.replace(path, self._chunk_path(session_id, index))
+        except BaseException:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+
+    def received(self, session_id: str) -> List[int]:
+        """Indexes of the chunks staged for a session, in order"""
+        try:
+            names = os.listdir(self._dir(session_id))
+        except FileNotFoundError:
+            return []
+
+        return sorted(int(name) for name in names if name.isdigit())
+
+    def read(self, session_id: str, count: int) -> Iterator[bytes]:
+        """Reads the content of the first count chunks, in order"""
+        for index in range(count):
+            with open(self._chunk_path(session_id, index), "rb") as chunk:
+                yield from read_chunks(chunk)
+
+    def discard(self, session_id: str):
+        shutil.rmtree(self._dir(session_id), ignore_errors=True)
+
+    def discard_older_than(self, max_age: float) -> int:
+        """Discards the chunks of sessions which haven't had a chunk staged in
+        max_age seconds. Sessions expire max_age seconds after they're created,
+        so these have expired, whether or not their session still exists.
+
+        Returns:
+            (int): the number of sessions discarded
+
+        """
+        cutoff = time() - max_age
+        discarded = 0
+        for entry in os.scandir(self.root):
+            if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                self.discard(entry.name)
+                discarded += 1
+
+        return discarded
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Collection, Dict, List
 from prisma.models import (
     User,
     Appointment,
@@ -10,6 +10,7 @@ from prisma.models import (
     DirectMessage,
     Notification,
 )
+from helpers import identity_map
 
 
 class UserView:
@@ -102,6 +103,8 @@ class TutorView(UserView):
     course_offerings: List[Subject] | None
     times_available: List[TutorAvailability] | None
     documents: List[Document] | None
+    rating_sum: int
+    rating_count: int
 
     def __init__(
         self,
@@ -118,6 +121,8 @@ class TutorView(UserView):
         course_offerings: List[Subject] | None,
         times_available: List[TutorAvailability] | None,
         documents: List[Document] | None,
+        rating_sum: int,
+        rating_count: int,
         messages: List[Message] | None,
         from_direct_message: List[DirectMessage] | None,
         to_direct_message: List[DirectMessage] | None,
@@ -144,6 +149,8 @@ class TutorView(UserView):
         self.ratings = ratings
         self.times_available = times_available
         self.documents = documents
+        self.rating_sum = rating_sum
+        self.rating_count = rating_count
 
 
 class AdminView(UserView):
@@ -180,22 +187,62 @@ class AdminView(UserView):
         )
 
 
-def user_view(id: str = None, email: str = None) -> UserView | None:
+# Relations a view can load, the ones which aren't asked for are left as None.
+# Loading only what's needed matters as e.g. a user's messages grow unbounded
+USER_RELATIONS = {"messages", "fromDirectMessages", "toDirectMessages", "notifications"}
+STUDENT_RELATIONS = {"appointments"}
+TUTOR_RELATIONS = {
+    "ratings",
+    "appointments",
+    "courseOfferings",
+    "timesAvailable",
+    "documents",
+}
+
+
+def _user_include(
+    include: Collection[str], role: str | None = None, role_relations=frozenset()
+) -> Dict:
+    """Builds the prisma `include` for a view, the role's row (e.g. tutorInfo) is
+    always loaded as that's what decides if the user has the role."""
+    unknown = set(include) - USER_RELATIONS - role_relations
+    if len(unknown) != 0:
+        raise ValueError(f"Cannot include unknown relation(s) {sorted(unknown)}")
+
+    user_include = {r: True for r in sorted(include) if r in USER_RELATIONS}
+    if role is not None:
+        role_include = {r: True for r in sorted(include) if r in role_relations}
+        user_include[role] = {"include": role_include} if role_include else True
+
+    return user_include
+
+
+def _find_user(id: str | None, email: str | None, include: Dict) -> User | None:
     if id is None and email is None:
         return None
     elif id and email:
         raise ValueError("You cannot filter on both id and email")
 
     search_by = {"id": id} if id else {"email": email}
-    user = User.prisma().find_unique(
-        where=search_by,
-        include={
-            "messages": True,
-            "fromDirectMessages": True,
-            "toDirectMessages": True,
-            "notifications": True,
-        },
-    )
+    # the same user is often viewed several times in a request
+    return identity_map.find_unique(User, search_by, include or None)
+
+
+def user_view(
+    id: str = None, email: str = None, include: Collection[str] = ()
+) -> UserView | None:
+    """View of any user, by either id or email.
+
+    Args:
+        id (str): the id of the user
+        email (str): the email of the user
+        include (collection of str): the USER_RELATIONS to load
+
+    Returns:
+        (UserView | None): the user, if they exist
+
+    """
+    user = _find_user(id, email, _user_include(include))
 
     return (
         UserView(
@@ -218,22 +265,23 @@ def user_view(id: str = None, email: str = None) -> UserView | None:
     )
 
 
-def student_view(id: str = None, email: str = None) -> StudentView | None:
-    if id is None and email is None:
-        return None
-    elif id and email:
-        raise ValueError("You cannot filter on both id and email")
+def student_view(
+    id: str = None, email: str = None, include: Collection[str] = ()
+) -> StudentView | None:
+    """View of a student, by either id or email.
 
-    search_by = {"id": id} if id else {"email": email}
-    user = User.prisma().find_unique(
-        where=search_by,
-        include={
-            "studentInfo": {"include": {"appointments": True}},
-            "messages": True,
-            "fromDirectMessages": True,
-            "toDirectMessages": True,
-            "notifications": True,
-        },
+    Args:
+        id (str): the id of the student
+        email (str): the email of the student
+        include (collection of str): the USER_RELATIONS and STUDENT_RELATIONS
+            to load
+
+    Returns:
+        (StudentView | None): the student, if the user exists and is a student
+
+    """
+    user = _find_user(
+        id, email, _user_include(include, "studentInfo", STUDENT_RELATIONS)
     )
 
     return (
@@ -258,74 +306,91 @@ def student_view(id: str = None, email: str = None) -> StudentView | None:
     )
 
 
-def tutor_view(id: str = None, email: str = None) -> TutorView | None:
-    if id is None and email is None:
-        return None
-    elif id and email:
-        raise ValueError("You cannot filter on both id and email")
-
-    search_by = {"id": id} if id else {"email": email}
-    user = User.prisma().find_unique(
-        where=search_by,
-        include={
-            "tutorInfo": {
-                "include": {
-                    "ratings": True,
-                    "appointments": True,
-                    "courseOfferings": True,
-                    "timesAvailable": True,
-                    "documents": True,
-                }
-            },
-            "messages": True,
-            "fromDirectMessages": True,
-            "toDirectMessages": True,
-            "notifications": True,
-        },
+def _tutor_view(user: User) -> TutorView:
+    return TutorView(
+        user.id,
+        user.email,
+        user.hashedPassword,
+        user.name,
+        user.bio,
+        user.profilePicture,
+        user.location,
+        user.phoneNumber,
+        user.tutorInfo.ratings,
+        user.tutorInfo.appointments,
+        user.tutorInfo.courseOfferings,
+        user.tutorInfo.timesAvailable,
+        user.tutorInfo.documents,
+        user.tutorInfo.ratingSum,
+        user.tutorInfo.ratingCount,
+        user.messages,
+        user.fromDirectMessages,
+        user.toDirectMessages,
+        user.tutorialState,
+        user.notifications,
     )
+
+
+def tutor_view(
+    id: str = None, email: str = None, include: Collection[str] = ()
+) -> TutorView | None:
+    """View of a tutor, by either id or email.
+
+    Args:
+        id (str): the id of the tutor
+        email (str): the email of the tutor
+        include (collection of str): the USER_RELATIONS and TUTOR_RELATIONS to
+            load
+
+    Returns:
+        (TutorView | None): the tutor, if the user exists and is a tutor
+
+    """
+    user = _find_user(id, email, _user_include(include, "tutorInfo", TUTOR_RELATIONS))
+
     return (
-        TutorView(
-            user.id,
-            user.email,
-            user.hashedPassword,
-            user.name,
-            user.bio,
-            user.profilePicture,
-            user.location,
-            user.phoneNumber,
-            user.tutorInfo.ratings,
-            user.tutorInfo.appointments,
-            user.tutorInfo.courseOfferings,
-            user.tutorInfo.timesAvailable,
-            user.tutorInfo.documents,
-            user.messages,
-            user.fromDirectMessages,
-            user.toDirectMessages,
-            user.tutorialState,
-            user.notifications,
-        )
-        if user is not None and user.tutorInfo is not None
-        else None
+        _tutor_view(user) if user is not None and user.tutorInfo is not None else None
     )
 
 
-def admin_view(id: str = None, email: str = None) -> AdminView | None:
-    if id is None and email is None:
-        return None
-    elif id and email:
-        raise ValueError("You cannot filter on both id and email")
+def tutor_views(ids: List[str], include: Collection[str] = ()) -> List[TutorView]:
+    """Views of many tutors, fetched with a single query.
 
-    search_by = {"id": id} if id else {"email": email}
-    user = User.prisma().find_unique(
-        where=search_by,
-        include={
-            "adminInfo": True,
-            "messages": True,
-            "fromDirectMessages": True,
-            "toDirectMessages": True,
-            "notifications": True,
-        },
+    Args:
+        ids (list of str): the ids of the tutors
+        include (collection of str): the USER_RELATIONS and TUTOR_RELATIONS to
+            load
+
+    Returns:
+        (list of TutorView): the tutors which exist, in the order of `ids`
+
+    """
+    users = identity_map.find_many(
+        User, ids, _user_include(include, "tutorInfo", TUTOR_RELATIONS)
     )
+    return [
+        _tutor_view(users[id])
+        for id in ids
+        if id in users and users[id].tutorInfo is not None
+    ]
+
+
+def admin_view(
+    id: str = None, email: str = None, include: Collection[str] = ()
+) -> AdminView | None:
+    """View of an admin, by either id or email.
+
+    Args:
+        id (str): the id of the admin
+        email (str): the email of the admin
+        include (collection of str): the USER_RELATIONS to load
+
+    Returns:
+        (AdminView | None): the admin, if the user exists and is an admin
+
+    """
+    user = _find_user(id, email, _user_include(include, "adminInfo"))
+
     return (
         AdminView(
             user.id,
@@ -16,3 +16,9 @@ from jsonschemas.user_search_schema import user_search_schema
 from jsonschemas.direct_message_schema import direct_message_schema
 from jsonschemas.document_upload_schema import document_upload_schema
 from jsonschemas.document_delete_schema import document_delete_schema
+from jsonschemas.batch_schema import batch_schema
+from jsonschemas.pagination_schema import pagination_schema
+from jsonschemas.message_history_schema import message_history_schema
+from jsonschemas.notification_ack_schema import notification_ack_schema
+from jsonschemas.upload_session_schema import upload_session_schema
+from jsonschemas.upload_commit_schema import upload_commit_schema
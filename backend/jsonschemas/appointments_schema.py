@@ -1,4 +1,4 @@
-from jsonschemas.reused_properties import sort_by_prop
+from jsonschemas.reused_properties import cursor_prop, limit_prop, sort_by_prop
 
 appointments_schema = {
     "$id": "/jsonschemas/appointments",
@@ -7,5 +7,7 @@ appointments_schema = {
     "type": "object",
     "properties": {
         **sort_by_prop,
+        **limit_prop,
+        **cursor_prop,
     },
 }
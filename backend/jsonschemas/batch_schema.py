@@ -0,0 +1,16 @@
+# upper bound of the number of ids a batch endpoint resolves at once
+MAX_BATCH_SIZE = 100
+
+batch_schema = {
+    "$id": "/jsonschemas/batch",
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "title": "batch_schema",
+    "type": "object",
+    "properties": {
+        # It's entered as a json dumped list of ids
+        "ids": {
+            "type": "string",
+        },
+    },
+    "required": ["ids"],
+}
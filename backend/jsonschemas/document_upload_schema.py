@@ -7,6 +7,9 @@ document_upload_schema = {
         "document": {
             "type": "string",
         },
+        "filename": {
+            "type": "string",
+        },
     },
     "required": ["document"],
 }
\ No newline at end of file
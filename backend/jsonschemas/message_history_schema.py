@@ -0,0 +1,12 @@
+from jsonschemas.reused_properties import before_prop, limit_prop
+
+message_history_schema = {
+    "$id": "/jsonschemas/message_history",
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "title": "message_history_schema",
+    "type": "object",
+    "properties": {
+        **limit_prop,
+        **before_prop,
+    },
+}
@@ -0,0 +1,18 @@
+from jsonschemas.batch_schema import MAX_BATCH_SIZE
+
+notification_ack_schema = {
+    "$id": "/jsonschemas/notification_ack",
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "title": "notification_ack_schema",
+    "type": "object",
+    "properties": {
+        "ids": {
+            "type": "array",
+            "items": {
+                "type": "string",
+            },
+            "maxItems": MAX_BATCH_SIZE,
+        },
+    },
+    "required": ["ids"],
+}
@@ -0,0 +1,12 @@
+from jsonschemas.reused_properties import cursor_prop, limit_prop
+
+pagination_schema = {
+    "$id": "/jsonschemas/pagination",
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "title": "pagination_schema",
+    "type": "object",
+    "properties": {
+        **limit_prop,
+        **cursor_prop,
+    },
+}
@@ -144,3 +144,23 @@ sort_by_prop = {
         "pattern": "^messageSent$",
     }
 }
+
+# pagination, limit is a string as it's in the query string
+limit_prop = {
+    "limit": {
+        "type": "string",
+        "pattern": "^[1-9][0-9]*$",
+    }
+}
+
+cursor_prop = {
+    "cursor": {
+        "type": "string",
+    }
+}
+
+before_prop = {
+    "before": {
+        "type": "string",
+    }
+}
@@ -1,4 +1,9 @@
-from jsonschemas.reused_properties import location_prop, name_prop
+from jsonschemas.reused_properties import (
+    cursor_prop,
+    limit_prop,
+    location_prop,
+    name_prop,
+)
 
 tutor_search_schema = {
     "$id": "/jsonschemas/tutor_search",
@@ -21,5 +26,7 @@ tutor_search_schema = {
         "courseOfferings": {
             "type": "string",
         },
+        **limit_prop,
+        **cursor_prop,
     },
 }
@@ -0,0 +1,13 @@
+upload_commit_schema = {
+    "$id": "/jsonschemas/upload_commit",
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "title": "upload_commit_schema",
+    "type": "object",
+    "properties": {
+        # hex SHA-256 digest of the whole document, checked if given
+        "sha256": {
+            "type": "string",
+            "pattern": "^[0-9a-fA-F]{64}$",
+        },
+    },
+}
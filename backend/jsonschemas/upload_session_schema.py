@@ -0,0 +1,20 @@
+upload_session_schema = {
+    "$id": "/jsonschemas/upload_session",
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "title": "upload_session_schema",
+    "type": "object",
+    "properties": {
+        "filename": {
+            "type": "string",
+        },
+        "mimeType": {
+            "type": "string",
+        },
+        # of the whole document, in bytes
+        "size": {
+            "type": "integer",
+            "minimum": 1,
+        },
+    },
+    "required": ["size"],
+}
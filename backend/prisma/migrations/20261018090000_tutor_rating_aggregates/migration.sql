@@ -0,0 +1,19 @@
+-- AlterTable
+ALTER TABLE "Tutor" ADD COLUMN     "ratingAverage" DOUBLE PRECISION NOT NULL DEFAULT 0,
+ADD COLUMN     "ratingCount" INTEGER NOT NULL DEFAULT 0,
+ADD COLUMN     "ratingSum" INTEGER NOT NULL DEFAULT 0;
+
+-- Backfill aggregates of pre-existing ratings
+UPDATE "Tutor" SET
+    "ratingSum" = "aggregate"."sum",
+    "ratingCount" = "aggregate"."count",
+    "ratingAverage" = "aggregate"."sum"::DOUBLE PRECISION / "aggregate"."count"
+FROM (
+    SELECT "tutorId", SUM("score") AS "sum", COUNT(*) AS "count"
+    FROM "Rating"
+    GROUP BY "tutorId"
+) AS "aggregate"
+WHERE "Tutor"."id" = "aggregate"."tutorId";
+
+-- CreateIndex
+CREATE INDEX "Tutor_ratingAverage_idx" ON "Tutor"("ratingAverage");
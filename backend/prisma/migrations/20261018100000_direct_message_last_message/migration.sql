@@ -0,0 +1,18 @@
+-- AlterTable
+ALTER TABLE "DirectMessage" ADD COLUMN     "lastMessageAt" TIMESTAMP(3);
+
+-- Backfill from the most recent message of pre-existing conversations
+UPDATE "DirectMessage" SET "lastMessageAt" = "last"."sentTime"
+FROM (
+    SELECT "directMessageId", MAX("sentTime") AS "sentTime"
+    FROM "Message"
+    WHERE "directMessageId" IS NOT NULL
+    GROUP BY "directMessageId"
+) AS "last"
+WHERE "DirectMessage"."id" = "last"."directMessageId";
+
+-- CreateIndex
+CREATE INDEX "DirectMessage_fromUserId_lastMessageAt_idx" ON "DirectMessage"("fromUserId", "lastMessageAt");
+
+-- CreateIndex
+CREATE INDEX "DirectMessage_otherUserId_lastMessageAt_idx" ON "DirectMessage"("otherUserId", "lastMessageAt");
@@ -0,0 +1,5 @@
+-- CreateIndex
+CREATE INDEX "Message_appointmentId_sentTime_idx" ON "Message"("appointmentId", "sentTime");
+
+-- CreateIndex
+CREATE INDEX "Message_directMessageId_sentTime_idx" ON "Message"("directMessageId", "sentTime");
@@ -0,0 +1,18 @@
+-- AlterTable
+ALTER TABLE "Appointment" ADD COLUMN     "lastMessageAt" TIMESTAMP(3);
+
+-- Backfill from the most recent message of pre-existing appointments
+UPDATE "Appointment" SET "lastMessageAt" = "last"."sentTime"
+FROM (
+    SELECT "appointmentId", MAX("sentTime") AS "sentTime"
+    FROM "Message"
+    WHERE "appointmentId" IS NOT NULL
+    GROUP BY "appointmentId"
+) AS "last"
+WHERE "Appointment"."id" = "last"."appointmentId";
+
+-- CreateIndex
+CREATE INDEX "Appointment_tutorId_lastMessageAt_idx" ON "Appointment"("tutorId", "lastMessageAt");
+
+-- CreateIndex
+CREATE INDEX "Appointment_studentId_lastMessageAt_idx" ON "Appointment"("studentId", "lastMessageAt");
@@ -0,0 +1,8 @@
+-- CreateTable
+CREATE TABLE "ChannelOccupancy" (
+    "channel" TEXT NOT NULL,
+    "occupied" BOOLEAN NOT NULL,
+    "updatedAt" TIMESTAMP(3) NOT NULL,
+
+    CONSTRAINT "ChannelOccupancy_pkey" PRIMARY KEY ("channel")
+);
@@ -0,0 +1,11 @@
+-- AlterTable
+ALTER TABLE "User" ADD COLUMN     "unreadNotifications" INTEGER NOT NULL DEFAULT 0;
+
+-- Backfill from the notifications of pre-existing users
+UPDATE "User" SET "unreadNotifications" = "unread"."count"
+FROM (
+    SELECT "userId", COUNT(*) AS "count"
+    FROM "Notification"
+    GROUP BY "userId"
+) AS "unread"
+WHERE "User"."id" = "unread"."userId";
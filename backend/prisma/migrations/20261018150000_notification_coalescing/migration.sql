@@ -0,0 +1,6 @@
+-- AlterTable
+ALTER TABLE "Notification" ADD COLUMN     "conversationKey" TEXT,
+ADD COLUMN     "count" INTEGER NOT NULL DEFAULT 1;
+
+-- CreateIndex
+CREATE UNIQUE INDEX "Notification_userId_conversationKey_key" ON "Notification"("userId", "conversationKey");
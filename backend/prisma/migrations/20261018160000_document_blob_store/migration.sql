@@ -0,0 +1,9 @@
+-- AlterTable
+ALTER TABLE "Document" ADD COLUMN     "blobHash" TEXT,
+ADD COLUMN     "filename" TEXT,
+ADD COLUMN     "mimeType" TEXT,
+ADD COLUMN     "size" INTEGER,
+ALTER COLUMN "document" DROP NOT NULL;
+
+-- CreateIndex
+CREATE INDEX "Document_blobHash_idx" ON "Document"("blobHash");
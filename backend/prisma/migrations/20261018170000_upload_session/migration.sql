@@ -0,0 +1,18 @@
+-- CreateTable
+CREATE TABLE "UploadSession" (
+    "id" TEXT NOT NULL,
+    "tutorId" TEXT NOT NULL,
+    "filename" TEXT,
+    "mimeType" TEXT NOT NULL,
+    "size" INTEGER NOT NULL,
+    "chunkSize" INTEGER NOT NULL,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "UploadSession_pkey" PRIMARY KEY ("id")
+);
+
+-- CreateIndex
+CREATE INDEX "UploadSession_createdAt_idx" ON "UploadSession"("createdAt");
+
+-- AddForeignKey
+ALTER TABLE "UploadSession" ADD CONSTRAINT "UploadSession_tutorId_fkey" FOREIGN KEY ("tutorId") REFERENCES "Tutor"("id") ON DELETE CASCADE ON UPDATE CASCADE;
@@ -0,0 +1,5 @@
+-- AlterTable
+ALTER TABLE "Session" ADD COLUMN     "userId" TEXT;
+
+-- CreateIndex
+CREATE INDEX "Session_userId_idx" ON "Session"("userId");
@@ -8,10 +8,8 @@ from uuid import uuid4
 from flask.testing import FlaskClient
 from prisma.cli import prisma
 import prisma.models as models
-import subprocess
 import sys
 import os
-from pathlib import Path
 from prisma.actions import *
 from pusher import Pusher
 
@@ -20,6 +18,8 @@ from pusher import Pusher
 current = os.path.dirname(os.path.realpath(__file__))
 parent = os.path.dirname(current)
 sys.path.append(parent)
+# housekeeping jobs are run by the tests themselves
+os.environ["MAINTENANCE"] = "false"
 from app import app
 
 # basic testing utils ##########################################################
@@ -30,14 +30,6 @@ def setup_test():
     return app.test_client()
 
 
-@pytest.fixture(scope="session", autouse=True)
-def cleanup():
-    yield None
-    # check is probably unnecssary, but better to be safe than sorry
-    if Path.cwd().parts[-1] == "tests" and (Path.cwd() / "flask_session").is_dir():
-        subprocess.run(["rm", "-rf", "flask_session"])
-
-
 # ? Probably no longer necessary due to additional of mocking
 def test_setup_test_db(setup_test):
     try:
@@ -215,6 +207,8 @@ def fake_user():
                     hashedPassword=sha256(pword.encode()).hexdigest(),
                     studentInfo=models.Student(id=id, userInfoId=id),
                     tutorialState=True,
+                    unreadNotifications=0,
+                    version=0,
                 )
                 user.studentInfo = models.Student(
                     id=id, userInfoId=id, userInfo=user, appointments=[]
@@ -226,11 +220,25 @@ def fake_user():
                     name="name",
                     email=email,
                     hashedPassword=sha256(pword.encode()).hexdigest(),
-                    tutorInfo=models.Tutor(id=id, userInfoId=id),
+                    tutorInfo=models.Tutor(
+                        id=id,
+                        userInfoId=id,
+                        ratingSum=0,
+                        ratingCount=0,
+                        ratingAverage=0,
+                    ),
                     tutorialState=True,
+                    unreadNotifications=0,
+                    version=0,
                 )
                 user.tutorInfo = models.Tutor(
-                    id=id, userInfoId=id, userInfo=user, appointments=[]
+                    id=id,
+                    userInfoId=id,
+                    userInfo=user,
+                    appointments=[],
+                    ratingSum=0,
+                    ratingCount=0,
+                    ratingAverage=0,
                 )
                 return user
             case "admin":
@@ -241,6 +249,8 @@ def fake_user():
                     hashedPassword=sha256(pword.encode()).hexdigest(),
                     adminInfo=models.Admin(id=id, userInfoId=id),
                     tutorialState=True,
+                    unreadNotifications=0,
+                    version=0,
                 )
                 user.adminInfo = models.Admin(id=id, userInfoId=id, userInfo=user)
                 return user
@@ -554,3 +554,22 @@ def test_create_admin_valid(
         ]
         for d in resp.json["userInfos"]
     )
+
+
+def test_admin_cache_stats(setup_test: FlaskClient, fake_login):
+    client = setup_test
+
+    resp = client.get("/admin/cache")
+    assert resp.json == {"error": "No user is logged in"}
+    assert resp.status_code == 401
+
+    fake_login("fake_tutor")
+    resp = client.get("/admin/cache")
+    assert resp.json == {"error": "Insufficient permission to view cache statistics"}
+    assert resp.status_code == 403
+
+    client.post("/logout")
+    fake_login("fake_admin")
+    resp = client.get("/admin/cache")
+    assert resp.status_code == 200
+    assert set(resp.json["profiles"]) == {"hits", "misses", "size"}
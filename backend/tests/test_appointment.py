@@ -1,9 +1,11 @@
 import pytest
+import json
 from pytest_mock import MockerFixture
 from pytest_mock.plugin import MockType
 from flask.testing import FlaskClient
-from prisma.models import Appointment, User, Rating, Message
+from prisma.models import Appointment, User, Rating, Message, Notification
 from prisma.errors import RecordNotFoundError
+from helpers.pagination import DEFAULT_PAGE_SIZE
 
 ########################### APPOINTMENT ACCEPT TESTS ###########################
 
@@ -214,6 +216,57 @@ def test_appointment_get(
     assert resp.json["studentId"] == fake_appointment.studentId
     assert resp.status_code == 200
 
+    # unchanged
+    etag = resp.headers["ETag"]
+    assert resp.headers["Cache-Control"] == "private, no-cache"
+    resp = client.get(
+        f"/appointment/{fake_appointment.id}", headers={"If-None-Match": etag}
+    )
+    assert resp.status_code == 304
+
+    # but the tag isn't valid for anyone else, as they're shown less
+    client.post("/logout")
+    resp = client.get(
+        f"/appointment/{fake_appointment.id}", headers={"If-None-Match": etag}
+    )
+    assert resp.status_code == 200
+    assert "studentId" not in resp.json
+
+
+def test_appointment_get_batch(
+    setup_test: FlaskClient,
+    mocker: MockerFixture,
+    fake_appointment,
+    fake_appointment_fin,
+    fake_login,
+):
+    client = setup_test
+
+    appointment_find_many_mock = mocker.patch(
+        "tests.conftest.AppointmentActions.find_many"
+    )
+    appointment_find_many_mock.return_value = [fake_appointment_fin, fake_appointment]
+
+    ids = [fake_appointment.id, "missing", fake_appointment_fin.id]
+    resp = client.get("/appointment/batch", query_string={"ids": json.dumps(ids)})
+    appointment_find_many_mock.assert_called_once_with(
+        where={"id": {"in": ids}}, include={"rating": True}
+    )
+
+    # in the order requested, and only as much as the single appointment route
+    assert resp.status_code == 200
+    assert [apt["id"] for apt in resp.json["appointments"]] == [
+        fake_appointment.id,
+        fake_appointment_fin.id,
+    ]
+    assert all("studentId" not in apt for apt in resp.json["appointments"])
+
+    fake_login("fake_student")
+    resp = client.get("/appointment/batch", query_string={"ids": json.dumps(ids)})
+    assert resp.status_code == 200
+    assert resp.json["appointments"][0]["studentId"] == fake_appointment.studentId
+    assert resp.json["appointments"][0]["rating"] is None
+
 
 ############################## REQUEST TESTS ###################################
 
@@ -447,15 +500,58 @@ def test_delete_args(
         "tests.conftest.NotificationActions.delete_many"
     )
 
+    # including those cascade deleted with the appointment's messages
+    find_many_notification_mock = mocker.patch(
+        "tests.conftest.NotificationActions.find_many"
+    )
+    find_many_notification_mock.return_value = [
+        Notification(id=id, userId=user_id, content="content", count=1)
+        for id, user_id in [
+            ("1", fake_appointment.tutorId),
+            ("2", fake_appointment.studentId),
+            ("3", fake_appointment.tutorId),
+        ]
+    ]
+    update_many_user_mock = mocker.patch("tests.conftest.UserActions.update_many")
+
     delete = mocker.patch("tests.conftest.AppointmentActions.delete")
     resp = client.delete("/appointment/", json={"id": fake_appointment.id})
     delete.assert_called()
     create_notification_mock.assert_called()
     delete_notification_mock.assert_called()
+    # the deleted notifications are no longer counted
+    update_many_user_mock.assert_any_call(
+        where={"id": fake_appointment.tutorId},
+        data={"unreadNotifications": {"increment": -2}},
+    )
+    update_many_user_mock.assert_any_call(
+        where={"id": fake_appointment.studentId},
+        data={"unreadNotifications": {"increment": -1}},
+    )
 
     assert resp.status_code == 200
     assert resp.json["success"] == True
 
+    # a rated appointment's score is taken off its tutor's aggregates, as read
+    # in the same transaction as it's deleted
+    rating_find_unique_mock = mocker.patch("tests.conftest.RatingActions.find_unique")
+    rating_find_unique_mock.return_value = Rating(
+        id="id",
+        score=4,
+        appointmentId=fake_appointment.id,
+        tutorId=fake_appointment.tutorId,
+    )
+    tutor_update_mock = mocker.patch("tests.conftest.TutorActions.update")
+    resp = client.delete("/appointment/", json={"id": fake_appointment.id})
+    rating_find_unique_mock.assert_called_with(
+        where={"appointmentId": fake_appointment.id}
+    )
+    tutor_update_mock.assert_any_call(
+        where={"id": fake_appointment.tutorId},
+        data={"ratingSum": {"increment": -4}, "ratingCount": {"increment": -1}},
+    )
+    assert resp.status_code == 200
+
 
 ############################### MODIFY TESTS ###################################
 
@@ -646,8 +742,11 @@ def test_rating_args(
         "tests.conftest.AppointmentActions.find_unique"
     )
     appointment_find_unique_mock.return_value = fake_appointment_fin
+    rating_find_unique_mock = mocker.patch("tests.conftest.RatingActions.find_unique")
+    rating_find_unique_mock.return_value = None
     rating_upsert_mock = mocker.patch("tests.conftest.RatingActions.upsert")
     rating_upsert_mock.return_value = fake_rating
+    tutor_update_mock = mocker.patch("tests.conftest.TutorActions.update")
 
     # successful rating on an appointment
     resp = client.post(
@@ -657,6 +756,12 @@ def test_rating_args(
     appointment_find_unique_mock.reset_mock()
     rating_upsert_mock.assert_called()
     rating_upsert_mock.reset_mock()
+    # new rating is added to the tutor's aggregates
+    tutor_update_mock.assert_any_call(
+        where={"id": fake_appointment_fin.tutorId},
+        data={"ratingSum": {"increment": 5}, "ratingCount": {"increment": 1}},
+    )
+    tutor_update_mock.reset_mock()
 
     assert resp.status_code == 200
     assert resp.json["success"] == True
@@ -670,16 +775,25 @@ def test_rating_args(
         createdFor=fake_appointment_fin.tutor,
         tutorId=fake_appointment_fin.tutorId,
     )
-    fake_appointment_fin.rating = rating
+    # read in the same transaction as it's changed
+    rating_find_unique_mock.return_value = rating
     rating_upsert_mock.return_value = rating
 
     resp = client.post(
-        "/appointment/rating", json={"id": fake_appointment_fin.id, "rating": 5}
+        "/appointment/rating", json={"id": fake_appointment_fin.id, "rating": 3}
     )
     appointment_find_unique_mock.assert_called()
     appointment_find_unique_mock.reset_mock()
+    rating_find_unique_mock.assert_called_with(
+        where={"appointmentId": fake_appointment_fin.id}
+    )
     rating_upsert_mock.assert_called()
     rating_upsert_mock.reset_mock()
+    # only the change in score is applied to the tutor's aggregates
+    tutor_update_mock.assert_any_call(
+        where={"id": fake_appointment_fin.tutorId},
+        data={"ratingSum": {"increment": -2}, "ratingCount": {"increment": 0}},
+    )
 
     assert resp.status_code == 200
     assert resp.json["success"] == True
@@ -731,8 +845,9 @@ def test_message_args(
     appointment_find_unique_mock.return_value = fake_appointment
     message_create_mock = mocker.patch("tests.conftest.MessageActions.create")
     message_create_mock.return_value = fake_message
-    pusher_channel_info_mock = mocker.patch("tests.conftest.Pusher.channel_info")
-    pusher_channel_info_mock.return_value = {"occupied": True}
+    is_occupied_mock = mocker.patch("helpers.occupancy.is_occupied")
+    is_occupied_mock.return_value = True
+    publish_mock = mocker.patch("helpers.realtime.RealtimeOutbox.publish")
     notif_mock = mocker.patch("tests.conftest.NotificationActions.create")
     appointment_update_mock = mocker.patch("tests.conftest.AppointmentActions.update")
 
@@ -745,13 +860,17 @@ def test_message_args(
     appointment_update_mock.assert_called()
     appointment_update_mock.reset_mock()
     notif_mock.assert_not_called()
-    pusher_channel_info_mock.assert_called()
-    pusher_channel_info_mock.reset_mock()
+    is_occupied_mock.assert_called_with(fake_appointment.id)
+    # queued for delivery rather than sent by the request
+    publish_mock.assert_called_once_with(
+        fake_appointment.id, "appointment_message", mocker.ANY
+    )
+    publish_mock.reset_mock()
     assert resp.status_code == 200
     assert "id" in resp.json
     assert "sentTime" in resp.json
 
-    pusher_channel_info_mock.return_value = {"occupied": False}
+    is_occupied_mock.return_value = False
     resp = client.post(
         "/appointment/message", json={"id": fake_appointment.id, "message": "hi"}
     )
@@ -760,8 +879,7 @@ def test_message_args(
     appointment_update_mock.assert_called()
     appointment_update_mock.reset_mock()
     notif_mock.assert_called()
-    pusher_channel_info_mock.assert_called()
-    pusher_channel_info_mock.reset_mock()
+    is_occupied_mock.assert_called_with(fake_appointment.id)
     assert resp.status_code == 200
     assert "id" in resp.json
     assert "sentTime" in resp.json
@@ -800,11 +918,19 @@ def test_messages_args(
         "tests.conftest.AppointmentActions.find_unique"
     )
     appointment_find_unique_mock.return_value = fake_appointment_msg
-    fake_appointment_msg.messages = [fake_message2, fake_message]
+    message_find_many_mock = mocker.patch("tests.conftest.MessageActions.find_many")
+    message_find_many_mock.return_value = [fake_message2, fake_message]
 
     # successful message on an appointment
     resp = client.get(f"/appointment/{fake_appointment_msg.id}/messages")
+    message_find_many_mock.assert_called_once_with(
+        where={"appointmentId": fake_appointment_msg.id},
+        order=[{"sentTime": "desc"}, {"id": "asc"}],
+        take=DEFAULT_PAGE_SIZE + 1,
+    )
+    message_find_many_mock.reset_mock()
     assert resp.status_code == 200
+    assert resp.json["nextCursor"] is None
     assert resp.json["messages"] == [
         {
             "id": fake_message2.id,
@@ -819,3 +945,38 @@ def test_messages_args(
             "content": fake_message.content,
         },
     ]
+
+    # only a page of messages, the older ones come after the cursor
+    resp = client.get(
+        f"/appointment/{fake_appointment_msg.id}/messages", query_string={"limit": 1}
+    )
+    assert message_find_many_mock.call_args.kwargs["take"] == 2
+    message_find_many_mock.reset_mock()
+    assert resp.status_code == 200
+    assert [message["id"] for message in resp.json["messages"]] == [fake_message2.id]
+
+    message_find_many_mock.return_value = [fake_message]
+    resp = client.get(
+        f"/appointment/{fake_appointment_msg.id}/messages",
+        query_string={"limit": 1, "before": resp.json["nextCursor"]},
+    )
+    assert message_find_many_mock.call_args.kwargs["where"]["AND"][1] == {
+        "OR": [
+            {"sentTime": {"lt": fake_message2.sentTime}},
+            {
+                "sentTime": {"equals": fake_message2.sentTime},
+                "id": {"gt": fake_message2.id},
+            },
+        ]
+    }
+    assert resp.status_code == 200
+    assert [message["id"] for message in resp.json["messages"]] == [fake_message.id]
+    assert resp.json["nextCursor"] is None
+
+    # invalid cursor
+    resp = client.get(
+        f"/appointment/{fake_appointment_msg.id}/messages",
+        query_string={"before": "invalid"},
+    )
+    assert resp.json == {"error": "cursor is invalid"}
+    assert resp.status_code == 400
@@ -1,6 +1,7 @@
 from pytest_mock import MockerFixture
 from flask.testing import FlaskClient
-from prisma.models import Appointment, User
+from prisma.models import Appointment, Message, User
+from helpers.pagination import DEFAULT_PAGE_SIZE, decode_cursor
 
 ############################## APPOINTMENTS TESTS ##################################
 
@@ -32,10 +33,24 @@ def test_appointments_no_sortby(
         where={"email": fake_student_apt.email}, include=mocker.ANY
     )
 
+    appointment_find_many_mock = mocker.patch(
+        "tests.conftest.AppointmentActions.find_many"
+    )
+    appointment_find_many_mock.return_value = [
+        fake_appointment_msg,
+        fake_appointment_msg2,
+    ]
+
     resp = client.get("/appointments/", query_string={})
+    appointment_find_many_mock.assert_called_once_with(
+        where={"studentId": fake_student_apt.id},
+        order={"id": "asc"},
+        take=DEFAULT_PAGE_SIZE + 1,
+    )
     assert resp.status_code == 200
     assert resp.json == {
-        "appointments": [fake_appointment_msg.id, fake_appointment_msg2.id]
+        "appointments": [fake_appointment_msg.id, fake_appointment_msg2.id],
+        "nextCursor": None,
     }
 
 
@@ -44,6 +59,7 @@ def test_appointments_sortby(
     mocker: MockerFixture,
     find_unique_users_mock,
     fake_student_apt: User,
+    fake_message2: Message,
     fake_appointment_msg: Appointment,
     fake_appointment_msg2: Appointment,
 ):
@@ -73,13 +89,60 @@ def test_appointments_sortby(
         resp.json["error"] == "When specified, 'sortBy' must be equal to 'messageSent'"
     )
 
-    # Invalid appointment id
+    appointment_find_many_mock = mocker.patch(
+        "tests.conftest.AppointmentActions.find_many"
+    )
+    # appointments with messages come first, then those without any
+    fake_appointment_msg.lastMessageAt = fake_message2.sentTime
+    appointment_find_many_mock.side_effect = [
+        [fake_appointment_msg],
+        [fake_appointment_msg2],
+    ]
+
     resp = client.get("/appointments/", query_string={"sortBy": "messageSent"})
+    assert appointment_find_many_mock.call_args_list == [
+        mocker.call(
+            where={
+                "AND": [
+                    {"studentId": fake_student_apt.id},
+                    {"lastMessageAt": {"not": None}},
+                ]
+            },
+            order=[{"lastMessageAt": "desc"}, {"id": "asc"}],
+            take=DEFAULT_PAGE_SIZE + 1,
+        ),
+        mocker.call(
+            where={
+                "AND": [{"studentId": fake_student_apt.id}, {"lastMessageAt": None}]
+            },
+            order={"id": "asc"},
+            # what's left of the page
+            take=DEFAULT_PAGE_SIZE,
+        ),
+    ]
     assert resp.status_code == 200
     assert resp.json == {
-        "appointments": [fake_appointment_msg.id, fake_appointment_msg2.id]
+        "appointments": [fake_appointment_msg.id, fake_appointment_msg2.id],
+        "nextCursor": None,
     }
 
+    # paginated, the first page is full so there's no need for the second query
+    appointment_find_many_mock.reset_mock()
+    appointment_find_many_mock.side_effect = [
+        [fake_appointment_msg, fake_appointment_msg2]
+    ]
+
+    resp = client.get(
+        "/appointments/", query_string={"sortBy": "messageSent", "limit": 1}
+    )
+    appointment_find_many_mock.assert_called_once()
+    assert resp.status_code == 200
+    assert resp.json["appointments"] == [fake_appointment_msg.id]
+    assert decode_cursor(resp.json["nextCursor"]) == [
+        fake_message2.sentTime.isoformat(),
+        fake_appointment_msg.id,
+    ]
+
 
 def test_appointments_no_apt(setup_test: FlaskClient, fake_login, fake_student):
     client = setup_test
@@ -92,4 +155,4 @@ def test_appointments_no_apt(setup_test: FlaskClient, fake_login, fake_student):
 
     resp = client.get("/appointments/", query_string={})
     assert resp.status_code == 200
-    assert resp.json == {"appointments": []}
+    assert resp.json == {"appointments": [], "nextCursor": None}
@@ -107,6 +107,7 @@ def test_register_args(
     assert resp.status_code == 200
     with client.session_transaction() as session:
         assert session["user_id"] == resp.json["id"]
+        assert session["account_type"] == "student"
 
     find_unique_mock.assert_called_with(
         where={"email": fake_student.email}, include=mocker.ANY
@@ -435,10 +436,12 @@ def test_logout_student(
 
     with client.session_transaction() as session:
         assert session["user_id"] == resp1.json["id"]
+        assert session["account_type"] == "student"
 
     resp2 = client.post("/logout")
     with client.session_transaction() as session:
         assert ("user_id" not in session) == True
+        assert "account_type" not in session
     assert resp2.status_code == 200
     assert resp2.json["success"] == True
 
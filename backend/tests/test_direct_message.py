@@ -1,10 +1,12 @@
 from datetime import datetime, timedelta, timezone
+from unittest.mock import call
 from uuid import uuid4
 from flask.testing import FlaskClient
-from prisma.models import User, Message, DirectMessage
+from prisma.models import User, Message, DirectMessage, Notification
 import pytest
 from pytest_mock import MockerFixture
 from pytest_mock.plugin import MockType
+from helpers.pagination import DEFAULT_PAGE_SIZE, decode_cursor
 
 
 @pytest.fixture
@@ -17,7 +19,7 @@ def dm_find_first_mock(mocker: MockerFixture):
     return mocker.patch("tests.conftest.DirectMessageActions.find_first")
 
 
-def test_dm_all_invalid(setup_test: FlaskClient):
+def test_dm_all_invalid(setup_test: FlaskClient, fake_login):
     client = setup_test
 
     # not logged in
@@ -25,6 +27,29 @@ def test_dm_all_invalid(setup_test: FlaskClient):
     assert resp.json["error"] == "No user is logged in"
     assert resp.status_code == 401
 
+    fake_login("fake_student")
+
+    # limit is not a positive integer
+    resp = client.get("directmessage/all", query_string={"limit": "0"})
+    assert resp.json["error"] == "limit must be a positive integer"
+    assert resp.status_code == 400
+
+    # cursor is not a cursor
+    resp = client.get("directmessage/all", query_string={"cursor": "invalid"})
+    assert resp.json["error"] == "cursor is invalid"
+    assert resp.status_code == 400
+
+
+def fake_dm(from_user: User, other_user: User, last_message_at: datetime | None):
+    return DirectMessage(
+        id=str(uuid4()),
+        fromUser=from_user,
+        fromUserId=from_user.id,
+        otherUser=other_user,
+        otherUserId=other_user.id,
+        lastMessageAt=last_message_at,
+    )
+
 
 def test_dm_all_args(
     setup_test: FlaskClient,
@@ -37,145 +62,115 @@ def test_dm_all_args(
     client = setup_test
     fake_login("fake_student")
 
+    user_filter = {
+        "OR": [
+            {"fromUserId": fake_student.id},
+            {"otherUserId": fake_student.id},
+        ]
+    }
+
     # no dms
     dm_find_many_mock.return_value = []
 
     resp = client.get("directmessage/all")
-    dm_find_many_mock.assert_called()
+    # dms with messages sorted by the most recent one, then those without any
+    assert dm_find_many_mock.call_args_list == [
+        call(
+            where={"AND": [user_filter, {"lastMessageAt": {"not": None}}]},
+            order=[{"lastMessageAt": "desc"}, {"id": "asc"}],
+            take=DEFAULT_PAGE_SIZE + 1,
+        ),
+        call(
+            where={"AND": [user_filter, {"lastMessageAt": None}]},
+            order={"id": "asc"},
+            take=DEFAULT_PAGE_SIZE + 1,
+        ),
+    ]
     dm_find_many_mock.reset_mock()
 
     assert resp.json["otherIds"] == []
+    assert resp.json["nextCursor"] is None
     assert resp.status_code == 200
 
     # one dm, no messages
-    dm_find_many_mock.return_value = [
-        DirectMessage(
-            id=str(uuid4()),
-            messages=[],
-            fromUser=fake_student,
-            fromUserId=fake_student.id,
-            otherUser=fake_tutor,
-            otherUserId=fake_tutor.id,
-        )
+    dm_find_many_mock.return_value = None
+    dm_find_many_mock.side_effect = [
+        [],
+        [fake_dm(fake_student, fake_tutor, None)],
     ]
 
     resp = client.get("directmessage/all")
-    dm_find_many_mock.assert_called()
+    assert dm_find_many_mock.call_count == 2
     dm_find_many_mock.reset_mock()
 
     assert resp.json["otherIds"] == [fake_tutor.id]
     assert resp.status_code == 200
 
-    # two dms, no messages
+    # two dms, one with message
     fake_tutor2: User = fake_user("email@email.com", "12345678", "tutor")
-    dm_find_many_mock.return_value = [
-        DirectMessage(
-            id=str(uuid4()),
-            messages=[],
-            fromUser=fake_student,
-            fromUserId=fake_student.id,
-            otherUser=fake_tutor,
-            otherUserId=fake_tutor.id,
-        ),
+    dm_find_many_mock.side_effect = [
         # checking for if route works irrelvant of from and other
-        DirectMessage(
-            id=str(uuid4()),
-            messages=[],
-            fromUser=fake_tutor2,
-            fromUserId=fake_tutor2.id,
-            otherUser=fake_student,
-            otherUserId=fake_student.id,
-        ),
+        [fake_dm(fake_tutor2, fake_student, datetime.now(timezone.utc))],
+        [fake_dm(fake_student, fake_tutor, None)],
     ]
 
     resp = client.get("directmessage/all")
-    dm_find_many_mock.assert_called()
+    assert dm_find_many_mock.call_count == 2
     dm_find_many_mock.reset_mock()
 
-    # should be in order of added by
-    assert resp.json["otherIds"] == [fake_tutor.id, fake_tutor2.id]
+    # a DM without messages should be pushed to the back of the list
+    assert resp.json["otherIds"] == [fake_tutor2.id, fake_tutor.id]
     assert resp.status_code == 200
 
-    # two dms, one with message
-    dm_find_many_mock.return_value = [
-        DirectMessage(
-            id=str(uuid4()),
-            messages=[],
-            fromUser=fake_student,
-            fromUserId=fake_student.id,
-            otherUser=fake_tutor,
-            otherUserId=fake_tutor.id,
-        ),
-        # checking for if route works irrelvant of from and other
-        DirectMessage(
-            id=str(uuid4()),
-            messages=[
-                Message(
-                    id=str(uuid4()),
-                    sentTime=datetime.now(timezone.utc),
-                    content="msg",
-                    sentBy=fake_student,
-                    sentById=fake_student.id,
-                ),
-            ],
-            fromUser=fake_tutor2,
-            fromUserId=fake_tutor2.id,
-            otherUser=fake_student,
-            otherUserId=fake_student.id,
-        ),
-    ]
 
-    resp = client.get("directmessage/all")
-    dm_find_many_mock.assert_called()
-    dm_find_many_mock.reset_mock()
+def test_dm_all_paginated(
+    setup_test: FlaskClient,
+    fake_login,
+    dm_find_many_mock: MockType,
+    fake_student,
+    fake_tutor,
+    fake_user,
+):
+    client = setup_test
+    fake_login("fake_student")
 
-    # a DM without messages should be pushed to the back of the list
-    assert resp.json["otherIds"] == [fake_tutor2.id, fake_tutor.id]
-    assert resp.status_code == 200
+    now = datetime.now(timezone.utc)
+    fake_tutor2: User = fake_user("email@email.com", "12345678", "tutor")
+    dm1 = fake_dm(fake_student, fake_tutor, now)
+    dm2 = fake_dm(fake_tutor2, fake_student, now - timedelta(days=1))
 
-    # two dms, both with messages
-    dm_find_many_mock.return_value = [
-        DirectMessage(
-            id=str(uuid4()),
-            messages=[
-                Message(
-                    id=str(uuid4()),
-                    sentTime=datetime.now(timezone.utc) - timedelta(days=1),
-                    content="msg",
-                    sentBy=fake_student,
-                    sentById=fake_student.id,
-                ),
-            ],
-            fromUser=fake_student,
-            fromUserId=fake_student.id,
-            otherUser=fake_tutor,
-            otherUserId=fake_tutor.id,
-        ),
-        # checking for if route works irrelvant of from and other
-        DirectMessage(
-            id=str(uuid4()),
-            messages=[
-                Message(
-                    id=str(uuid4()),
-                    sentTime=datetime.now(timezone.utc),
-                    content="msg",
-                    sentBy=fake_student,
-                    sentById=fake_student.id,
-                ),
-            ],
-            fromUser=fake_tutor2,
-            fromUserId=fake_tutor2.id,
-            otherUser=fake_student,
-            otherUserId=fake_student.id,
-        ),
-    ]
+    # one more than the limit is found, so there's a next page
+    dm_find_many_mock.return_value = [dm1, dm2]
 
-    resp = client.get("directmessage/all")
-    dm_find_many_mock.assert_called()
+    resp = client.get("directmessage/all", query_string={"limit": "1"})
+    dm_find_many_mock.assert_called_once()
+    assert dm_find_many_mock.call_args.kwargs["take"] == 2
     dm_find_many_mock.reset_mock()
 
-    # the one with the most recently sent message should come first
-    assert resp.json["otherIds"] == [fake_tutor2.id, fake_tutor.id]
+    assert resp.json["otherIds"] == [fake_tutor.id]
+    assert decode_cursor(resp.json["nextCursor"]) == [now.isoformat(), dm1.id]
+    assert resp.status_code == 200
+
+    # the next page continues after the last dm of the previous one, and tops
+    # up with dms without messages
+    dm_find_many_mock.side_effect = [[dm2], []]
+
+    resp = client.get(
+        "directmessage/all",
+        query_string={"limit": "2", "cursor": resp.json["nextCursor"]},
+    )
+    first_call, second_call = dm_find_many_mock.call_args_list
+    assert first_call.kwargs["where"]["AND"][1] == {
+        "OR": [
+            {"lastMessageAt": {"lt": now}},
+            {"lastMessageAt": {"equals": now}, "id": {"gt": dm1.id}},
+        ]
+    }
+    assert first_call.kwargs["take"] == 3
+    assert second_call.kwargs["take"] == 2
+
+    assert resp.json["otherIds"] == [fake_tutor2.id]
+    assert resp.json["nextCursor"] is None
     assert resp.status_code == 200
 
 
@@ -222,9 +217,11 @@ def test_dm_get_args(
     client = setup_test
 
     mocker.patch("tests.conftest.NotificationActions.delete_many")
+    message_find_many_mock = mocker.patch("tests.conftest.MessageActions.find_many")
     fake_login("fake_student")
 
     # dm with no messages
+    message_find_many_mock.return_value = []
     dm_find_first_mock.return_value = DirectMessage(
         id="dm1",
         messages=[],
@@ -236,8 +233,16 @@ def test_dm_get_args(
 
     resp = client.get("directmessage/dm1")
     dm_find_first_mock.assert_called()
+    message_find_many_mock.assert_called_once_with(
+        where={"directMessageId": "dm1"},
+        order=[{"sentTime": "desc"}, {"id": "asc"}],
+        take=DEFAULT_PAGE_SIZE + 1,
+        include={"notification": True},
+    )
+    message_find_many_mock.reset_mock()
 
     assert resp.json["messages"] == []
+    assert resp.json["nextCursor"] is None
     assert resp.status_code == 200
 
     # with messages
@@ -257,14 +262,7 @@ def test_dm_get_args(
         sentById=fake_tutor.id,
     )
 
-    dm_find_first_mock.return_value = DirectMessage(
-        id="dm1",
-        messages=[message2, message1],
-        fromUser=fake_student,
-        fromUserId=fake_student.id,
-        otherUser=fake_tutor,
-        otherUserId=fake_tutor.id,
-    )
+    message_find_many_mock.return_value = [message2, message1]
 
     resp = client.get("directmessage/dm1")
     dm_find_first_mock.assert_called()
@@ -285,6 +283,92 @@ def test_dm_get_args(
     ]
     assert resp.status_code == 200
 
+    # only a page of messages, the older ones come after the cursor
+    resp = client.get("directmessage/dm1", query_string={"limit": 1})
+    assert message_find_many_mock.call_args.kwargs["take"] == 2
+    assert [message["id"] for message in resp.json["messages"]] == [message2.id]
+    assert decode_cursor(resp.json["nextCursor"]) == [
+        message2.sentTime.isoformat(),
+        message2.id,
+    ]
+    assert resp.status_code == 200
+
+    message_find_many_mock.return_value = [message1]
+    resp = client.get(
+        "directmessage/dm1",
+        query_string={"limit": 1, "before": resp.json["nextCursor"]},
+    )
+    assert message_find_many_mock.call_args.kwargs["where"]["AND"][1] == {
+        "OR": [
+            {"sentTime": {"lt": message2.sentTime}},
+            {"sentTime": {"equals": message2.sentTime}, "id": {"gt": message2.id}},
+        ]
+    }
+    assert [message["id"] for message in resp.json["messages"]] == [message1.id]
+    assert resp.json["nextCursor"] is None
+    assert resp.status_code == 200
+
+
+def test_dm_get_clears_notifications(
+    setup_test: FlaskClient,
+    mocker: MockerFixture,
+    fake_login,
+    dm_find_first_mock: MockType,
+    fake_student,
+    fake_tutor,
+):
+    client = setup_test
+
+    delete_many_mock = mocker.patch("tests.conftest.NotificationActions.delete_many")
+    update_many_user_mock = mocker.patch("tests.conftest.UserActions.update_many")
+    message_find_many_mock = mocker.patch("tests.conftest.MessageActions.find_many")
+    fake_login("fake_student")
+
+    dm_find_first_mock.return_value = DirectMessage(
+        id="dm1",
+        fromUserId=fake_student.id,
+        otherUserId=fake_tutor.id,
+    )
+
+    def notified_message(sent_by: User, sent_to: User) -> Message:
+        message_id = str(uuid4())
+        return Message(
+            id=message_id,
+            sentTime=datetime.now(timezone.utc),
+            content="msg",
+            sentById=sent_by.id,
+            notification=Notification(
+                id=str(uuid4()),
+                userId=sent_to.id,
+                content="notification",
+                count=1,
+                messageId=message_id,
+            ),
+        )
+
+    received = notified_message(fake_tutor, fake_student)
+    sent = notified_message(fake_student, fake_tutor)
+    message_find_many_mock.return_value = [received, sent]
+    delete_many_mock.return_value = 1
+
+    resp = client.get("directmessage/dm1")
+    assert resp.status_code == 200
+
+    # only the session user's notifications are cleared, and uncounted
+    delete_many_mock.assert_called_once_with(
+        where={"id": {"in": [received.notification.id]}}
+    )
+    update_many_user_mock.assert_called_once_with(
+        where={"id": fake_student.id}, data={"unreadNotifications": {"increment": -1}}
+    )
+    delete_many_mock.reset_mock()
+
+    # nothing to clear
+    message_find_many_mock.return_value = [sent]
+    resp = client.get("directmessage/dm1")
+    assert resp.status_code == 200
+    delete_many_mock.assert_not_called()
+
 
 def test_dm_post_invalid(
     setup_test: FlaskClient,
@@ -333,6 +417,7 @@ def test_dm_post_args(
     mocker: MockerFixture,
     find_unique_users_mock: MockType,
     dm_find_first_mock: MockType,
+    fake_student,
     fake_tutor,
 ):
     client = setup_test
@@ -342,13 +427,18 @@ def test_dm_post_args(
     dm_find_first_mock.return_value = None
     dm_upsert_mock = mocker.patch("tests.conftest.DirectMessageActions.upsert")
     notification_create_mock = mocker.patch("tests.conftest.NotificationActions.create")
+    is_occupied_mock = mocker.patch("helpers.occupancy.is_occupied")
 
     # no users 'listening' for messages
+    is_occupied_mock.return_value = False
     find_unique_users_mock.return_value = fake_tutor
     resp = client.post(
         "directmessage/", json={"otherId": fake_tutor.id, "message": "some message"}
     )
     dm_upsert_mock.assert_called()
+    # the conversation is sorted by the message in the inbox
+    update = dm_upsert_mock.call_args.kwargs["data"]["update"]
+    assert update["lastMessageAt"].isoformat() == resp.json["sentTime"]
     dm_upsert_mock.reset_mock()
     notification_create_mock.assert_called()
     notification_create_mock.reset_mock()
@@ -358,8 +448,8 @@ def test_dm_post_args(
     assert "sentTime" in resp.json
 
     # a user is 'listening' for messages
-    pusher_channel_info_mock = mocker.patch("tests.conftest.Pusher.channel_info")
-    pusher_channel_info_mock.return_value = {"occupied": True, "subscription_count": 1}
+    is_occupied_mock.return_value = True
+    publish_mock = mocker.patch("helpers.realtime.RealtimeOutbox.publish")
 
     find_unique_users_mock.return_value = fake_tutor
     resp = client.post(
@@ -368,8 +458,17 @@ def test_dm_post_args(
     dm_upsert_mock.assert_called()
     dm_upsert_mock.reset_mock()
     notification_create_mock.assert_not_called()
-    pusher_channel_info_mock.assert_called()
-    pusher_channel_info_mock.reset_mock()
+    is_occupied_mock.assert_called_with(fake_tutor.id)
+    # queued for delivery rather than sent by the request
+    publish_mock.assert_called_once_with(
+        fake_tutor.id,
+        "direct_message",
+        {
+            "fromId": fake_student.id,
+            "content": "some message",
+            "sentTime": resp.json["sentTime"],
+        },
+    )
 
     # no way to really test these unfortunately
     assert "id" in resp.json
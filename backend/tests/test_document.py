@@ -1,9 +1,33 @@
+import os
 import pytest
+from base64 import b64encode
+from datetime import datetime, timezone
+from hashlib import sha256
+from io import BytesIO
+from pathlib import Path
+from time import time
 from pytest_mock import MockerFixture
 from uuid import uuid4
 from flask.testing import FlaskClient
-from prisma.models import Document
+from prisma.models import Document, UploadSession
 from prisma.errors import RecordNotFoundError
+from blueprints.document import collect_expired_uploads
+from helpers.blob_store import BlobCollector, FileSystemBlobStore, write_blob
+from helpers.upload_staging import UploadStaging
+
+
+@pytest.fixture
+def blob_store(setup_test: FlaskClient, mocker: MockerFixture, tmp_path):
+    store = FileSystemBlobStore(str(tmp_path))
+    mocker.patch.dict(setup_test.application.extensions, {"blob_store": store})
+    return store
+
+
+@pytest.fixture
+def upload_staging(setup_test: FlaskClient, mocker: MockerFixture, tmp_path):
+    staging = UploadStaging(str(tmp_path / "uploads"))
+    mocker.patch.dict(setup_test.application.extensions, {"upload_staging": staging})
+    return staging
 
 
 @pytest.fixture
@@ -74,6 +98,7 @@ def test_upload_and_get_valid(
     setup_test: FlaskClient,
     fake_document: Document,
     mocker: MockerFixture,
+    blob_store: FileSystemBlobStore,
     fake_login,
 ):
     client = setup_test
@@ -85,8 +110,24 @@ def test_upload_and_get_valid(
     create_doc_mock = mocker.patch("tests.conftest.DocumentActions.create")
     create_doc_mock.return_value = doc
 
-    resp = client.post("document/", json={"document": "test string input"})
-    create_doc_mock()
+    url = f"data:text/plain;base64,{b64encode(b'test string input').decode()}"
+    resp = client.post("document/", json={"document": url})
+    create_doc_mock.assert_called()
+    # only the content's metadata is stored in the db
+    data = create_doc_mock.call_args.kwargs["data"]
+    assert "document" not in data
+    assert data["blobHash"] == sha256(b"test string input").hexdigest()
+    assert data["size"] == len(b"test string input")
+    assert data["mimeType"] == "text/plain"
+    assert blob_store.exists(data["blobHash"])
+
+    # anything else is stored as is
+    for document in ["test string input", "data:text/plain;base64,!"]:
+        resp = client.post("document/", json={"document": document})
+        assert resp.status_code == 200
+        data = create_doc_mock.call_args.kwargs["data"]
+        assert data["document"] == document
+        assert "blobHash" not in data
 
     assert resp.status_code == 200
     assert resp.json["id"] == doc.id
@@ -103,6 +144,86 @@ def test_upload_and_get_valid(
     assert resp.json["document"] == doc.document
 
 
+def test_upload_and_get_blob(
+    setup_test: FlaskClient,
+    fake_document: Document,
+    mocker: MockerFixture,
+    blob_store: FileSystemBlobStore,
+    fake_login,
+):
+    client = setup_test
+    fake_login("fake_tutor")
+
+    content = b"%PDF-1.4 not really a pdf"
+    url = f"data:application/pdf;base64,{b64encode(content).decode()}"
+    create_doc_mock = mocker.patch("tests.conftest.DocumentActions.create")
+    create_doc_mock.return_value = fake_document
+
+    resp = client.post("document/", json={"document": url, "filename": "notes.pdf"})
+    assert resp.status_code == 200
+    data = create_doc_mock.call_args.kwargs["data"]
+    assert data["blobHash"] == sha256(content).hexdigest()
+    assert data["size"] == len(content)
+    assert data["mimeType"] == "application/pdf"
+    assert data["filename"] == "notes.pdf"
+
+    # read back from the blob store
+    fake_document.document = None
+    fake_document.blobHash = data["blobHash"]
+    fake_document.mimeType = data["mimeType"]
+    mocker.patch("tests.conftest.DocumentActions.find_unique").return_value = (
+        fake_document
+    )
+
+    resp = client.get(f"document/{fake_document.id}")
+    assert resp.status_code == 200
+    assert resp.json["document"] == url
+
+
+def test_get_legacy_document(
+    setup_test: FlaskClient,
+    fake_document: Document,
+    mocker: MockerFixture,
+    blob_store: FileSystemBlobStore,
+):
+    client = setup_test
+
+    content = b"legacy"
+    fake_document.document = f"data:text/plain;base64,{b64encode(content).decode()}"
+    mocker.patch("tests.conftest.DocumentActions.find_unique").return_value = (
+        fake_document
+    )
+    update_many_doc_mock = mocker.patch("tests.conftest.DocumentActions.update_many")
+
+    # served as is, and moved into the blob store
+    resp = client.get(f"document/{fake_document.id}")
+    assert resp.status_code == 200
+    assert resp.json["document"] == fake_document.document
+    update_many_doc_mock.assert_called_once_with(
+        where={"id": fake_document.id, "blobHash": None},
+        data={
+            "blobHash": sha256(content).hexdigest(),
+            "size": len(content),
+            "mimeType": "text/plain",
+            "document": None,
+        },
+    )
+    assert blob_store.exists(sha256(content).hexdigest())
+
+
+def test_write_blob_deduplicated(blob_store: FileSystemBlobStore):
+    blob = write_blob(blob_store, [b"some ", b"content"])
+    assert blob.hash == sha256(b"some content").hexdigest()
+    assert blob.size == len(b"some content")
+
+    # identical content is stored once
+    assert write_blob(blob_store, [b"some content"]) == blob
+    with blob_store.open(blob.hash) as file:
+        assert file.read() == b"some content"
+    # and nothing is left spooled
+    assert list(Path(blob_store.spool_dir()).iterdir()) == []
+
+
 # test get document id doesnt exist
 def test_get_document_invalid_id(setup_test: FlaskClient):
     client = setup_test
@@ -158,3 +279,337 @@ def test_document_delete_args(
     document_delete_mock.assert_called()
     assert resp.json["success"] == True
     assert resp.status_code == 200
+
+
+def test_blob_collector(blob_store: FileSystemBlobStore):
+    old = write_blob(blob_store, [b"old"]).hash
+    used = write_blob(blob_store, [b"used"]).hash
+    new = write_blob(blob_store, [b"new"]).hash
+    an_hour_ago = time() - 60 * 60
+    for key in (old, used):
+        os.utime(blob_store.local_path(key), (an_hour_ago, an_hour_ago))
+
+    # only old blobs nothing refers to are deleted
+    collector = BlobCollector(grace=60)
+    assert collector.collect(blob_store, lambda keys: {used} & set(keys)) == 1
+    assert not blob_store.exists(old)
+    assert blob_store.exists(used)
+    assert blob_store.exists(new)
+
+    # storing a blob again makes it new
+    os.utime(blob_store.local_path(used), (an_hour_ago, an_hour_ago))
+    write_blob(blob_store, [b"used"])
+    assert collector.collect(blob_store, lambda keys: set()) == 0
+    assert blob_store.exists(used)
+    assert not blob_store.delete_older_than(used, 60)
+    assert blob_store.delete_older_than(used, 0)
+    assert not blob_store.exists(used)
+
+
+def test_upload_file_invalid(
+    setup_test: FlaskClient,
+    mocker: MockerFixture,
+    blob_store: FileSystemBlobStore,
+    fake_login,
+):
+    client = setup_test
+
+    resp = client.put("document/file", data=b"content")
+    assert resp.json == {"error": "No user is logged in"}
+    assert resp.status_code == 401
+
+    fake_login("fake_student")
+    resp = client.put("document/file", data=b"content")
+    assert resp.json == {"error": "User is not a tutor"}
+    assert resp.status_code == 401
+
+    client.post("/logout")
+    fake_login("fake_tutor")
+
+    # no file in the form
+    resp = client.post("document/file", data={})
+    assert resp.json == {"error": "'file' was missing from field(s)"}
+    assert resp.status_code == 400
+
+    # too large, whether or not its length was sent
+    mocker.patch.dict(setup_test.application.config, {"DOCUMENT_MAX_SIZE": 4})
+    resp = client.put("document/file", data=b"content")
+    assert resp.json == {"error": "document is larger than 4 bytes"}
+    assert resp.status_code == 413
+
+    resp = client.put(
+        "document/file",
+        input_stream=BytesIO(b"content"),
+        headers={"Transfer-Encoding": "chunked"},
+        # as set by gunicorn for chunked requests
+        environ_overrides={"wsgi.input_terminated": True},
+    )
+    assert resp.json == {"error": "document is larger than 4 bytes"}
+    assert resp.status_code == 413
+
+    # and nothing is left behind
+    assert list(Path(blob_store.spool_dir()).iterdir()) == []
+    assert not blob_store.exists(sha256(b"content").hexdigest())
+
+
+def test_upload_and_get_file(
+    setup_test: FlaskClient,
+    fake_document: Document,
+    mocker: MockerFixture,
+    blob_store: FileSystemBlobStore,
+    fake_login,
+):
+    client = setup_test
+    fake_login("fake_tutor")
+
+    content = b"%PDF-1.4 " + bytes(range(256)) * 8
+    create_doc_mock = mocker.patch("tests.conftest.DocumentActions.create")
+    create_doc_mock.return_value = fake_document
+
+    # the body is the file
+    resp = client.put(
+        "document/file",
+        query_string={"filename": "notes.pdf"},
+        data=content,
+        content_type="application/pdf",
+    )
+    assert resp.status_code == 200
+    assert resp.json["id"] == fake_document.id
+    data = create_doc_mock.call_args.kwargs["data"]
+    assert data["blobHash"] == sha256(content).hexdigest()
+    assert data["size"] == len(content)
+    assert data["mimeType"] == "application/pdf"
+    assert data["filename"] == "notes.pdf"
+
+    # or it's in a form
+    resp = client.post(
+        "document/file",
+        data={"file": (BytesIO(content), "lecture.pdf", "application/pdf")},
+        content_type="multipart/form-data",
+    )
+    assert resp.status_code == 200
+    data = create_doc_mock.call_args.kwargs["data"]
+    assert data["blobHash"] == sha256(content).hexdigest()
+    assert data["filename"] == "lecture.pdf"
+
+    fake_document.document = None
+    fake_document.blobHash = data["blobHash"]
+    fake_document.mimeType = data["mimeType"]
+    fake_document.filename = data["filename"]
+    mocker.patch("tests.conftest.DocumentActions.find_unique").return_value = (
+        fake_document
+    )
+
+    resp = client.get(f"document/{fake_document.id}/file")
+    assert resp.status_code == 200
+    assert resp.data == content
+    assert resp.mimetype == "application/pdf"
+    assert resp.headers["ETag"] == f'"{fake_document.blobHash}"'
+    assert resp.headers["Accept-Ranges"] == "bytes"
+    resp.close()
+
+    # unchanged since it was last downloaded
+    resp = client.get(
+        f"document/{fake_document.id}/file",
+        headers={"If-None-Match": f'"{fake_document.blobHash}"'},
+    )
+    assert resp.status_code == 304
+    assert resp.data == b""
+    resp.close()
+
+    # part of it
+    resp = client.get(
+        f"document/{fake_document.id}/file", headers={"Range": "bytes=9-264"}
+    )
+    assert resp.status_code == 206
+    assert resp.data == content[9:265]
+    assert resp.headers["Content-Range"] == f"bytes 9-264/{len(content)}"
+    resp.close()
+
+    resp = client.get(
+        f"document/{fake_document.id}/file",
+        headers={"Range": f"bytes={len(content)}-"},
+    )
+    assert resp.json == {"error": "Range is not satisfiable"}
+    assert resp.status_code == 416
+
+
+def test_get_file_invalid(setup_test: FlaskClient, mocker: MockerFixture):
+    client = setup_test
+
+    mocker.patch("tests.conftest.DocumentActions.find_unique").return_value = None
+    resp = client.get("document/1/file")
+    assert resp.json == {"error": "document id does not exist"}
+    assert resp.status_code == 400
+
+
+def upload_chunk(client: FlaskClient, session_id: str, index: int, chunk: bytes):
+    return client.put(
+        f"document/uploads/{session_id}/{index}",
+        data=chunk,
+        headers={"X-Chunk-Sha256": sha256(chunk).hexdigest()},
+    )
+
+
+def test_upload_session_invalid(
+    setup_test: FlaskClient,
+    mocker: MockerFixture,
+    upload_staging: UploadStaging,
+    fake_login,
+):
+    client = setup_test
+
+    resp = client.post("document/uploads", json={"size": 10})
+    assert resp.json == {"error": "No user is logged in"}
+    assert resp.status_code == 401
+
+    fake_login("fake_student")
+    resp = client.post("document/uploads", json={"size": 10})
+    assert resp.json == {"error": "User is not a tutor"}
+    assert resp.status_code == 401
+
+    client.post("/logout")
+    fake_login("fake_tutor")
+
+    resp = client.post("document/uploads", json={"size": 0})
+    assert resp.json == {"error": "size must be a positive integer"}
+    assert resp.status_code == 400
+
+    mocker.patch.dict(setup_test.application.config, {"DOCUMENT_MAX_SIZE": 4})
+    resp = client.post("document/uploads", json={"size": 10})
+    assert resp.json == {"error": "document is larger than 4 bytes"}
+    assert resp.status_code == 413
+
+    # doesn't exist, or isn't the user's, or has expired
+    find_first_mock = mocker.patch("tests.conftest.UploadSessionActions.find_first")
+    find_first_mock.return_value = None
+    resp = upload_chunk(client, "notvalid", 0, b"content")
+    assert resp.json == {"error": "Upload session does not exist"}
+    assert resp.status_code == 404
+
+
+def test_resumable_upload(
+    setup_test: FlaskClient,
+    mocker: MockerFixture,
+    blob_store: FileSystemBlobStore,
+    upload_staging: UploadStaging,
+    fake_tutor,
+    fake_login,
+):
+    client = setup_test
+    fake_login("fake_tutor")
+    mocker.patch.dict(setup_test.application.config, {"UPLOAD_CHUNK_SIZE": 4})
+    content = b"0123456789"
+    upload = UploadSession(
+        id=str(uuid4()),
+        tutorId=fake_tutor.id,
+        filename="digits.txt",
+        mimeType="text/plain",
+        size=len(content),
+        chunkSize=4,
+        createdAt=datetime.now(timezone.utc),
+    )
+    create_mock = mocker.patch("tests.conftest.UploadSessionActions.create")
+    create_mock.return_value = upload
+    mocker.patch("tests.conftest.UploadSessionActions.find_first").return_value = upload
+    delete_many_mock = mocker.patch("tests.conftest.UploadSessionActions.delete_many")
+    create_doc_mock = mocker.patch("tests.conftest.DocumentActions.create")
+    create_doc_mock.return_value = Document(id=str(uuid4()), tutorId=fake_tutor.id)
+
+    resp = client.post(
+        "document/uploads",
+        json={"size": len(content), "filename": "digits.txt", "mimeType": "text/plain"},
+    )
+    assert resp.status_code == 200
+    assert resp.json == {"id": upload.id, "chunkSize": 4, "chunks": 3, "received": []}
+    assert create_mock.call_args.kwargs["data"]["chunkSize"] == 4
+
+    # chunks that aren't the right size, or were corrupted, are rejected
+    resp = upload_chunk(client, upload.id, 0, b"012")
+    assert resp.json == {"error": "chunk must be 4 bytes"}
+    assert resp.status_code == 400
+    resp = client.put(
+        f"document/uploads/{upload.id}/0",
+        data=b"0123",
+        headers={"X-Chunk-Sha256": sha256(b"0124").hexdigest()},
+    )
+    assert resp.json == {"error": "chunk does not match its checksum"}
+    assert resp.status_code == 400
+    resp = upload_chunk(client, upload.id, 3, b"0123")
+    assert resp.json == {"error": "index must be less than 3"}
+    assert resp.status_code == 400
+
+    # chunks can be sent out of order, the last being what's left
+    assert upload_chunk(client, upload.id, 2, b"89").status_code == 204
+    assert upload_chunk(client, upload.id, 0, b"0123").status_code == 204
+
+    # which can't be committed until every chunk has been received
+    resp = client.post(f"document/uploads/{upload.id}/commit", json={})
+    assert resp.json == {"error": "1 chunk(s) have not been uploaded"}
+    assert resp.status_code == 400
+
+    # a client resuming the upload finds what's left to send
+    resp = client.get(f"document/uploads/{upload.id}")
+    assert resp.json["received"] == [0, 2]
+    assert upload_chunk(client, upload.id, 1, b"4567").status_code == 204
+
+    resp = client.post(
+        f"document/uploads/{upload.id}/commit",
+        json={"sha256": sha256(content).hexdigest()},
+    )
+    assert resp.status_code == 200
+    assert resp.json == {"id": create_doc_mock.return_value.id}
+    delete_many_mock.assert_called_once_with(where={"id": upload.id})
+    data = create_doc_mock.call_args.kwargs["data"]
+    assert data["blobHash"] == sha256(content).hexdigest()
+    assert data["size"] == len(content)
+    assert data["filename"] == "digits.txt"
+    assert data["mimeType"] == "text/plain"
+    assert blob_store.open(data["blobHash"]).read() == content
+    assert upload_staging.received(upload.id) == []
+
+    # committed by another request
+    upload_staging.create(upload.id)
+    delete_many_mock.return_value = 0
+    create_doc_mock.reset_mock()
+    for index, chunk in enumerate([b"0123", b"4567", b"89"]):
+        upload_chunk(client, upload.id, index, chunk)
+    resp = client.post(f"document/uploads/{upload.id}/commit", json={})
+    assert resp.json == {"error": "Upload session does not exist"}
+    assert resp.status_code == 404
+    create_doc_mock.assert_not_called()
+
+    # deleted (or collected) after its chunks were counted
+    read = upload_staging.read
+
+    def discard_then_read(session_id, count):
+        upload_staging.discard(session_id)
+        return read(session_id, count)
+
+    mocker.patch.object(upload_staging, "read", side_effect=discard_then_read)
+    resp = client.post(f"document/uploads/{upload.id}/commit", json={})
+    assert resp.json == {"error": "Upload session does not exist"}
+    assert resp.status_code == 404
+    create_doc_mock.assert_not_called()
+
+
+def test_upload_staging_expiry(
+    setup_test: FlaskClient, mocker: MockerFixture, upload_staging: UploadStaging
+):
+    upload_staging.create("expired")
+    upload_staging.create("current")
+    old = datetime.now().timestamp() - 120
+    os.utime(os.path.join(upload_staging.root, "expired"), (old, old))
+
+    assert upload_staging.discard_older_than(60) == 1
+    assert os.listdir(upload_staging.root) == ["current"]
+
+    # as run by Maintenance, expired sessions are deleted along with their chunks
+    upload_staging.create("expired")
+    os.utime(os.path.join(upload_staging.root, "expired"), (old, old))
+    mocker.patch.dict(setup_test.application.config, {"UPLOAD_SESSION_TTL": 60})
+    delete_many_mock = mocker.patch("tests.conftest.UploadSessionActions.delete_many")
+    with setup_test.application.app_context():
+        collect_expired_uploads()
+    delete_many_mock.assert_called_once_with(where={"createdAt": {"lt": mocker.ANY}})
+    assert os.listdir(upload_staging.root) == ["current"]
@@ -0,0 +1,87 @@
+from flask.testing import FlaskClient
+from prisma.models import User
+from pytest_mock import MockerFixture
+from helpers import identity_map
+from helpers.views import student_view, tutor_view, user_view
+
+
+def test_identity_map_find_unique(
+    setup_test: FlaskClient,
+    mocker: MockerFixture,
+    fake_tutor: User,
+):
+    find_unique_mock = mocker.patch("tests.conftest.UserActions.find_unique")
+    find_unique_mock.return_value = fake_tutor
+
+    with setup_test.application.app_context():
+        # loaded once, then reused for lookups covered by what was included
+        tutor = tutor_view(id=fake_tutor.id, include={"appointments"})
+        assert tutor_view(id=fake_tutor.id).id == tutor.id
+        assert user_view(id=fake_tutor.id).id == tutor.id
+        find_unique_mock.assert_called_once_with(
+            where={"id": fake_tutor.id},
+            include={"tutorInfo": {"include": {"appointments": True}}},
+        )
+
+        # missing relations are loaded
+        student_view(id=fake_tutor.id)
+        assert find_unique_mock.call_count == 2
+
+    # a new request starts empty
+    with setup_test.application.app_context():
+        user_view(email=fake_tutor.email)
+        assert find_unique_mock.call_count == 3
+
+        # found by email means found by id
+        user_view(id=fake_tutor.id)
+        assert find_unique_mock.call_count == 3
+
+
+def test_identity_map_defer(
+    setup_test: FlaskClient,
+    mocker: MockerFixture,
+    fake_tutor: User,
+    fake_student: User,
+):
+    find_unique_mock = mocker.patch("tests.conftest.UserActions.find_unique")
+    find_many_mock = mocker.patch("tests.conftest.UserActions.find_many")
+    find_many_mock.return_value = [fake_tutor, fake_student]
+
+    with setup_test.application.app_context():
+        identity_map.defer(User, [fake_tutor.id, fake_student.id, "missing"])
+        assert user_view(id=fake_student.id).id == fake_student.id
+        assert user_view(id=fake_tutor.id).id == fake_tutor.id
+        find_many_mock.assert_called_once_with(
+            where={"id": {"in": [fake_tutor.id, fake_student.id, "missing"]}},
+            include=None,
+        )
+        find_unique_mock.assert_not_called()
+
+        # ids missing from the batch are looked up on their own
+        find_unique_mock.return_value = None
+        assert user_view(id="missing") is None
+        find_unique_mock.assert_called_once()
+
+
+def test_identity_map_forget(
+    setup_test: FlaskClient,
+    mocker: MockerFixture,
+    fake_tutor: User,
+):
+    find_unique_mock = mocker.patch("tests.conftest.UserActions.find_unique")
+
+    with setup_test.application.app_context():
+        # missing records are remembered too
+        find_unique_mock.return_value = None
+        assert user_view(email=fake_tutor.email) is None
+        assert user_view(email=fake_tutor.email) is None
+        assert find_unique_mock.call_count == 1
+
+        # until something's written
+        find_unique_mock.return_value = fake_tutor
+        identity_map.forget()
+        assert user_view(email=fake_tutor.email).id == fake_tutor.id
+        assert find_unique_mock.call_count == 2
+
+    # a no-op outside of a request
+    identity_map.forget()
@@ -0,0 +1,28 @@
+from threading import Event
+from flask import has_app_context
+from flask.testing import FlaskClient
+from helpers.maintenance import Maintenance
+
+
+def test_maintenance_runs_jobs(setup_test: FlaskClient, tmp_path):
+    ran = Event()
+
+    def job():
+        # run within an app context, as they use current_app
+        if has_app_context():
+            ran.set()
+
+    maintenance = Maintenance(setup_test.application, str(tmp_path / "lock"))
+    maintenance.add_job("job", 0.01, job)
+    maintenance.start()
+    assert ran.wait(timeout=5)
+
+
+def test_maintenance_job_fails(setup_test: FlaskClient, tmp_path, caplog):
+    def job():
+        raise RuntimeError("failed")
+
+    # logged rather than stopping the other jobs
+    maintenance = Maintenance(setup_test.application, str(tmp_path / "lock"))
+    maintenance.run_job({"name": "failing", "interval": 1, "run": job})
+    assert "maintenance job failing failed" in caplog.text
@@ -1,3 +1,4 @@
+import json
 import pytest
 from pytest_mock import MockerFixture
 from uuid import uuid4
@@ -5,6 +6,11 @@ from flask.testing import FlaskClient
 from prisma.models import User, Notification, Appointment
 from datetime import datetime, timedelta
 from pytest_mock.plugin import MockType
+from helpers.create_notification import (
+    create_notification,
+    uncount_deleted_user_notifications,
+)
+from helpers.notification_hub import NotificationHub
 
 
 @pytest.fixture
@@ -34,6 +40,7 @@ def fake_student_notification(fake_student) -> Notification:
         forUser=fake_student,
         userId=fake_student.id,
         content="fake notification",
+        count=1,
     )
 
     return notification
@@ -46,6 +53,7 @@ def fake_tutor_notification(fake_tutor) -> Notification:
         forUser=fake_tutor,
         userId=fake_tutor.id,
         content="fake notification",
+        count=1,
     )
 
     return notification
@@ -87,6 +95,7 @@ def test_get_notification_invalid(
         forUser=fake_student2,
         userId=fake_student2.id,
         content="fake notification",
+        count=1,
     )
 
     find_unique_notification_mock.return_value = notification
@@ -294,3 +303,392 @@ def test_notification_apt_modify(
     find_unique_appt_mock.assert_called()
     update_appt_mock.assert_called()
     create_notification_mock.assert_called()
+
+
+def test_notifications_stream(
+    setup_test: FlaskClient,
+    mocker: MockerFixture,
+    fake_student: User,
+    fake_student_notification: Notification,
+    fake_login,
+):
+    client = setup_test
+
+    resp = client.get("notifications/stream")
+    assert resp.json == {"error": "No user is logged in"}
+    assert resp.status_code == 401
+
+    fake_login("fake_student")
+
+    find_many_notification_mock = mocker.patch(
+        "tests.conftest.NotificationActions.find_many"
+    )
+    find_many_notification_mock.return_value = [fake_student_notification]
+    mocker.patch.dict(client.application.config, {"NOTIFICATION_STREAM_TIMEOUT": 1})
+
+    resp = client.get("notifications/stream", buffered=False)
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/event-stream"
+    events = resp.iter_encoded()
+
+    # waiting notifications are sent first
+    assert (
+        next(events) == f'data: {{"id": "{fake_student_notification.id}"}}\n\n'.encode()
+    )
+    find_many_notification_mock.assert_called_once_with(
+        where={"userId": fake_student.id}
+    )
+
+    # followed by new ones, as they're created
+    hub = client.application.extensions["notification_hub"]
+    hub.publish(fake_student.id, "new notification")
+    hub.publish("someone else", "not for this user")
+    assert next(events) == b'data: {"id": "new notification"}\n\n'
+
+    # until the stream times out, with nothing but keepalive comments
+    assert all(chunk.startswith(b":") for chunk in events)
+    resp.close()
+
+
+def test_notifications_stream_limit(
+    setup_test: FlaskClient,
+    mocker: MockerFixture,
+    fake_login,
+):
+    client = setup_test
+    fake_login("fake_student")
+    mocker.patch("tests.conftest.NotificationActions.find_many").return_value = []
+    hub = NotificationHub(max_streams=1)
+    mocker.patch.dict(client.application.extensions, {"notification_hub": hub})
+
+    resp = client.get("notifications/stream", buffered=False)
+    assert resp.status_code == 200
+
+    # every slot is taken, so the worker's threads are left for other requests
+    full = client.get("notifications/stream")
+    assert full.json == {"error": "Too many notification streams are open"}
+    assert full.status_code == 503
+
+    # until a stream is closed
+    resp.close()
+    resp = client.get("notifications/stream", buffered=False)
+    assert resp.status_code == 200
+    resp.close()
+
+
+def test_create_notification_published(
+    setup_test: FlaskClient,
+    create_notification_mock: MockType,
+    fake_student: User,
+):
+    with setup_test.application.app_context():
+        hub = setup_test.application.extensions["notification_hub"]
+        with hub.subscribe(fake_student.id) as subscription:
+            create_notification(fake_student.id, "content")
+            notification_id = create_notification_mock.call_args.kwargs["data"]["id"]
+            assert subscription.get(timeout=1) == notification_id
+
+        # no longer subscribed
+        create_notification(fake_student.id, "content")
+        assert subscription.get(timeout=0.1) is None
+
+
+def test_notifications_details(
+    setup_test: FlaskClient,
+    mocker: MockerFixture,
+    fake_student: User,
+    fake_student_notification: Notification,
+    fake_login,
+):
+    client = setup_test
+
+    resp = client.get("notifications/details", query_string={"ids": "[]"})
+    assert resp.json == {"error": "No user is logged in"}
+    assert resp.status_code == 401
+
+    fake_login("fake_student")
+
+    # ids is not a list of strings
+    resp = client.get("notifications/details", query_string={"ids": "[1]"})
+    assert resp.json == {"error": "ids field must be a list of strings"}
+    assert resp.status_code == 400
+
+    message_notification = Notification(
+        id=str(uuid4()),
+        forUser=fake_student,
+        userId=fake_student.id,
+        content="fake message notification",
+        count=1,
+        messageId=str(uuid4()),
+    )
+    find_many_notification_mock = mocker.patch(
+        "tests.conftest.NotificationActions.find_many"
+    )
+    find_many_notification_mock.return_value = [
+        fake_student_notification,
+        message_notification,
+    ]
+    delete_many_notification_mock = mocker.patch(
+        "tests.conftest.NotificationActions.delete_many"
+    )
+
+    ids = [message_notification.id, "someone else's", fake_student_notification.id]
+    resp = client.get("notifications/details", query_string={"ids": json.dumps(ids)})
+    find_many_notification_mock.assert_called_once_with(
+        where={"id": {"in": ids}, "userId": fake_student.id}
+    )
+    # in the order requested, and not acknowledged
+    assert resp.status_code == 200
+    assert resp.json == {
+        "notifications": [
+            {
+                "id": message_notification.id,
+                "type": "message",
+                "content": message_notification.content,
+                "count": 1,
+            },
+            {
+                "id": fake_student_notification.id,
+                "type": "appointment",
+                "content": fake_student_notification.content,
+                "count": 1,
+            },
+        ]
+    }
+    delete_many_notification_mock.assert_not_called()
+
+
+def test_notifications_ack(
+    setup_test: FlaskClient,
+    mocker: MockerFixture,
+    fake_student: User,
+    fake_login,
+):
+    client = setup_test
+
+    resp = client.post("notifications/ack", json={"ids": []})
+    assert resp.json == {"error": "No user is logged in"}
+    assert resp.status_code == 401
+
+    fake_login("fake_student")
+
+    # ids was omitted
+    resp = client.post("notifications/ack", json={})
+    assert resp.json == {"error": "'ids' was missing from field(s)"}
+    assert resp.status_code == 400
+
+    # ids is not a list of strings
+    resp = client.post("notifications/ack", json={"ids": [1]})
+    assert resp.json == {"error": "ids field must be a list of strings"}
+    assert resp.status_code == 400
+
+    # too many ids
+    resp = client.post("notifications/ack", json={"ids": ["id"] * 101})
+    assert resp.json == {"error": "at most 100 ids can be requested"}
+    assert resp.status_code == 400
+
+    delete_many_notification_mock = mocker.patch(
+        "tests.conftest.NotificationActions.delete_many"
+    )
+    delete_many_notification_mock.return_value = 2
+
+    resp = client.post("notifications/ack", json={"ids": ["id1", "id2", "id3"]})
+    # only the user's own notifications are acknowledged
+    delete_many_notification_mock.assert_called_once_with(
+        where={"id": {"in": ["id1", "id2", "id3"]}, "userId": fake_student.id}
+    )
+    assert resp.status_code == 200
+    assert resp.json == {"acknowledged": 2}
+
+
+def test_notifications_count(
+    setup_test: FlaskClient,
+    mocker: MockerFixture,
+    fake_student: User,
+    fake_student_notification: Notification,
+    create_notification_mock: MockType,
+    find_unique_users_mock: MockType,
+    find_unique_notification_mock: MockType,
+    fake_login,
+):
+    client = setup_test
+    update_many_user_mock = mocker.patch("tests.conftest.UserActions.update_many")
+
+    resp = client.get("notifications/count")
+    assert resp.json == {"error": "No user is logged in"}
+    assert resp.status_code == 401
+
+    fake_login("fake_student")
+
+    # answered from the counter, without touching the notifications
+    count_notifications_mock = mocker.patch("tests.conftest.NotificationActions.count")
+    find_unique_users_mock.return_value = fake_student
+    fake_student.unreadNotifications = 3
+    resp = client.get("notifications/count")
+    assert resp.status_code == 200
+    assert resp.json == {"count": 3}
+    count_notifications_mock.assert_not_called()
+
+    # created notifications are counted
+    with client.application.app_context():
+        create_notification(fake_student.id, "content")
+    create_notification_mock.assert_called_once()
+    update_many_user_mock.assert_called_once_with(
+        where={"id": fake_student.id}, data={"unreadNotifications": {"increment": 1}}
+    )
+    update_many_user_mock.reset_mock()
+
+    # as are read ones
+    find_unique_notification_mock.return_value = fake_student_notification
+    mocker.patch("tests.conftest.NotificationActions.delete")
+    resp = client.get(f"notifications/{fake_student_notification.id}")
+    assert resp.status_code == 200
+    update_many_user_mock.assert_called_once_with(
+        where={"id": fake_student.id}, data={"unreadNotifications": {"increment": -1}}
+    )
+    update_many_user_mock.reset_mock()
+
+    # and acknowledged ones, by how many there were
+    delete_many_notification_mock = mocker.patch(
+        "tests.conftest.NotificationActions.delete_many"
+    )
+    delete_many_notification_mock.return_value = 2
+    resp = client.post("notifications/ack", json={"ids": ["id1", "id2", "id3"]})
+    assert resp.status_code == 200
+    update_many_user_mock.assert_called_once_with(
+        where={"id": fake_student.id}, data={"unreadNotifications": {"increment": -2}}
+    )
+    update_many_user_mock.reset_mock()
+
+    # a counter which has drifted is recounted when every notification is loaded
+    fake_student.notifications = [fake_student_notification]
+    count_notifications_mock.return_value = 1
+    resp = client.get("notifications/")
+    assert resp.json == {"notifications": [fake_student_notification.id]}
+    count_notifications_mock.assert_called_once_with(where={"userId": fake_student.id})
+    update_many_user_mock.assert_called_once_with(
+        where={"id": fake_student.id}, data={"unreadNotifications": 1}
+    )
+
+
+def test_uncount_deleted_user_notifications(
+    setup_test: FlaskClient, mocker: MockerFixture
+):
+    app = setup_test.application
+    update_many_user_mock = mocker.patch("tests.conftest.UserActions.update_many")
+    find_many_notification_mock = mocker.patch(
+        "tests.conftest.NotificationActions.find_many"
+    )
+    find_many_notification_mock.return_value = [
+        Notification(id=str(i), userId=user_id, content="content", count=1)
+        for i, user_id in enumerate(["other1", "other2", "other1"])
+    ]
+
+    # notifications of other users, about the deleted user, are uncounted
+    with app.app_context():
+        uncount_deleted_user_notifications("deleted", None)
+    where = find_many_notification_mock.call_args.kwargs["where"]
+    assert where["userId"] == {"not": "deleted"}
+    update_many_user_mock.assert_any_call(
+        where={"id": "other1"}, data={"unreadNotifications": {"increment": -2}}
+    )
+    update_many_user_mock.assert_any_call(
+        where={"id": "other2"}, data={"unreadNotifications": {"increment": -1}}
+    )
+    assert update_many_user_mock.call_count == 2
+
+
+def test_create_notification_coalesced(
+    setup_test: FlaskClient,
+    mocker: MockerFixture,
+    create_notification_mock: MockType,
+    fake_student: User,
+):
+    app = setup_test.application
+    upsert_notification_mock = mocker.patch("tests.conftest.NotificationActions.upsert")
+    update_many_user_mock = mocker.patch("tests.conftest.UserActions.update_many")
+    where = {
+        "userId_conversationKey": {
+            "userId": fake_student.id,
+            "conversationKey": "directMessage:dm1",
+        }
+    }
+
+    with app.app_context():
+        hub = app.extensions["notification_hub"]
+
+        # disabled, so every message gets a notification
+        create_notification(
+            fake_student.id,
+            "content",
+            message_id="1",
+            conversation_key="directMessage:dm1",
+        )
+        create_notification_mock.assert_called_once()
+        upsert_notification_mock.assert_not_called()
+        update_many_user_mock.reset_mock()
+
+        mocker.patch.dict(app.config, {"NOTIFICATION_COALESCING": True})
+
+        # the first message of a conversation creates a notification
+        def created(where, data):
+            return Notification(
+                id=data["create"]["id"],
+                userId=fake_student.id,
+                content=data["create"]["content"],
+                count=1,
+                messageId="2",
+                conversationKey=data["create"]["conversationKey"],
+            )
+
+        upsert_notification_mock.side_effect = created
+        with hub.subscribe(fake_student.id) as subscription:
+            notification = create_notification(
+                fake_student.id,
+                "content",
+                message_id="2",
+                conversation_key="directMessage:dm1",
+            )
+            assert subscription.get(timeout=1) == notification.id
+
+        upsert_notification_mock.assert_called_once()
+        assert upsert_notification_mock.call_args.kwargs["where"] == where
+        assert (
+            upsert_notification_mock.call_args.kwargs["data"]["create"][
+                "conversationKey"
+            ]
+            == "directMessage:dm1"
+        )
+        update_many_user_mock.assert_called_once_with(
+            where={"id": fake_student.id},
+            data={"unreadNotifications": {"increment": 1}},
+        )
+        update_many_user_mock.reset_mock()
+        upsert_notification_mock.reset_mock()
+
+        # later ones update it, which isn't another unread notification
+        upsert_notification_mock.side_effect = None
+        upsert_notification_mock.return_value = Notification(
+            id=notification.id,
+            userId=fake_student.id,
+            content="content",
+            count=2,
+            messageId="3",
+            conversationKey="directMessage:dm1",
+        )
+        with hub.subscribe(fake_student.id) as subscription:
+            create_notification(
+                fake_student.id,
+                "content",
+                message_id="3",
+                conversation_key="directMessage:dm1",
+            )
+            assert subscription.get(timeout=1) == notification.id
+
+        assert upsert_notification_mock.call_args.kwargs["data"]["update"] == {
+            "content": "content",
+            "count": {"increment": 1},
+            "message": {"connect": {"id": "3"}},
+        }
+        update_many_user_mock.assert_not_called()
+        create_notification_mock.assert_called_once()
@@ -0,0 +1,82 @@
+import json
+import pytest
+from helpers.realtime import (
+    MAX_BATCH_SIZE,
+    InMemoryTransport,
+    PermanentDeliveryError,
+    RealtimeOutbox,
+)
+
+
+class FlakyTransport(InMemoryTransport):
+    def __init__(self, failures: int, error: Exception):
+        super().__init__()
+        self.failures = failures
+        self.error = error
+        self.attempts = 0
+
+    def trigger_batch(self, events):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise self.error
+        super().trigger_batch(events)
+
+
+def test_outbox_delivers_in_batches():
+    transport = InMemoryTransport()
+    outbox = RealtimeOutbox(transport, workers=1)
+
+    for i in range(25):
+        outbox.publish("channel", "event", {"i": i})
+
+    assert outbox.flush(timeout=5)
+    assert [json.loads(event["data"])["i"] for event in transport.events] == list(
+        range(25)
+    )
+    assert all(len(batch) <= MAX_BATCH_SIZE for batch in transport.batches)
+
+
+def test_outbox_invalid_event():
+    outbox = RealtimeOutbox(InMemoryTransport())
+
+    # rejected when published, rather than when delivered
+    with pytest.raises(TypeError):
+        outbox.publish("channel", "event", {"not json": object()})
+
+    assert outbox.flush(timeout=0)
+
+
+def test_outbox_retries():
+    transport = FlakyTransport(failures=2, error=ConnectionError())
+    outbox = RealtimeOutbox(transport, workers=1, backoff=0.01)
+
+    outbox.publish("channel", "event", {})
+    assert outbox.flush(timeout=5)
+    assert transport.attempts == 3
+    assert len(transport.events) == 1
+
+    # given up on after max_attempts
+    transport = FlakyTransport(failures=5, error=ConnectionError())
+    outbox = RealtimeOutbox(transport, workers=1, max_attempts=3, backoff=0.01)
+
+    outbox.publish("channel", "event", {})
+    assert outbox.flush(timeout=5)
+    assert transport.attempts == 3
+    assert transport.events == []
+
+    # not retried when it'll never succeed
+    transport = FlakyTransport(failures=5, error=PermanentDeliveryError())
+    outbox = RealtimeOutbox(transport, workers=1, backoff=0.01)
+
+    outbox.publish("channel", "event", {})
+    assert outbox.flush(timeout=5)
+    assert transport.attempts == 1
+
+
+def test_outbox_channel_info():
+    transport = InMemoryTransport()
+    outbox = RealtimeOutbox(transport)
+
+    assert not outbox.channel_info("channel")["occupied"]
+    transport.subscribe("channel")
+    assert outbox.channel_info("channel")["occupied"]
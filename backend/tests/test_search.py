@@ -4,7 +4,20 @@ import json
 from flask.testing import FlaskClient
 from prisma.models import Subject, User, Tutor, Appointment, Rating, TutorAvailability
 from datetime import datetime, timedelta, timezone
+from pytest_mock import MockerFixture
 from pytest_mock.plugin import MockType
+from helpers.tutor_search import build_search_where, search_tutors
+from helpers.pagination import DEFAULT_PAGE_SIZE, decode_cursor
+from helpers.tutor_search_index import TutorSearchIndex
+from helpers.availability import IntervalIndex, find_overlap, overlaps_any
+
+SEARCH_ORDER = [{"ratingAverage": "desc"}, {"id": "asc"}]
+
+
+def search_ids(index: TutorSearchIndex, filters) -> List[str]:
+    ids, next_cursor = index.search(filters, {})
+    assert next_cursor is None
+    return ids
 
 
 @pytest.fixture
@@ -41,6 +54,9 @@ def generate_fake_tutors(fake_user) -> List[Tutor]:
     tutor1.tutorInfo.timesAvailable = []
     apt1.rating = rating1
     tutor1.tutorInfo.ratings = [rating1]
+    tutor1.tutorInfo.ratingSum = 2
+    tutor1.tutorInfo.ratingCount = 1
+    tutor1.tutorInfo.ratingAverage = 2
     tutor1.tutorInfo.appointments = [apt1]
 
     # second tutor
@@ -77,6 +93,9 @@ def generate_fake_tutors(fake_user) -> List[Tutor]:
     tutor2.tutorInfo.timesAvailable = [timesAvailable1]
     apt2.rating = rating2
     tutor2.tutorInfo.ratings = [rating2]
+    tutor2.tutorInfo.ratingSum = 4
+    tutor2.tutorInfo.ratingCount = 1
+    tutor2.tutorInfo.ratingAverage = 4
     tutor2.tutorInfo.appointments = [apt2]
 
     # third tutor
@@ -114,6 +133,9 @@ def generate_fake_tutors(fake_user) -> List[Tutor]:
     apt3.rating = rating3
     tutor3.tutorInfo.appointments = [apt3]
     tutor3.tutorInfo.ratings = [rating3]
+    tutor3.tutorInfo.ratingSum = 3
+    tutor3.tutorInfo.ratingCount = 1
+    tutor3.tutorInfo.ratingAverage = 3
 
     return tutor1.tutorInfo, tutor2.tutorInfo, tutor3.tutorInfo
 
@@ -140,17 +162,31 @@ def test_search_no_args(
 
 def test_search_only_name(
     setup_test: FlaskClient,
+    mocker: MockerFixture,
     find_many_tutors_mock: MockType,
     generate_fake_tutors: List[User],
 ):
     client = setup_test
 
     tutor1, tutor2, tutor3 = generate_fake_tutors
-    find_many_tutors_mock.return_value = [tutor1, tutor2, tutor3]
+    # filtering is done by the db, so the mock returns what the db would
+    find_many_tutors_mock.return_value = [tutor1]
 
     # only name
-    resp = client.get("/searchtutor", query_string={"name": "James"})
-    find_many_tutors_mock.assert_called()
+    resp = client.get("/searchtutor", query_string={"name": " James "})
+    find_many_tutors_mock.assert_called_with(
+        where={
+            "AND": [
+                {
+                    "userInfo": {
+                        "is": {"name": {"contains": "James", "mode": "insensitive"}}
+                    }
+                }
+            ]
+        },
+        order=SEARCH_ORDER,
+        take=DEFAULT_PAGE_SIZE + 1,
+    )
 
     assert resp.status_code == 200
     assert len(resp.json["tutorIds"]) == 1
@@ -159,29 +195,40 @@ def test_search_only_name(
 
 def test_search_only_location(
     setup_test: FlaskClient,
+    mocker: MockerFixture,
     find_many_tutors_mock: MockType,
     generate_fake_tutors: List[Tutor],
 ):
     client = setup_test
 
     tutor1, tutor2, tutor3 = generate_fake_tutors
-    find_many_tutors_mock.return_value = [tutor1, tutor2, tutor3]
+    find_many_tutors_mock.return_value = [tutor2, tutor3]
 
     # only location
     resp = client.get("/searchtutor", query_string={"location": "Tasmania"})
-    find_many_tutors_mock.assert_called()
+    find_many_tutors_mock.assert_called_with(
+        where={
+            "AND": [
+                {
+                    "userInfo": {
+                        "is": {
+                            "location": {
+                                "contains": "Tasmania",
+                                "mode": "insensitive",
+                            }
+                        }
+                    }
+                }
+            ]
+        },
+        order=SEARCH_ORDER,
+        take=DEFAULT_PAGE_SIZE + 1,
+    )
 
     assert len(resp.json["tutorIds"]) == 2
     assert resp.status_code == 200
     assert all(id in [tutor2.id, tutor3.id] for id in resp.json["tutorIds"])
 
-    resp = client.get("/searchtutor", query_string={"location": "Australia"})
-    find_many_tutors_mock.assert_called()
-
-    assert len(resp.json["tutorIds"]) == 1
-    assert resp.status_code == 200
-    assert resp.json["tutorIds"][0] == tutor1.id
-
 
 def test_search_only_ratings(
     setup_test: FlaskClient,
@@ -191,118 +238,110 @@ def test_search_only_ratings(
     client = setup_test
 
     tutor1, tutor2, tutor3 = generate_fake_tutors
-    find_many_tutors_mock.return_value = [tutor1, tutor2, tutor3]
-
-    # only rating
-    resp = client.get("/searchtutor", query_string={"rating": 2})
-    find_many_tutors_mock.assert_called()
-
-    assert len(resp.json["tutorIds"]) == 3
-    assert resp.status_code == 200
-    assert all(id in [tutor1.id, tutor2.id, tutor3.id] for id in resp.json["tutorIds"])
+    find_many_tutors_mock.return_value = [tutor2, tutor3]
 
+    # only rating, filtered on the tutors' precomputed average
     resp = client.get("/searchtutor", query_string={"rating": 3})
-    find_many_tutors_mock.assert_called()
+    find_many_tutors_mock.assert_called_with(
+        where={"AND": [{"ratingAverage": {"gte": 3.0}}]},
+        order=SEARCH_ORDER,
+        take=DEFAULT_PAGE_SIZE + 1,
+    )
 
     assert len(resp.json["tutorIds"]) == 2
     assert resp.status_code == 200
     assert all(id in [tutor2.id, tutor3.id] for id in resp.json["tutorIds"])
 
-    resp = client.get("/searchtutor", query_string={"rating": 4})
-    find_many_tutors_mock.assert_called()
-
-    assert len(resp.json["tutorIds"]) == 1
-    assert resp.status_code == 200
-    assert resp.json["tutorIds"][0] == tutor2.id
-
 
 def test_search_only_course_offerings(
     setup_test: FlaskClient,
+    mocker: MockerFixture,
     find_many_tutors_mock: MockType,
     generate_fake_tutors: List[Tutor],
 ):
     client = setup_test
 
     tutor1, tutor2, tutor3 = generate_fake_tutors
-    find_many_tutors_mock.return_value = [tutor1, tutor2, tutor3]
+    find_many_tutors_mock.return_value = [tutor1, tutor3]
 
     # only courseOfferings
     resp = client.get(
-        "/searchtutor", query_string={"courseOfferings": json.dumps(["math"])}
+        "/searchtutor", query_string={"courseOfferings": json.dumps(["Math"])}
     )
-    find_many_tutors_mock.assert_called()
-
-    assert len(resp.json["tutorIds"]) == 2
-    assert resp.status_code == 200
-    assert all(id in [tutor1.id, tutor3.id] for id in resp.json["tutorIds"])
-
-    resp = client.get(
-        "/searchtutor", query_string={"courseOfferings": json.dumps(["science"])}
+    find_many_tutors_mock.assert_called_with(
+        where={
+            "AND": [
+                {
+                    "courseOfferings": {
+                        "some": {"name": {"in": ["math"], "mode": "insensitive"}}
+                    }
+                }
+            ]
+        },
+        order=SEARCH_ORDER,
+        take=DEFAULT_PAGE_SIZE + 1,
     )
-    find_many_tutors_mock.assert_called()
 
     assert len(resp.json["tutorIds"]) == 2
     assert resp.status_code == 200
-    assert all(id in [tutor2.id, tutor3.id] for id in resp.json["tutorIds"])
-
-    resp = client.get(
-        "/searchtutor",
-        query_string={"courseOfferings": json.dumps(["math", "science"])},
-    )
-    find_many_tutors_mock.assert_called()
+    assert all(id in [tutor1.id, tutor3.id] for id in resp.json["tutorIds"])
 
-    assert len(resp.json["tutorIds"]) == 3
-    assert resp.status_code == 200
-    assert all(id in [tutor1.id, tutor2.id, tutor3.id] for id in resp.json["tutorIds"])
+    resp = client.get("/searchtutor", query_string={"courseOfferings": "[math"})
+    assert resp.json == {"error": "courseOfferings field must be valid JSON"}
+    assert resp.status_code == 400
 
 
 def test_search_only_time_range(
     setup_test: FlaskClient,
+    mocker: MockerFixture,
     find_many_tutors_mock: MockType,
     generate_fake_tutors: List[Tutor],
 ):
     client = setup_test
 
     tutor1, tutor2, tutor3 = generate_fake_tutors
-    find_many_tutors_mock.return_value = [tutor1, tutor2, tutor3]
+    find_many_tutors_mock.return_value = [tutor3]
+
+    st = datetime(2024, 1, 1, 10)
+    et = datetime(2024, 1, 1, 12)
 
     # only timeRange
     resp = client.get(
         "/searchtutor",
         query_string={
             "timeRange": json.dumps(
-                {
-                    "startTime": (datetime.now() + timedelta(hours=1)).isoformat(),
-                    "endTime": (datetime.now() + timedelta(days=10)).isoformat(),
-                }
+                {"startTime": st.isoformat(), "endTime": et.isoformat()}
             )
         },
     )
-    find_many_tutors_mock.assert_called()
-
-    assert resp.status_code == 200
-    assert len(resp.json["tutorIds"]) == 2
-    assert all(id in [tutor2.id, tutor3.id] for id in resp.json["tutorIds"])
-
-    resp = client.get(
-        "/searchtutor",
-        query_string={
-            "timeRange": json.dumps(
+    find_many_tutors_mock.assert_called_with(
+        where={
+            "AND": [
                 {
-                    "startTime": (datetime.now() + timedelta(hours=1)).isoformat(),
-                    "endTime": (
-                        datetime.now() + timedelta(days=3, hours=10)
-                    ).isoformat(),
+                    "timesAvailable": {
+                        "some": {
+                            "startTime": {"lte": et.replace(tzinfo=timezone.utc)},
+                            "endTime": {"gte": st.replace(tzinfo=timezone.utc)},
+                        }
+                    }
                 }
-            )
+            ]
         },
+        order=SEARCH_ORDER,
+        take=DEFAULT_PAGE_SIZE + 1,
     )
-    find_many_tutors_mock.assert_called()
 
     assert resp.status_code == 200
     assert len(resp.json["tutorIds"]) == 1
     assert resp.json["tutorIds"][0] == tutor3.id
 
+    resp = client.get(
+        "/searchtutor",
+        query_string={"timeRange": json.dumps({"startTime": st.isoformat()})},
+    )
+    assert resp.json == {"error": "field(s) were missing in 'timeRange'"}
+    assert resp.status_code == 400
+
 
 def test_search_args(
     setup_test: FlaskClient,
@@ -312,7 +351,7 @@ def test_search_args(
     client = setup_test
 
     tutor1, tutor2, tutor3 = generate_fake_tutors
-    find_many_tutors_mock.return_value = [tutor1, tutor2, tutor3]
+    find_many_tutors_mock.return_value = [tutor3]
 
     # all excluding name
     resp = client.get(
@@ -332,7 +371,282 @@ def test_search_args(
         },
     )
     find_many_tutors_mock.assert_called()
+    _, kwargs = find_many_tutors_mock.call_args
+    assert len(kwargs["where"]["AND"]) == 4
 
     assert len(resp.json["tutorIds"]) == 1
     assert resp.status_code == 200
     assert resp.json["tutorIds"][0] == tutor3.id
+
+
+def test_build_search_where_empty():
+    assert build_search_where({}) == {}
+
+
+def test_search_index(
+    mocker: MockerFixture,
+    find_many_tutors_mock: MockType,
+    generate_fake_tutors: List[Tutor],
+):
+    tutor1, tutor2, tutor3 = generate_fake_tutors
+    find_many_tutors_mock.return_value = [tutor1, tutor2, tutor3]
+
+    index = TutorSearchIndex(max_age=60)
+
+    # sorted by rating when not searching on courseOfferings
+    assert search_ids(index, {}) == [tutor2.id, tutor3.id, tutor1.id]
+    assert search_ids(index, {"name": "jam"}) == [tutor1.id]
+    assert search_ids(index, {"location": "tasmania"}) == [tutor2.id, tutor3.id]
+    assert search_ids(index, {"courseOfferings": ["math"]}) == [tutor3.id, tutor1.id]
+    assert search_ids(index, {"rating": 3}) == [tutor2.id, tutor3.id]
+    # tutor3 offers both searched subjects, so is more relevant than tutor2
+    assert search_ids(index, {"courseOfferings": ["math", "science"]}) == [
+        tutor3.id,
+        tutor2.id,
+        tutor1.id,
+    ]
+    assert search_ids(
+        index,
+        {
+            "location": "tasmania",
+            "courseOfferings": ["math", "science"],
+            "startTime": datetime.now(timezone.utc) + timedelta(hours=1),
+            "endTime": datetime.now(timezone.utc) + timedelta(days=3, hours=10),
+        },
+    ) == [tutor3.id]
+
+    # index is only built once
+    find_many_tutors_mock.assert_called_once()
+
+    # a tutor changes their location, only they are reloaded
+    find_unique_tutor_mock = mocker.patch("tests.conftest.TutorActions.find_unique")
+    tutor1.userInfo.location = "Tasmania"
+    find_unique_tutor_mock.return_value = tutor1
+    index.invalidate(tutor1.id)
+
+    assert search_ids(index, {"location": "tasmania"}) == [
+        tutor2.id,
+        tutor3.id,
+        tutor1.id,
+    ]
+    find_unique_tutor_mock.assert_called_once_with(
+        where={"id": tutor1.id}, include=mocker.ANY
+    )
+    find_many_tutors_mock.assert_called_once()
+
+    # a tutor is deleted
+    find_unique_tutor_mock.return_value = None
+    index.invalidate(tutor1.id)
+
+    assert search_ids(index, {}) == [tutor2.id, tutor3.id]
+    assert search_ids(index, {"name": "james"}) == []
+
+
+def test_search_index_matches_database(
+    find_many_tutors_mock: MockType,
+    generate_fake_tutors: List[Tutor],
+):
+    tutor1, tutor2, tutor3 = generate_fake_tutors
+    tutor1.userInfo.location = "New South Wales"
+    tutors = [tutor1, tutor2, tutor3]
+
+    def contains(tutor: Tutor, condition) -> bool:
+        # the only `contains` conditions are on userInfo, and are insensitive
+        ((field, value),) = condition["userInfo"]["is"].items()
+        text = getattr(tutor.userInfo, field)
+        return text is not None and value["contains"].lower() in text.lower()
+
+    def find_many(where=None, **kwargs):
+        # the index loads every tutor without a `where`
+        return [
+            tutor
+            for tutor in tutors
+            if all(
+                contains(tutor, condition) for condition in (where or {}).get("AND", [])
+            )
+        ]
+
+    find_many_tutors_mock.side_effect = find_many
+    index = TutorSearchIndex(max_age=60)
+
+    def index_ids(filters) -> List[str]:
+        return sorted(search_ids(index, filters))
+
+    def database_ids(filters) -> List[str]:
+        ids, _ = search_tutors(filters, {})
+        return sorted(ids)
+
+    for filters in [
+        {"name": "ja"},
+        {"name": "JOHN"},
+        {"name": "oh"},
+        {"name": "j n"},
+        {"location": "th wa"},
+        {"location": "ew wa"},
+        {"location": "south wales"},
+        {"location": "ania"},
+        {"location": "w s"},
+        {"location": ""},
+        {"name": "j", "location": "tas"},
+    ]:
+        assert index_ids(filters) == database_ids(filters), filters
+
+    # matches within and across words, not just whole words or their prefixes
+    assert index_ids({"location": "th wa"}) == [tutor1.id]
+    assert index_ids({"location": "ania"}) == sorted([tutor2.id, tutor3.id])
+    # every word is present, but not together
+    assert index_ids({"location": "ew wa"}) == []
+
+
+def test_search_with_index(
+    setup_test: FlaskClient,
+    mocker: MockerFixture,
+    find_many_tutors_mock: MockType,
+    generate_fake_tutors: List[Tutor],
+):
+    client = setup_test
+    app = client.application
+    mocker.patch.dict(app.config, {"TUTOR_SEARCH_INDEX": True})
+    mocker.patch.dict(
+        app.extensions, {"tutor_search_index": TutorSearchIndex(max_age=60)}
+    )
+
+    tutor1, tutor2, tutor3 = generate_fake_tutors
+    find_many_tutors_mock.return_value = [tutor1, tutor2, tutor3]
+
+    resp = client.get("/searchtutor", query_string={"location": "Tasmania"})
+    assert resp.status_code == 200
+    assert resp.json == {"tutorIds": [tutor2.id, tutor3.id], "nextCursor": None}
+
+    resp = client.get("/searchtutor", query_string={"rating": 4})
+    assert resp.status_code == 200
+    assert resp.json["tutorIds"] == [tutor2.id]
+
+    find_many_tutors_mock.assert_called_once_with(include=mocker.ANY)
+
+    # paginated, tutor3 offers both subjects so comes first
+    query = {"courseOfferings": json.dumps(["math", "science"]), "limit": 2}
+    resp = client.get("/searchtutor", query_string=query)
+    assert resp.status_code == 200
+    assert resp.json["tutorIds"] == [tutor3.id, tutor2.id]
+    assert decode_cursor(resp.json["nextCursor"]) == [1, 4, tutor2.id]
+
+    query["cursor"] = resp.json["nextCursor"]
+    resp = client.get("/searchtutor", query_string=query)
+    assert resp.status_code == 200
+    assert resp.json == {"tutorIds": [tutor1.id], "nextCursor": None}
+
+
+def test_search_paginated(
+    setup_test: FlaskClient,
+    mocker: MockerFixture,
+    find_many_tutors_mock: MockType,
+    generate_fake_tutors: List[Tutor],
+):
+    client = setup_test
+
+    tutor1, tutor2, tutor3 = generate_fake_tutors
+    # a page and one extra tutor are fetched
+    find_many_tutors_mock.return_value = [tutor2, tutor3]
+
+    resp = client.get("/searchtutor", query_string={"limit": 1})
+    find_many_tutors_mock.assert_called_with(where={}, order=SEARCH_ORDER, take=2)
+    assert resp.status_code == 200
+    assert resp.json["tutorIds"] == [tutor2.id]
+    assert decode_cursor(resp.json["nextCursor"]) == [0, 4, tutor2.id]
+
+    # the next page starts after the previous page's last tutor
+    find_many_tutors_mock.return_value = [tutor3]
+    resp = client.get(
+        "/searchtutor",
+        query_string={"limit": 1, "cursor": resp.json["nextCursor"]},
+    )
+    find_many_tutors_mock.assert_called_with(
+        where={
+            "AND": [
+                {},
+                {
+                    "OR": [
+                        {"ratingAverage": {"lt": 4}},
+                        {"ratingAverage": {"equals": 4}, "id": {"gt": tutor2.id}},
+                    ]
+                },
+            ]
+        },
+        order=SEARCH_ORDER,
+        take=2,
+    )
+    assert resp.json == {"tutorIds": [tutor3.id], "nextCursor": None}
+
+    # limits are capped
+    client.get("/searchtutor", query_string={"limit": 1000})
+    find_many_tutors_mock.assert_called_with(where={}, order=SEARCH_ORDER, take=101)
+
+    # only a page is fetched without a limit too e.g. by the landing page
+    mocker.patch("helpers.pagination.DEFAULT_PAGE_SIZE", 1)
+    find_many_tutors_mock.return_value = [tutor2, tutor3]
+    resp = client.get("/searchtutor")
+    find_many_tutors_mock.assert_called_with(where={}, order=SEARCH_ORDER, take=2)
+    assert resp.json["tutorIds"] == [tutor2.id]
+    assert decode_cursor(resp.json["nextCursor"]) == [0, 4, tutor2.id]
+
+
+def test_search_paginated_invalid(setup_test: FlaskClient):
+    client = setup_test
+
+    resp = client.get("/searchtutor", query_string={"limit": 0})
+    assert resp.json == {"error": "limit must be a positive integer"}
+    assert resp.status_code == 400
+
+    resp = client.get("/searchtutor", query_string={"cursor": "not a cursor"})
+    assert resp.json == {"error": "cursor is invalid"}
+    assert resp.status_code == 400
+
+
+def test_interval_index():
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    # overlapping intervals of differing lengths
+    intervals = [
+        (base + timedelta(hours=i), base + timedelta(hours=i + (i * 7) % 5), str(i))
+        for i in range(50)
+    ]
+    index = IntervalIndex(intervals)
+
+    for st_offset, et_offset in [(0, 0), (3, 4), (10, 30), (-5, -1), (48, 60), (4, 4)]:
+        st = base + timedelta(hours=st_offset)
+        et = base + timedelta(hours=et_offset)
+
+        closed = [v for s, e, v in sorted(intervals) if s <= et and e >= st]
+        half_open = [v for s, e, v in sorted(intervals) if s < et and e > st]
+
+        assert sorted(index.overlapping(st, et)) == sorted(closed)
+        assert index.any_overlapping(st, et) == (len(closed) != 0)
+        assert sorted(index.overlapping(st, et, closed=False)) == sorted(half_open)
+        assert index.any_overlapping(st, et, closed=False) == (len(half_open) != 0)
+
+    assert IntervalIndex([]).overlapping(base, base) == []
+    assert not IntervalIndex([]).any_overlapping(base, base)
+
+
+def test_find_overlap():
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    hour = timedelta(hours=1)
+
+    # touching blocks don't overlap
+    assert find_overlap([(base + hour, base + 2 * hour), (base, base + hour)]) is None
+    assert find_overlap([]) is None
+    assert find_overlap(
+        [(base, base + 5 * hour), (base + 2 * hour, base + 3 * hour)]
+    ) == ((base, base + 5 * hour), (base + 2 * hour, base + 3 * hour))
+
+
+def test_overlaps_any():
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    hour = timedelta(hours=1)
+    blocks = [(base, base + hour), (base + 3 * hour, base + 5 * hour)]
+
+    # touching blocks don't overlap
+    assert not overlaps_any(blocks, base + hour, base + 3 * hour)
+    assert not overlaps_any([], base, base + hour)
+    assert overlaps_any(blocks, base + 2 * hour, base + 4 * hour)
+    assert overlaps_any(blocks, base + 4 * hour, base + 4 * hour + timedelta(minutes=1))
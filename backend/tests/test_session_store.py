@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta, timezone
+from flask.testing import FlaskClient
+from prisma.models import Session
+from pytest_mock import MockerFixture
+from helpers.session_store import (
+    MemorySessionStore,
+    PostgresSessionStore,
+    ServerSessionInterface,
+)
+
+
+def test_session_lazy_writes(
+    setup_test: FlaskClient, mocker: MockerFixture, fake_login
+):
+    client = setup_test
+    app = client.application
+    store = MemorySessionStore(maxsize=10, lifetime=app.permanent_session_lifetime)
+    mocker.patch.object(app, "session_interface", ServerSessionInterface(store))
+    save_spy = mocker.spy(store, "save")
+    sweep_spy = mocker.spy(store, "sweep")
+
+    # nothing is stored without anything in the session
+    resp = client.get("/utils/getuserid")
+    assert resp.status_code == 404
+    assert "Set-Cookie" not in resp.headers
+    save_spy.assert_not_called()
+
+    fake_login("fake_student")
+    save_spy.assert_called_once()
+    sid = save_spy.call_args.args[0]
+    assert store.load(sid)[0]["account_type"] == "student"
+
+    # only read
+    resp = client.get("/utils/getuserid")
+    assert resp.status_code == 200
+    assert "Set-Cookie" not in resp.headers
+    save_spy.assert_called_once()
+
+    # unless it's over half way to expiring
+    data, _ = store.load(sid)
+    store.save(sid, data, datetime.now(timezone.utc) + timedelta(hours=1))
+    save_spy.reset_mock()
+    client.get("/utils/getuserid")
+    save_spy.assert_called_once()
+    assert store.load(sid)[1] > datetime.now(timezone.utc) + timedelta(days=1)
+
+    client.post("/logout")
+    assert store.load(sid) is None
+    assert client.get("/utils/getuserid").status_code == 404
+
+    # expired sessions are swept by Maintenance, never while saving one
+    sweep_spy.assert_not_called()
+
+
+def test_session_sweep(setup_test: FlaskClient, mocker: MockerFixture):
+    store = MemorySessionStore(maxsize=10, lifetime=timedelta(seconds=-1))
+    store.save("expired", {"user_id": "1"}, datetime.now(timezone.utc))
+    assert store.sweep() == 1
+    assert store.load("expired") is None
+
+    delete_many_mock = mocker.patch("tests.conftest.SessionActions.delete_many")
+    delete_many_mock.return_value = 2
+    assert PostgresSessionStore().sweep() == 2
+    where = delete_many_mock.call_args.kwargs["where"]
+    assert where["expiresAt"]["lte"] <= datetime.now(timezone.utc)
+
+    # stored as they were set
+    find_first_mock = mocker.patch("tests.conftest.SessionActions.find_first")
+    upsert_mock = mocker.patch("tests.conftest.SessionActions.upsert")
+    expires = datetime.now(timezone.utc) + timedelta(days=1)
+    PostgresSessionStore().save("sid", {"user_id": "1", "n": (1, 2)}, expires)
+    data = upsert_mock.call_args.kwargs["data"]["create"]
+    assert data["userId"] == "1"
+    find_first_mock.return_value = Session(
+        id="sid", data=data["data"], expiresAt=data["expiresAt"]
+    )
+    assert PostgresSessionStore().load("sid") == (
+        {"user_id": "1", "n": (1, 2)},
+        expires,
+    )
+
+
+def test_session_permanent(setup_test: FlaskClient, mocker: MockerFixture, fake_login):
+    client = setup_test
+    app = client.application
+    store = MemorySessionStore(maxsize=10, lifetime=app.permanent_session_lifetime)
+    mocker.patch.object(app, "session_interface", ServerSessionInterface(store))
+    save_spy = mocker.spy(store, "save")
+
+    # the cookie expires along with the stored session
+    fake_login("fake_student")
+    cookie = client.get_cookie(app.config["SESSION_COOKIE_NAME"])
+    expires = save_spy.call_args.args[2]
+    assert cookie.expires == expires.replace(microsecond=0)
+
+    client.post("/logout")
+    mocker.patch.dict(app.config, {"SESSION_PERMANENT": False})
+    fake_login("fake_student")
+    cookie = client.get_cookie(app.config["SESSION_COOKIE_NAME"])
+    assert cookie.expires is None
+
+
+def test_session_end_user_sessions(setup_test: FlaskClient, mocker: MockerFixture):
+    expires = datetime.now(timezone.utc) + timedelta(days=1)
+    store = MemorySessionStore(maxsize=10, lifetime=timedelta(days=1))
+    store.save("a", {"user_id": "1"}, expires)
+    store.save("b", {"user_id": "1", "account_type": "student"}, expires)
+    store.save("c", {"user_id": "2"}, expires)
+    store.save("d", {"n": 1}, expires)
+
+    interface = ServerSessionInterface(store)
+    assert interface.end_user_sessions("1") == 2
+    assert store.load("a") is None and store.load("b") is None
+    assert store.load("c") is not None and store.load("d") is not None
+
+    delete_many_mock = mocker.patch("tests.conftest.SessionActions.delete_many")
+    delete_many_mock.return_value = 1
+    assert PostgresSessionStore().delete_user("2") == 1
+    delete_many_mock.assert_called_with(where={"userId": "2"})
@@ -3,7 +3,7 @@ from pytest_mock import MockerFixture
 from uuid import uuid4
 from flask.testing import FlaskClient
 from datetime import datetime, timedelta, timezone
-from prisma.models import Appointment, User
+from prisma.models import Appointment, Rating, User
 from pytest_mock.plugin import MockType
 
 
@@ -291,6 +291,31 @@ def test_delete_admin_login(
     assert resp.json == {"success": True}
     assert resp.status_code == 200
 
+    # ratings of the student's appointments are taken off their tutors'
+    # aggregates, as read after the tutors are locked
+    mocker.patch("tests.conftest.AppointmentActions.find_many").return_value = [
+        Appointment(
+            id=id,
+            startTime=datetime.now(timezone.utc),
+            endTime=datetime.now(timezone.utc),
+            tutorAccepted=True,
+            studentId=fake_student.id,
+            tutorId="tutor1",
+        )
+        for id in ["apt1", "apt2"]
+    ]
+    mocker.patch("tests.conftest.RatingActions.find_many").return_value = [
+        Rating(id="r1", score=5, appointmentId="apt1", tutorId="tutor1"),
+        Rating(id="r2", score=2, appointmentId="apt2", tutorId="tutor1"),
+    ]
+    tutor_update_mock = mocker.patch("tests.conftest.TutorActions.update")
+    resp = client.delete("/student/", json={"id": fake_student.id})
+    tutor_update_mock.assert_any_call(
+        where={"id": "tutor1"},
+        data={"ratingSum": {"increment": -7}, "ratingCount": {"increment": -2}},
+    )
+    assert resp.status_code == 200
+
 
 ########################### STUDENT APPOINTMENT TESTS ##########################
 
@@ -1,10 +1,13 @@
 import pytest
+import json
 from pytest_mock import MockerFixture
 from uuid import uuid4
 from flask.testing import FlaskClient
 from prisma.models import Subject, User, TutorAvailability, Appointment, Rating
 from datetime import datetime, timedelta, timezone
 from pytest_mock.plugin import MockType
+from helpers.profile_cache import ProfileCache, tutor_changed
+from helpers.ttl_cache import TTLCache
 
 
 @pytest.fixture
@@ -36,6 +39,9 @@ def generate_tutor(fake_tutor, fake_student) -> User:
     apt.rating = rating
     fake_tutor.tutorInfo.appointments = [apt]
     fake_tutor.tutorInfo.ratings = [rating]
+    fake_tutor.tutorInfo.ratingSum = 2
+    fake_tutor.tutorInfo.ratingCount = 1
+    fake_tutor.tutorInfo.ratingAverage = 2
     fake_tutor.tutorInfo.courseOfferings = [science]
 
     return fake_tutor
@@ -100,7 +106,19 @@ def test_get_valid(
     tutor = generate_tutor
 
     resp = client.get(f"/tutor/{tutor.id}")
-    custom_find_unique.assert_called_with(where={"id": tutor.id}, include=mocker.ANY)
+    # only the relations shown on the profile are loaded
+    custom_find_unique.assert_called_with(
+        where={"id": tutor.id},
+        include={
+            "tutorInfo": {
+                "include": {
+                    "courseOfferings": True,
+                    "documents": True,
+                    "timesAvailable": True,
+                }
+            }
+        },
+    )
 
     assert resp.status_code == 200
     assert resp.json["id"] == tutor.id
@@ -115,6 +133,131 @@ def test_get_valid(
     assert len(resp.json["timesAvailable"]) == 0
 
 
+def test_get_conditional(
+    setup_test: FlaskClient,
+    mocker: MockerFixture,
+    custom_find_unique: MockType,
+    generate_tutor: User,
+):
+    client = setup_test
+    tutor = generate_tutor
+    mocker.patch.dict(
+        client.application.config, {"PUBLIC_CACHE_CONTROL": "public, max-age=60"}
+    )
+
+    resp = client.get(f"/tutor/{tutor.id}")
+    assert resp.status_code == 200
+    assert resp.headers["Cache-Control"] == "public, max-age=60"
+    etag = resp.headers["ETag"]
+
+    # unchanged, so only the version is looked up and the body isn't sent
+    custom_find_unique.reset_mock()
+    resp = client.get(f"/tutor/{tutor.id}", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.data == b""
+    assert resp.headers["ETag"] == etag
+    assert resp.headers["Cache-Control"] == "public, max-age=60"
+    custom_find_unique.assert_called_once_with(where={"id": tutor.id}, include=None)
+
+    # changed since
+    tutor.version += 1
+    resp = client.get(f"/tutor/{tutor.id}", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.json["id"] == tutor.id
+    assert resp.headers["ETag"] != etag
+
+    # the same version of another route isn't the same response
+    resp = client.get(f"/student/{tutor.id}", headers={"If-None-Match": etag})
+    assert resp.status_code == 404
+
+
+def test_get_cached(
+    setup_test: FlaskClient,
+    mocker: MockerFixture,
+    custom_find_unique: MockType,
+    generate_tutor: User,
+):
+    client = setup_test
+    tutor = generate_tutor
+    cache = ProfileCache(TTLCache(maxsize=10, ttl=60))
+    mocker.patch.dict(client.application.extensions, {"profile_cache": cache})
+
+    resp = client.get(f"/tutor/{tutor.id}")
+    assert resp.status_code == 200
+    assert cache.stats() == {"hits": 0, "misses": 1, "size": 1}
+
+    # only the version is looked up
+    custom_find_unique.reset_mock()
+    tutor.name = "Not yet shown"
+    resp = client.get(f"/tutor/{tutor.id}")
+    assert resp.json["name"] == "Terry"
+    custom_find_unique.assert_called_once_with(where={"id": tutor.id}, include=None)
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+    # until it's changed (by any worker)
+    tutor.version += 1
+    resp = client.get(f"/tutor/{tutor.id}")
+    assert resp.json["name"] == "Not yet shown"
+    assert cache.stats()["misses"] == 2
+
+    # entries are dropped when their tutor changes
+    with client.application.app_context():
+        tutor_changed(tutor.id)
+    assert cache.stats()["size"] == 0
+
+
+def test_get_batch(
+    setup_test: FlaskClient,
+    find_many_users_mock: MockType,
+    generate_tutor: User,
+):
+    client = setup_test
+
+    tutor = generate_tutor
+
+    resp = client.get("/tutor/batch")
+    assert resp.json == {"error": "'ids' was missing from field(s)"}
+    assert resp.status_code == 400
+
+    resp = client.get("/tutor/batch", query_string={"ids": "not json"})
+    assert resp.json == {"error": "ids field must be valid JSON"}
+    assert resp.status_code == 400
+
+    resp = client.get("/tutor/batch", query_string={"ids": json.dumps([1, 2])})
+    assert resp.json == {"error": "ids field must be a list of strings"}
+    assert resp.status_code == 400
+
+    ids = [str(i) for i in range(101)]
+    resp = client.get("/tutor/batch", query_string={"ids": json.dumps(ids)})
+    assert resp.json == {"error": "at most 100 ids can be requested"}
+    assert resp.status_code == 400
+
+    # every tutor is fetched in one query, missing ones are skipped
+    find_many_users_mock.return_value = [tutor]
+    ids = ["missing", tutor.id, tutor.id]
+    resp = client.get("/tutor/batch", query_string={"ids": json.dumps(ids)})
+    find_many_users_mock.assert_called_once()
+    _, kwargs = find_many_users_mock.call_args
+    assert kwargs["where"]["id"] == {"in": ["missing", tutor.id]}
+
+    assert resp.status_code == 200
+    assert len(resp.json["tutors"]) == 1
+    # same shape as a single profile
+    assert resp.json["tutors"][0] == {
+        "id": tutor.id,
+        "name": "Terry",
+        "bio": "band 1 at HSC Maths",
+        "email": "validemail2@mail.com",
+        "rating": 2,
+        "profilePicture": None,
+        "location": "Australia",
+        "phoneNumber": "0411123901",
+        "courseOfferings": ["science"],
+        "timesAvailable": [],
+        "documentIds": [],
+    }
+
+
 # Modify Tutor Profile Tests
 
 
@@ -350,6 +493,7 @@ def test_modify_different_values(
     update_user_mock = mocker.patch("tests.conftest.UserActions.update")
     update_tutor_mock = mocker.patch("tests.conftest.TutorActions.update")
     create_subject_mock = mocker.patch("tests.conftest.SubjectActions.create_many")
+    update_many_user_mock = mocker.patch("tests.conftest.UserActions.update_many")
     resp = client.put(
         "/tutor/profile",
         json={
@@ -367,6 +511,10 @@ def test_modify_different_values(
     update_user_mock.assert_called()
     create_subject_mock.assert_called()
     assert resp.status_code == 200
+    # cached profiles are no longer valid
+    update_many_user_mock.assert_called_once_with(
+        where={"id": tutor.id}, data={"version": {"increment": 1}}
+    )
 
     mocker.stop(custom_find_unique)
     find_unique_mock = mocker.patch("tests.conftest.UserActions.find_unique")
@@ -0,0 +1,65 @@
+from flask.testing import FlaskClient
+from prisma.models import User
+from pytest_mock import MockerFixture
+from pytest_mock.plugin import MockType
+
+
+def test_usertype(
+    setup_test: FlaskClient,
+    mocker: MockerFixture,
+    find_unique_users_mock: MockType,
+    fake_tutor: User,
+    fake_login,
+):
+    client = setup_test
+    client.application.extensions["account_type_cache"].clear()
+
+    resp = client.get(f"/utils/usertype/{fake_tutor.id}")
+    assert resp.status_code == 200
+    assert resp.json == {"accountType": "tutor"}
+    find_unique_users_mock.assert_called_once_with(
+        where={"id": fake_tutor.id}, include=mocker.ANY
+    )
+
+    # account types are cached
+    resp = client.get(f"/utils/usertype/{fake_tutor.id}")
+    assert resp.json == {"accountType": "tutor"}
+    find_unique_users_mock.assert_called_once()
+
+    resp = client.get("/utils/usertype/missing")
+    assert resp.status_code == 404
+
+    # until the user is deleted
+    fake_login("fake_tutor")
+    fake_tutor.tutorInfo.courseOfferings = []
+    mocker.patch("tests.conftest.TutorActions.update")
+    mocker.patch("tests.conftest.UserActions.delete")
+    resp = client.delete("/tutor/", json={})
+    assert resp.status_code == 200
+
+    find_unique_users_mock.reset_mock()
+    client.get(f"/utils/usertype/{fake_tutor.id}")
+    find_unique_users_mock.assert_called_once_with(
+        where={"id": fake_tutor.id}, include=mocker.ANY
+    )
+
+
+def test_getuserid(
+    setup_test: FlaskClient,
+    find_unique_users_mock: MockType,
+    fake_student: User,
+    fake_login,
+):
+    client = setup_test
+
+    resp = client.get("/utils/getuserid")
+    assert resp.status_code == 404
+
+    fake_login("fake_student")
+    find_unique_users_mock.reset_mock()
+
+    # the account type is kept in the session on login
+    resp = client.get("/utils/getuserid")
+    assert resp.status_code == 200
+    assert resp.json == {"id": fake_student.id, "accountType": "student"}
+    find_unique_users_mock.assert_not_called()
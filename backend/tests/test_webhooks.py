@@ -0,0 +1,161 @@
+import hmac
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from hashlib import sha256
+from time import time
+from flask.testing import FlaskClient
+from prisma.models import ChannelOccupancy
+from pytest_mock import MockerFixture
+from helpers.occupancy import is_occupied
+
+
+def signed_webhook(client: FlaskClient, payload: dict, secret: str | None = None):
+    body = json.dumps(payload)
+    signature = hmac.new(
+        (secret or os.environ["PUSHER_SECRET"]).encode(), body.encode(), sha256
+    ).hexdigest()
+    return client.post(
+        "/webhooks/pusher",
+        data=body,
+        content_type="application/json",
+        headers={
+            "X-Pusher-Key": os.environ["PUSHER_KEY"],
+            "X-Pusher-Signature": signature,
+        },
+    )
+
+
+def test_pusher_webhook_invalid(setup_test: FlaskClient, mocker: MockerFixture):
+    client = setup_test
+    update_many_mock = mocker.patch(
+        "tests.conftest.ChannelOccupancyActions.update_many"
+    )
+    payload = {
+        "time_ms": int(time() * 1000),
+        "events": [{"name": "channel_occupied", "channel": "channel"}],
+    }
+
+    # not signed
+    resp = client.post("/webhooks/pusher", json=payload)
+    assert resp.json["error"] == "Webhook is invalid"
+    assert resp.status_code == 401
+
+    # signed with the wrong secret
+    resp = signed_webhook(client, payload, secret="not the secret")
+    assert resp.json["error"] == "Webhook is invalid"
+    assert resp.status_code == 401
+
+    # too old, i.e. replayed
+    payload["time_ms"] -= 10 * 60 * 1000
+    resp = signed_webhook(client, payload)
+    assert resp.json["error"] == "Webhook is invalid"
+    assert resp.status_code == 401
+
+    update_many_mock.assert_not_called()
+
+
+def test_pusher_webhook(setup_test: FlaskClient, mocker: MockerFixture):
+    client = setup_test
+    update_many_mock = mocker.patch(
+        "tests.conftest.ChannelOccupancyActions.update_many"
+    )
+    create_mock = mocker.patch("tests.conftest.ChannelOccupancyActions.create")
+    time_ms = int(time() * 1000)
+    at = datetime.fromtimestamp(time_ms / 1000, timezone.utc)
+
+    # recorded payload of a channel being occupied for the first time
+    update_many_mock.return_value = 0
+    resp = signed_webhook(
+        client,
+        {
+            "time_ms": time_ms,
+            "events": [{"name": "channel_occupied", "channel": "channel1"}],
+        },
+    )
+    assert resp.status_code == 200
+    update_many_mock.assert_called_once_with(
+        where={"channel": "channel1", "updatedAt": {"lt": at}},
+        data={"occupied": True, "updatedAt": at},
+    )
+    create_mock.assert_called_once_with(
+        data={"channel": "channel1", "occupied": True, "updatedAt": at}
+    )
+    update_many_mock.reset_mock()
+    create_mock.reset_mock()
+
+    # recorded payload of a channel being vacated, other events are ignored
+    update_many_mock.return_value = 1
+    resp = signed_webhook(
+        client,
+        {
+            "time_ms": time_ms,
+            "events": [
+                {"name": "member_added", "channel": "presence-x", "user_id": "1"},
+                {"name": "channel_vacated", "channel": "channel1"},
+            ],
+        },
+    )
+    assert resp.status_code == 200
+    update_many_mock.assert_called_once_with(
+        where={"channel": "channel1", "updatedAt": {"lt": at}},
+        data={"occupied": False, "updatedAt": at},
+    )
+    create_mock.assert_not_called()
+
+    # this worker knows without looking it up
+    find_unique_mock = mocker.patch(
+        "tests.conftest.ChannelOccupancyActions.find_unique"
+    )
+    with client.application.app_context():
+        assert not is_occupied("channel1")
+    find_unique_mock.assert_not_called()
+
+
+def test_is_occupied(setup_test: FlaskClient, mocker: MockerFixture):
+    find_unique_mock = mocker.patch(
+        "tests.conftest.ChannelOccupancyActions.find_unique"
+    )
+    update_many_mock = mocker.patch(
+        "tests.conftest.ChannelOccupancyActions.update_many"
+    )
+    channel_info_mock = mocker.patch("tests.conftest.Pusher.channel_info")
+
+    with setup_test.application.app_context():
+        # recorded by a webhook, then cached
+        find_unique_mock.return_value = ChannelOccupancy(
+            channel="channel2", occupied=True, updatedAt=datetime.now(timezone.utc)
+        )
+        assert is_occupied("channel2")
+        assert is_occupied("channel2")
+        find_unique_mock.assert_called_once()
+        channel_info_mock.assert_not_called()
+
+        # never recorded, so pusher is asked
+        find_unique_mock.return_value = None
+        channel_info_mock.return_value = {"occupied": False}
+        update_many_mock.return_value = 1
+        assert not is_occupied("channel3")
+        channel_info_mock.assert_called_once_with("channel3")
+        update_many_mock.assert_called_once()
+        channel_info_mock.reset_mock()
+
+        # recorded too long ago for a missed webhook to be ruled out
+        find_unique_mock.return_value = ChannelOccupancy(
+            channel="channel4",
+            occupied=True,
+            updatedAt=datetime.now(timezone.utc) - timedelta(days=1),
+        )
+        channel_info_mock.return_value = {"occupied": False}
+        assert not is_occupied("channel4")
+        channel_info_mock.assert_called_once_with("channel4")
+        channel_info_mock.reset_mock()
+
+        # unoccupied if pusher can't be asked, until it can be
+        channel_info_mock.side_effect = Exception("pusher is down")
+        update_many_mock.reset_mock()
+        assert not is_occupied("channel5")
+        update_many_mock.assert_not_called()
+        channel_info_mock.side_effect = None
+        channel_info_mock.return_value = {"occupied": True}
+        assert is_occupied("channel5")
@@ -1,4 +1,6 @@
 import { Message } from "@/service/messageService"
+import { Page } from "@/service/types"
+import { InfiniteData } from "react-query"
 import { Card } from "./ui/card"
 import { Input } from "./ui/input"
 import { useState } from "react"
@@ -12,16 +14,37 @@ interface MessagesProps {
   messages: (Message | OptimisticMessage)[]
   sendMessage: (content: string) => void
   header: React.ReactNode
+  // shown when there are older messages than those loaded
+  loadEarlier?: () => void
 }
 export interface OptimisticMessage
   extends Omit<Message, "sentTime" | "sentBy"> {
   isOptimistic: true
 }
+
+// adds a message being sent to the (newest) first page of loaded messages
+export function addOptimisticMessage(
+  old: InfiniteData<Page<Message | OptimisticMessage>> | undefined,
+  message: OptimisticMessage,
+): InfiniteData<Page<Message | OptimisticMessage>> {
+  const [first, ...rest] = old?.pages || []
+  return {
+    pages: [
+      {
+        items: [message, ...(first?.items || [])],
+        nextCursor: first?.nextCursor ?? null,
+      },
+      ...rest,
+    ],
+    pageParams: old?.pageParams || [undefined],
+  }
+}
 export default function Messages({
   className,
   messages,
   sendMessage,
   header,
+  loadEarlier,
 }: MessagesProps) {
   const [input, setInput] = useState("")
   const { user } = useUser()
@@ -43,6 +66,17 @@ export default function Messages({
             {m.content}
           </div>
         ))}
+        {/* last, as the list is reversed, so it's above the oldest message */}
+        {loadEarlier && (
+          <Button
+            className="mb-2 w-fit self-center"
+            variant="secondary"
+            size="sm"
+            onClick={loadEarlier}
+          >
+            Load earlier messages
+          </Button>
+        )}
       </div>
       <div className="relative flex grow items-end ">
         <Input
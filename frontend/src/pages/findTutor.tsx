@@ -14,7 +14,7 @@ import { HTTPProfileService } from "@/service/profileService"
 import { addMinutes, format } from "date-fns"
 import { Loader2, MapPin, Star, User } from "lucide-react"
 import { useMemo, useState } from "react"
-import { useQuery } from "react-query"
+import { useInfiniteQuery } from "react-query"
 import { useDebounce } from "usehooks-ts"
 
 const profileService = new HTTPProfileService()
@@ -52,11 +52,22 @@ export default function FindTutor() {
 
   const debouncedSearchParams = useDebounce(searchParams, 250)
 
-  const { data: searchResp, isLoading } = useQuery({
+  // a page of tutors at a time, more are loaded on request
+  const {
+    data: searchResp,
+    isLoading,
+    hasNextPage,
+    fetchNextPage,
+    isFetchingNextPage,
+  } = useInfiniteQuery({
     queryKey: ["tutors", debouncedSearchParams],
-    queryFn: async () => {
-      return await profileService.searchTutors(debouncedSearchParams)
+    queryFn: async ({ pageParam }) => {
+      return await profileService.searchTutors(
+        debouncedSearchParams,
+        pageParam,
+      )
     },
+    getNextPageParam: (lastPage) => lastPage.nextCursor ?? undefined,
   })
 
   const submitFilter = (e: React.SyntheticEvent) => {
@@ -203,9 +214,25 @@ export default function FindTutor() {
         {isLoading ? (
           <Loader2 className="animate-spin" />
         ) : (
-          searchResp?.tutorIds.map((tId) => (
-            <SmallProfileCard key={tId} id={tId} accountType="tutor" />
-          ))
+          searchResp?.pages
+            .flatMap((page) => page.tutorIds)
+            .map((tId) => (
+              <SmallProfileCard key={tId} id={tId} accountType="tutor" />
+            ))
+        )}
+        {hasNextPage && (
+          <Button
+            className="w-full"
+            variant="secondary"
+            disabled={isFetchingNextPage}
+            onClick={() => fetchNextPage()}
+          >
+            {isFetchingNextPage ? (
+              <Loader2 className="animate-spin" />
+            ) : (
+              "Load more tutors"
+            )}
+          </Button>
         )}
       </div>
     </div>
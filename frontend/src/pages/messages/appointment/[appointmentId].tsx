@@ -1,4 +1,7 @@
-import Messages, { OptimisticMessage } from "@/components/messages"
+import Messages, {
+  OptimisticMessage,
+  addOptimisticMessage,
+} from "@/components/messages"
 import SmartAvatar from "@/components/smartAvatar"
 import { Button } from "@/components/ui/button"
 import useAppointmentQuery from "@/hooks/useAppointmentQuery"
@@ -6,13 +9,20 @@ import useUser from "@/hooks/useUser"
 import useUserType from "@/hooks/useUserType"
 import { HTTPAppointmentService } from "@/service/appointmentService"
 import { HTTPMessageService, Message } from "@/service/messageService"
+import { Page } from "@/service/types"
 import { HTTPProfileService } from "@/service/profileService"
 import { format } from "date-fns"
 import { nanoid } from "nanoid"
 import Link from "next/link"
 import { useRouter } from "next/router"
 import { useEffect, useState } from "react"
-import { useMutation, useQuery, useQueryClient } from "react-query"
+import {
+  InfiniteData,
+  useInfiniteQuery,
+  useMutation,
+  useQuery,
+  useQueryClient,
+} from "react-query"
 import Pusher from "pusher-js"
 
 const messageService = new HTTPMessageService()
@@ -54,10 +64,12 @@ export default function AppointmentMessage() {
     enabled: !!otherUserType && !!otherUserId,
   })
 
-  const { data: initialMessages } = useQuery({
+  // newest first, older pages are loaded on request
+  const { data: messagePages, hasNextPage, fetchNextPage } = useInfiniteQuery({
     queryKey: ["messages", "appointment", appointmentId],
-    queryFn: async () =>
-      await messageService.getAppointmentMessages(appointmentId),
+    queryFn: async ({ pageParam }) =>
+      await messageService.getAppointmentMessages(appointmentId, pageParam),
+    getNextPageParam: (lastPage) => lastPage.nextCursor ?? undefined,
   })
   const { mutate: sendMessage } = useMutation({
     mutationFn: async (messageContent: string) =>
@@ -79,9 +91,9 @@ export default function AppointmentMessage() {
         content: messageContent,
         id: "tmp-" + nanoid(),
       }
-      queryClient.setQueryData<(Message | OptimisticMessage)[]>(
+      queryClient.setQueryData<InfiniteData<Page<Message | OptimisticMessage>>>(
         ["messages", "appointment", appointmentId],
-        (old) => [optimisticMessage, ...(old || [])],
+        (old) => addOptimisticMessage(old, optimisticMessage),
       )
       return { prevMessages }
     },
@@ -92,8 +104,9 @@ export default function AppointmentMessage() {
 
   const [messages, setMessages] = useState<(Message | OptimisticMessage)[]>([])
   useEffect(() => {
-    initialMessages && setMessages(initialMessages.toReversed())
-  }, [initialMessages])
+    messagePages &&
+      setMessages(messagePages.pages.flatMap((page) => page.items).toReversed())
+  }, [messagePages])
   return (
     <div className="flex h-full w-full flex-col gap-4 p-8">
       <Button
@@ -131,6 +144,7 @@ export default function AppointmentMessage() {
         className="mx-auto h-full w-full max-w-2xl"
         messages={messages}
         sendMessage={sendMessage}
+        loadEarlier={hasNextPage ? () => fetchNextPage() : undefined}
       />
     </div>
   )
@@ -1,15 +1,25 @@
-import Messages, { OptimisticMessage } from "@/components/messages"
+import Messages, {
+  OptimisticMessage,
+  addOptimisticMessage,
+} from "@/components/messages"
 import SmartAvatar from "@/components/smartAvatar"
 import { Button } from "@/components/ui/button"
 import useUser from "@/hooks/useUser"
 import useUserType from "@/hooks/useUserType"
 import { HTTPMessageService, Message } from "@/service/messageService"
+import { Page } from "@/service/types"
 import { HTTPProfileService } from "@/service/profileService"
 import { nanoid } from "nanoid"
 import Link from "next/link"
 import { useRouter } from "next/router"
 import { useEffect, useState } from "react"
-import { useMutation, useQuery, useQueryClient } from "react-query"
+import {
+  InfiniteData,
+  useInfiniteQuery,
+  useMutation,
+  useQuery,
+  useQueryClient,
+} from "react-query"
 import Pusher from "pusher-js"
 
 const messageService = new HTTPMessageService()
@@ -46,9 +56,12 @@ export default function DirectMessage() {
     enabled: !!otherUserType,
   })
 
-  const { data: initialMessages } = useQuery({
+  // newest first, older pages are loaded on request
+  const { data: messagePages, hasNextPage, fetchNextPage } = useInfiniteQuery({
     queryKey: ["messages", "direct", user?.userId],
-    queryFn: async () => await messageService.getDirectMessages(otherUserId),
+    queryFn: async ({ pageParam }) =>
+      await messageService.getDirectMessages(otherUserId, pageParam),
+    getNextPageParam: (lastPage) => lastPage.nextCursor ?? undefined,
   })
   const { mutate: sendMessage } = useMutation({
     mutationFn: async (messageContent: string) =>
@@ -67,9 +80,9 @@ export default function DirectMessage() {
         content: messageContent,
         id: "tmp-" + nanoid(),
       }
-      queryClient.setQueryData<(Message | OptimisticMessage)[]>(
+      queryClient.setQueryData<InfiniteData<Page<Message | OptimisticMessage>>>(
         ["messages", "direct", user?.userId],
-        (old) => [optimisticMessage, ...(old || [])],
+        (old) => addOptimisticMessage(old, optimisticMessage),
       )
       return { prevMessages }
     },
@@ -80,8 +93,9 @@ export default function DirectMessage() {
 
   const [messages, setMessages] = useState<(Message | OptimisticMessage)[]>([])
   useEffect(() => {
-    initialMessages && setMessages(initialMessages.toReversed())
-  }, [initialMessages])
+    messagePages &&
+      setMessages(messagePages.pages.flatMap((page) => page.items).toReversed())
+  }, [messagePages])
   return (
     <div className="flex h-full w-full flex-col gap-4 p-8">
       <Button
@@ -113,6 +127,7 @@ export default function DirectMessage() {
         className="mx-auto h-full w-full max-w-2xl"
         messages={messages}
         sendMessage={sendMessage}
+        loadEarlier={hasNextPage ? () => fetchNextPage() : undefined}
       />
     </div>
   )
@@ -1,11 +1,12 @@
 import MessageChannelPreview from "@/components/messageChannelPreview"
 import ToggleSwitch from "@/components/toggleSwitch"
+import { Button } from "@/components/ui/button"
 import { Card, CardContent, CardHeader } from "@/components/ui/card"
 import { HTTPMessageService } from "@/service/messageService"
 import { useSearchParams } from "next/navigation"
 import { useRouter } from "next/router"
 import { useEffect, useState } from "react"
-import { useQuery } from "react-query"
+import { useInfiniteQuery } from "react-query"
 
 const messageService = new HTTPMessageService()
 export default function Messages() {
@@ -14,20 +15,25 @@ export default function Messages() {
   const [viewingAppointmentMessages, setViewingAppointmentMessages] = useState(
     searchParams.get("viewing") === "appointment" || false,
   )
-  const { data: directMessageChannels } = useQuery({
+  // a page of channels at a time, more are loaded on request
+  const directMessageChannels = useInfiniteQuery({
     queryKey: ["directMessages"],
-    queryFn: async () => await messageService.getDirectChannelList(),
+    queryFn: async ({ pageParam }) =>
+      await messageService.getDirectChannelList(pageParam),
+    getNextPageParam: (lastPage) => lastPage.nextCursor ?? undefined,
     enabled: !viewingAppointmentMessages,
   })
-  const { data: appointmentChannels } = useQuery({
+  const appointmentChannels = useInfiniteQuery({
     queryKey: ["appointmentMessages"],
-    queryFn: async () => await messageService.getAppointmentList(),
+    queryFn: async ({ pageParam }) =>
+      await messageService.getAppointmentList(pageParam),
+    getNextPageParam: (lastPage) => lastPage.nextCursor ?? undefined,
     enabled: viewingAppointmentMessages,
   })
 
-  const channels = viewingAppointmentMessages
-    ? appointmentChannels
-    : directMessageChannels
+  const { data, hasNextPage, fetchNextPage, isFetchingNextPage } =
+    viewingAppointmentMessages ? appointmentChannels : directMessageChannels
+  const channels = data?.pages.flatMap((page) => page.items)
 
   useEffect(() => {
     setViewingAppointmentMessages(
@@ -65,6 +71,15 @@ export default function Messages() {
               key={channelId}
             />
           ))}
+          {hasNextPage && (
+            <Button
+              variant="secondary"
+              disabled={isFetchingNextPage}
+              onClick={() => fetchNextPage()}
+            >
+              Load more
+            </Button>
+          )}
         </CardContent>
       </Card>
     </div>
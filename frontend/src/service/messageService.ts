@@ -1,6 +1,7 @@
 import { nanoid } from "nanoid"
 import { HTTPProfileService } from "./profileService"
 import { HTTPService } from "./helpers"
+import { Page } from "./types"
 import wretch from "wretch"
 interface MessageRawResp {
   id: string
@@ -18,15 +19,23 @@ interface MessageSentResp {
   sentTime: Date
 }
 
+// lists come a page at a time, the next page starting after the cursor given
+// (for messages, the page of older messages)
 interface MessageService {
-  getDirectChannelList(): Promise<string[]>
-  getDirectMessages(otherUserId: string): Promise<Message[]>
-  getAppointmentList(): Promise<string[]>
+  getDirectChannelList(cursor?: string): Promise<Page<string>>
+  getDirectMessages(
+    otherUserId: string,
+    before?: string,
+  ): Promise<Page<Message>>
+  getAppointmentList(cursor?: string): Promise<Page<string>>
   sendDirectMessage(
     otherUserId: string,
     content: string,
   ): Promise<MessageSentResp>
-  getAppointmentMessages(appointmentId: string): Promise<Message[]>
+  getAppointmentMessages(
+    appointmentId: string,
+    before?: string,
+  ): Promise<Page<Message>>
   sendAppointmentMessage(
     appointmentId: string,
     content: string,
@@ -34,32 +43,45 @@ interface MessageService {
 }
 
 export class HTTPMessageService extends HTTPService implements MessageService {
-  async getDirectMessages(otherUserId: string): Promise<Message[]> {
-    const resp = (await wretch(
-      `${this.backendURL}/directmessage/${otherUserId}`,
-    )
+  async getDirectMessages(
+    otherUserId: string,
+    before?: string,
+  ): Promise<Page<Message>> {
+    const url = new URL(`${this.backendURL}/directmessage/${otherUserId}`)
+    if (before) {
+      url.searchParams.set("before", before)
+    }
+    const resp = (await wretch(url.toString())
       .options({
         credentials: "include",
         mode: "cors",
       })
       .get()
-      .json()) as { messages: MessageRawResp[] }
+      .json()) as { messages: MessageRawResp[]; nextCursor: string | null }
 
-    return resp.messages.map((m) => ({
-      ...m,
-      sentTime: new Date(m.sentTime),
-    }))
+    return {
+      items: resp.messages.map((m) => ({
+        ...m,
+        sentTime: new Date(m.sentTime),
+      })),
+      nextCursor: resp.nextCursor,
+    }
   }
 
-  async getDirectChannelList(): Promise<string[]> {
-    const resp = wretch(`${this.backendURL}/directmessage/all`)
+  async getDirectChannelList(cursor?: string): Promise<Page<string>> {
+    const url = new URL(`${this.backendURL}/directmessage/all`)
+    if (cursor) {
+      url.searchParams.set("cursor", cursor)
+    }
+    const resp = wretch(url.toString())
       .options({
         credentials: "include",
         mode: "cors",
       })
       .get()
-    const respData: { otherIds: string[] } = await resp.json()
-    return respData.otherIds
+    const respData: { otherIds: string[]; nextCursor: string | null } =
+      await resp.json()
+    return { items: respData.otherIds, nextCursor: respData.nextCursor }
   }
 
   async sendDirectMessage(
@@ -80,34 +102,46 @@ export class HTTPMessageService extends HTTPService implements MessageService {
     return { ...resp, sentTime: new Date(resp.sentTime) }
   }
 
-  async getAppointmentList(): Promise<string[]> {
-    const resp = (await wretch(
-      `${this.backendURL}/appointments/?sortBy=messageSent`,
-    )
+  async getAppointmentList(cursor?: string): Promise<Page<string>> {
+    const url = new URL(`${this.backendURL}/appointments/?sortBy=messageSent`)
+    if (cursor) {
+      url.searchParams.set("cursor", cursor)
+    }
+    const resp = (await wretch(url.toString())
       .options({
         credentials: "include",
         mode: "cors",
       })
       .get()
-      .json()) as { appointments: string[] }
-    return resp.appointments
+      .json()) as { appointments: string[]; nextCursor: string | null }
+    return { items: resp.appointments, nextCursor: resp.nextCursor }
   }
 
-  async getAppointmentMessages(appointmentId: string): Promise<Message[]> {
-    const resp = (await wretch(
+  async getAppointmentMessages(
+    appointmentId: string,
+    before?: string,
+  ): Promise<Page<Message>> {
+    const url = new URL(
       `${this.backendURL}/appointment/${appointmentId}/messages`,
     )
+    if (before) {
+      url.searchParams.set("before", before)
+    }
+    const resp = (await wretch(url.toString())
       .options({
         credentials: "include",
         mode: "cors",
       })
       .get()
-      .json()) as { messages: MessageRawResp[] }
+      .json()) as { messages: MessageRawResp[]; nextCursor: string | null }
 
-    return resp.messages.map((m) => ({
-      ...m,
-      sentTime: new Date(m.sentTime),
-    }))
+    return {
+      items: resp.messages.map((m) => ({
+        ...m,
+        sentTime: new Date(m.sentTime),
+      })),
+      nextCursor: resp.nextCursor,
+    }
   }
 
   async sendAppointmentMessage(
@@ -155,16 +189,19 @@ export class MockMessageService implements MessageService {
       },
     ]
   }
-  async getDirectChannelList() {
+  async getDirectChannelList(cursor?: string) {
     const profileService = new HTTPProfileService()
-    const users = await profileService.searchTutors({})
-    return users.tutorIds
+    const users = await profileService.searchTutors({}, cursor)
+    return { items: users.tutorIds, nextCursor: users.nextCursor }
   }
   async getDirectMessages(otherUserId: string) {
-    return this.messages.map((m) => ({
-      ...m,
-      sentBy: m.sentBy === this.userId ? this.userId : otherUserId,
-    }))
+    return {
+      items: this.messages.map((m) => ({
+        ...m,
+        sentBy: m.sentBy === this.userId ? this.userId : otherUserId,
+      })),
+      nextCursor: null,
+    }
   }
   async sendDirectMessage(
     _otherUserId: string,
@@ -182,7 +219,7 @@ export class MockMessageService implements MessageService {
       sentTime: newMessage.sentTime,
     }
   }
-  async getAppointmentList(): Promise<string[]> {
+  async getAppointmentList(): Promise<Page<string>> {
     throw new Error("not implemented")
   }
 
@@ -192,7 +229,7 @@ export class MockMessageService implements MessageService {
   ): Promise<MessageSentResp> {
     throw new Error("not implemented")
   }
-  async getAppointmentMessages(appointmentId: string): Promise<Message[]> {
+  async getAppointmentMessages(appointmentId: string): Promise<Page<Message>> {
     throw new Error("not implemented")
   }
 }
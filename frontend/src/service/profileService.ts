@@ -55,7 +55,8 @@ export interface ProfileService {
   ) => Promise<SuccessResponse>
   searchTutors: (
     searchParams: TutorSearchParams,
-  ) => Promise<{ tutorIds: string[] }>
+    cursor?: string,
+  ) => Promise<{ tutorIds: string[]; nextCursor: string | null }>
   searchAll: (searchParams: AdminSearchParams) => Promise<{
     userInfos: { id: string; accountType: "tutor" | "student" | "admin" }[]
   }>
@@ -71,7 +72,8 @@ export interface ProfileService {
 export class HTTPProfileService extends HTTPService implements ProfileService {
   async searchTutors(
     searchParams: TutorSearchParams,
-  ): Promise<{ tutorIds: string[] }> {
+    cursor?: string,
+  ): Promise<{ tutorIds: string[]; nextCursor: string | null }> {
     const url = new URL(`${this.backendURL}/searchtutor`)
     const basicParams = { ...searchParams }
     delete basicParams.courseOfferings
@@ -86,6 +88,10 @@ export class HTTPProfileService extends HTTPService implements ProfileService {
         JSON.stringify(searchParams.courseOfferings),
       )
     }
+    // results come a page at a time, the next one starting after cursor
+    if (cursor) {
+      params.set("cursor", cursor)
+    }
     url.search = params.toString()
     const data = wretch(url.toString()).get()
     return await data.json()
@@ -2,3 +2,9 @@
 export interface SuccessResponse {
   success: boolean
 }
+
+// a page of a paginated list, nextCursor is null on the last page
+export interface Page<T> {
+  items: T[]
+  nextCursor: string | null
+}